@@ -1,26 +1,48 @@
 """The Xiaomi BLE integration."""
 
 from collections.abc import Callable, Coroutine
+from datetime import datetime, timedelta
+from functools import partial
 from logging import Logger
+import time
 from typing import Any
 
-from .QingBluetoothDeviceData import QingBluetoothDeviceData
+from sensor_state_data import SensorUpdate
+
+from .QingBluetoothDeviceData import NO_CHANGE_UPDATE, QingBluetoothDeviceData
 
 from homeassistant.components.bluetooth import (
+    BluetoothChange,
     BluetoothScanningMode,
     BluetoothServiceInfoBleak,
+    async_get_learned_advertising_interval,
+    async_set_fallback_availability_interval,
+    async_track_unavailable,
 )
 from homeassistant.components.bluetooth.active_update_processor import (
     ActiveBluetoothProcessorCoordinator,
 )
 from homeassistant.components.bluetooth.passive_update_processor import (
     PassiveBluetoothDataProcessor,
+    PassiveBluetoothDataUpdate,
+    PassiveBluetoothEntityKey,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.helpers.debounce import Debouncer
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
 
+from .aggregation import WindowAggregator
+from .batching import WriteBatcher
 from .const import CONF_SLEEPY_DEVICE
+from .dispatcher import AdvertisementDispatcher
+from .events import EventGate
+from .recorder import AdvertisementRecorder
+from .storage import DeviceStore
+from .throttle import WriteThrottle
+
+# Relative change of the learned timeout before Home Assistant is told.
+FALLBACK_INTERVAL_CHANGE = 0.25
 
 
 class QingActiveBluetoothProcessorCoordinator(ActiveBluetoothProcessorCoordinator):
@@ -45,6 +67,10 @@ class QingActiveBluetoothProcessorCoordinator(ActiveBluetoothProcessorCoordinato
         poll_debouncer: Debouncer[Coroutine[Any, Any, None]] | None = None,
         entry: ConfigEntry,
         connectable: bool = True,
+        dispatcher: AdvertisementDispatcher | None = None,
+        recorder: AdvertisementRecorder | None = None,
+        aggregator: WindowAggregator | None = None,
+        store: DeviceStore | None = None,
     ) -> None:
         """Initialize the Xiaomi Bluetooth Active Update Processor Coordinator."""
         super().__init__(
@@ -59,8 +85,147 @@ class QingActiveBluetoothProcessorCoordinator(ActiveBluetoothProcessorCoordinato
             connectable=connectable,
         )
         self.discovered_event_classes = discovered_event_classes
+        self.event_gate = EventGate()
         self.device_data = device_data
         self.entry = entry
+        self.dispatcher = dispatcher
+        self.recorder = recorder
+        self.aggregator = aggregator
+        self.store = store
+        self._fallback_interval: float | None = None
+        self._unavailable_check: CALLBACK_TYPE | None = None
+
+    @callback
+    def _async_start(self) -> None:
+        """Start the callbacks, through the shared dispatcher if there is one."""
+        self._on_stop.append(self._async_cancel_unavailable_check)
+        if self.aggregator is not None:
+            self._on_stop.append(
+                async_track_time_interval(
+                    self.hass,
+                    self._async_flush_aggregator,
+                    timedelta(seconds=self.aggregator.window),
+                    name=f"{self.name} aggregation",
+                )
+            )
+        if self.dispatcher is None:
+            super()._async_start()
+            return
+        self._on_stop.append(
+            self.dispatcher.async_register(
+                self.address, self._async_handle_bluetooth_event
+            )
+        )
+        self._on_stop.append(
+            async_track_unavailable(
+                self.hass,
+                self._async_handle_unavailable,
+                self.address,
+                self.connectable,
+            )
+        )
+
+    @callback
+    def _async_flush_aggregator(self, now: datetime) -> None:
+        """Push the values aggregated over the last window."""
+        assert self.aggregator is not None
+        if (update := self.aggregator.flush()) is not None:
+            self.async_push_update(update)
+
+    @callback
+    def async_push_update(self, update: SensorUpdate) -> None:
+        """Push an update that did not come from an advertisement."""
+        for processor in self._processors:
+            processor.async_handle_update(update, self.available)
+
+    @callback
+    def _async_handle_bluetooth_event(
+        self,
+        service_info: BluetoothServiceInfoBleak,
+        change: BluetoothChange,
+    ) -> None:
+        """Handle a bluetooth event, recording it first if enabled."""
+        if self.recorder is not None:
+            self.recorder.record(service_info, time.time())
+        if self.store is not None:
+            self.store.async_schedule_save()
+        self._async_track_interval(service_info.time)
+        super()._async_handle_bluetooth_event(service_info, change)
+
+    @callback
+    def _async_track_interval(self, now: float) -> None:
+        """Learn the advertisement interval and act on it once it is known.
+
+        The learned timeout becomes the fallback Home Assistant uses until
+        its own tracker has an interval. Whether the device is sleepy is
+        saved with the entry, and revised when the interval moves clearly
+        to the other side of the threshold.
+        """
+        interval = self.device_data.state.interval
+        interval.record(now)
+        interval.advertising = async_get_learned_advertising_interval(
+            self.hass, self.address
+        )
+        if (timeout := interval.timeout) is None:
+            return
+        fallback = self._fallback_interval
+        if fallback is None or abs(timeout - fallback) > (
+            fallback * FALLBACK_INTERVAL_CHANGE
+        ):
+            self._fallback_interval = timeout
+            async_set_fallback_availability_interval(self.hass, self.address, timeout)
+        stored = self.entry.data.get(CONF_SLEEPY_DEVICE)
+        if (sleepy := interval.classify(stored)) is not None and sleepy != stored:
+            # The entry only reloads for options changes.
+            self.hass.config_entries.async_update_entry(
+                self.entry, data=self.entry.data | {CONF_SLEEPY_DEVICE: sleepy}
+            )
+
+    @callback
+    def _async_handle_unavailable(
+        self, service_info: BluetoothServiceInfoBleak
+    ) -> None:
+        """Handle the device going unavailable.
+
+        Home Assistant learns the interval of a device from its first
+        advertisements, which for a sleepy device are often a burst. Such
+        a device stays available until its own learned timeout is over.
+        """
+        interval = self.device_data.state.interval
+        if (
+            self.sleepy_device
+            and (timeout := interval.timeout) is not None
+            and interval.last_seen is not None
+            and (remaining := interval.last_seen + timeout - time.monotonic()) > 0
+        ):
+            self._async_cancel_unavailable_check()
+            self._unavailable_check = async_call_later(
+                self.hass,
+                remaining,
+                partial(self._async_check_unavailable, service_info),
+            )
+            return
+        super()._async_handle_unavailable(service_info)
+
+    @callback
+    def _async_check_unavailable(
+        self, service_info: BluetoothServiceInfoBleak, now: datetime
+    ) -> None:
+        """Mark the device unavailable if it stayed silent since."""
+        self._unavailable_check = None
+        last_seen = self.device_data.state.interval.last_seen
+        if last_seen is None or last_seen <= service_info.time:
+            super()._async_handle_unavailable(service_info)
+
+    @callback
+    def _async_cancel_unavailable_check(self) -> None:
+        if self._unavailable_check is not None:
+            self._unavailable_check()
+            self._unavailable_check = None
+
+    async def async_disconnect(self) -> None:
+        """Close any connection kept open to the device."""
+        await self.device_data.async_disconnect()
 
     @property
     def sleepy_device(self) -> bool:
@@ -72,3 +237,118 @@ class QingPassiveBluetoothDataProcessor(PassiveBluetoothDataProcessor):
     """Define a Xiaomi Bluetooth Passive Update Data Processor."""
 
     coordinator: QingActiveBluetoothProcessorCoordinator
+
+    def __init__(
+        self,
+        update_method: Callable[[SensorUpdate], PassiveBluetoothDataUpdate],
+        restore_key: str | None = None,
+        throttle: WriteThrottle | None = None,
+        batcher: WriteBatcher | None = None,
+    ) -> None:
+        """Initialize the processor.
+
+        The throttle is the one the update method filters its values with,
+        the processor flushes the values it held back, on a timer when no
+        advertisement comes to do it. With a batcher the entity state writes
+        are left to its next pass.
+        """
+        super().__init__(update_method, restore_key)
+        self.throttle = throttle
+        self.batcher = batcher
+        self._flush_timer: CALLBACK_TYPE | None = None
+        # Monotonic time the flush timer fires at.
+        self._flush_due = float("inf")
+
+    @callback
+    def async_handle_update(
+        self, update: SensorUpdate, was_available: bool | None = None
+    ) -> None:
+        """Handle a Bluetooth event, skipping repeats of the last advertisement."""
+        if update is NO_CHANGE_UPDATE and was_available:
+            if (
+                throttle := self.throttle
+            ) is not None and throttle.next_due <= time.monotonic():
+                self._async_flush_throttle(throttle, was_available)
+            return
+        if (stats := self.coordinator.device_data.stats) is None:
+            super().async_handle_update(update, was_available)
+        else:
+            began = time.perf_counter_ns()
+            super().async_handle_update(update, was_available)
+            stats.process_ns.record(time.perf_counter_ns() - began)
+        if self.throttle is not None:
+            self._async_schedule_flush(self.throttle)
+
+    @callback
+    def _async_flush_throttle(
+        self, throttle: WriteThrottle, was_available: bool | None
+    ) -> None:
+        """Write the held back values that became due."""
+        if entity_data := throttle.flush(time.monotonic()):
+            new_data = PassiveBluetoothDataUpdate(entity_data=entity_data)
+            changed_entity_keys = self.data.update(new_data)
+            self.async_update_listeners(new_data, was_available, changed_entity_keys)
+        self._async_schedule_flush(throttle)
+
+    @callback
+    def _async_schedule_flush(self, throttle: WriteThrottle) -> None:
+        """Make sure a timer flushes the held back values once they are due."""
+        if (due := throttle.next_due) == float("inf") or due >= self._flush_due:
+            return
+        self.async_cancel_flush()
+        self._flush_due = due
+        self._flush_timer = async_call_later(
+            self.coordinator.hass,
+            max(due - time.monotonic(), 0.0),
+            partial(self._async_flush_due, throttle),
+        )
+
+    @callback
+    def _async_flush_due(self, throttle: WriteThrottle, now: datetime) -> None:
+        """Flush the held back values, the device having stayed silent."""
+        self._flush_timer = None
+        self._flush_due = float("inf")
+        if self.coordinator.available:
+            self._async_flush_throttle(throttle, True)
+
+    @callback
+    def async_cancel_flush(self) -> None:
+        """Cancel the flush timer, if any."""
+        if self._flush_timer is not None:
+            self._flush_timer()
+            self._flush_timer = None
+        self._flush_due = float("inf")
+
+    @callback
+    def async_update_listeners(
+        self,
+        data: PassiveBluetoothDataUpdate | None,
+        was_available: bool | None = None,
+        changed_entity_keys: set[PassiveBluetoothEntityKey] | None = None,
+    ) -> None:
+        """Update the listeners, through the batcher if there is one."""
+        if was_available is None:
+            was_available = self.coordinator.available
+        if (batcher := self.batcher) is None or data is None or not was_available:
+            # An availability change writes every entity right away.
+            if batcher is not None:
+                batcher.async_discard(self)
+            super().async_update_listeners(data, was_available, changed_entity_keys)
+            return
+        # Listeners without a key add the new entities, they are not batched.
+        for update_callback in self._listeners:
+            update_callback(data)
+        if changed_entity_keys is None:
+            entity_keys = set(data.entity_data)
+        else:
+            entity_keys = changed_entity_keys.intersection(data.entity_data)
+        if entity_keys:
+            batcher.async_add(self, entity_keys)
+
+    @callback
+    def async_write_entities(self, entity_keys: set[PassiveBluetoothEntityKey]) -> None:
+        """Write the state of the entities of a batch."""
+        listeners = self._entity_key_listeners
+        for entity_key in entity_keys:
+            for update_callback in listeners.get(entity_key, ()):
+                update_callback(self.data)
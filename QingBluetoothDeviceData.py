@@ -1,8 +1,12 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
 import logging
+from time import monotonic, perf_counter_ns, time
+from typing import TYPE_CHECKING
 
-from bleak import BleakClient
-from bleak.backends.device import BLEDevice
-from bleak_retry_connector import establish_connection
 from bluetooth_data_tools import short_address
 from bluetooth_sensor_state_data import BluetoothData
 from home_assistant_bluetooth import BluetoothServiceInfo
@@ -13,65 +17,385 @@ from sensor_state_data import (
     Units,
 )
 
+from .const import DEFAULT_POLL_INTERVAL
+from .debug import DEBUG_LOG
+from .gatt import GattHandleCache, KeepAlivePool, async_read_handles
+from .history import ReadingHistory
+from .parser import (
+    BATTERY,
+    DECODERS,
+    MIBEACON_FLAG_ENCRYPTED,
+    MIBEACON_FLAG_OBJECT,
+    UUID_MIBEACON,
+    decode_mibeacon_events,
+    mibeacon_payload_offset,
+)
+from .poll import PollScheduler
+from .state import DeviceState
+from .stats import DeviceStats
+
+if TYPE_CHECKING:
+    from bleak import BleakClient
+    from bleak.backends.device import BLEDevice
+    from bleak.backends.service import BleakGATTServiceCollection
+
+    from .decryption import MiBeaconDecryptor
+
 _LOGGER = logging.getLogger(__name__)
 
+# Indexed by the field constants in parser.py
+FIELD_SENSORS = (
+    SensorLibrary.TEMPERATURE__CELSIUS,
+    SensorLibrary.HUMIDITY__PERCENTAGE,
+    SensorLibrary.BATTERY__PERCENTAGE,
+    SensorLibrary.MASS__MASS_KILOGRAMS,
+    SensorLibrary.MASS_NON_STABILIZED__MASS_KILOGRAMS,
+    SensorLibrary.IMPEDANCE__OHM,
+    SensorLibrary.LIGHT__LIGHT_LUX,
+)
+
+# RSSI is bucketed into 8 dB steps so that radio noise alone does not
+# count as a new advertisement.
+RSSI_BUCKET_SHIFT = 3
+
+# Returned by update() when an advertisement repeats the previous one,
+# the processor drops it by identity.
+NO_CHANGE_UPDATE = SensorUpdate(title=None, devices={})
+
 
 class QingBluetoothDeviceData(BluetoothData):
-    def __init__(self, bindkey: bytes | None = None) -> None:
+    def __init__(
+        self,
+        bindkey: bytes | None = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        gatt_cache: GattHandleCache | None = None,
+        keep_alive: float = 0,
+        keep_alive_pool: KeepAlivePool | None = None,
+        stats: DeviceStats | None = None,
+        history: ReadingHistory | None = None,
+    ) -> None:
         super().__init__()
         self.device_id = "default_device_id"
+        self._identified_address: str | None = None
+        # The bindkey, decryptor and decoders live in the slotted state, the
+        # instance dict stays small enough to share its keys.
+        self.state = DeviceState(bindkey, history)
+        self.stats = stats
+        self.poll_scheduler = PollScheduler(poll_interval)
+        self.gatt_cache = GattHandleCache() if gatt_cache is None else gatt_cache
+        # Seconds an idle connection is kept open for reuse, 0 to disconnect
+        # after every poll.
+        self.keep_alive = keep_alive
+        self.keep_alive_pool = (
+            KeepAlivePool() if keep_alive_pool is None else keep_alive_pool
+        )
+        self._client: BleakClient | None = None
+        self._connection_lock = asyncio.Lock()
+        self._idle_timer: asyncio.TimerHandle | None = None
+        self._disconnect_task: asyncio.Task[None] | None = None
 
     def poll_needed(
         self, service_info: BluetoothServiceInfo, last_poll: float | None
     ) -> bool:
-        _LOGGER.warning("*** poll_needed %s", last_poll)
-        return not last_poll or last_poll > 30
+        """Return True if the device should be polled now."""
+        scheduler = self.poll_scheduler
+        if not scheduler.poll_needed():
+            return False
+        state = self.state
+        if (
+            state.last_poll_success is not None
+            and state.passive_battery is not None
+            and monotonic() - state.passive_battery < scheduler.interval
+        ):
+            # The advertisements already carry the battery level.
+            scheduler.poll_skipped()
+            return False
+        if DEBUG_LOG.allow(service_info.address):
+            _LOGGER.debug(
+                "%s: polling, last poll %s s ago, %s failures",
+                service_info.address,
+                last_poll,
+                scheduler.failures,
+            )
+        return True
+
+    @property
+    def decryptor(self) -> MiBeaconDecryptor | None:
+        """Return the decryptor of a device with a bindkey."""
+        return self.state.decryptor
+
+    @property
+    def sleepy_device(self) -> bool:
+        """Return True if the device was seen advertising rarely."""
+        return bool(self.state.interval.sleepy)
 
-    async def async_poll(self, ble_device: BLEDevice) -> SensorUpdate:
+    def poll_urgency(self) -> float:
+        """Return the seconds since the last successful poll."""
+        if self.state.last_poll_success is None:
+            return float("inf")
+        return monotonic() - self.state.last_poll_success
+
+    async def async_poll(
+        self, ble_device: BLEDevice, source: str | None = None
+    ) -> SensorUpdate:
         """
         Poll the device to retrieve any values we can't get from passive listening.
         """
-        _LOGGER.warning("*** async_poll")
-        client = await establish_connection(BleakClient, ble_device, ble_device.address)
+        address = ble_device.address
+        _LOGGER.debug("%s: polling", address)
+        handles = self.gatt_cache.get(address)
+        started = self.state.last_poll = monotonic()
         try:
-            # battery_char = client.services.get_characteristic("")
-            for service in client.services:
-                for characteristic in service.characteristics:
-                    _LOGGER.warning(
-                        "Service %s, Characteristic %s", service, characteristic
+            async with self.async_connection(
+                ble_device, handles.services if handles else None, source
+            ) as client:
+                if handles is None:
+                    handles = self.gatt_cache.discover(address, client.services)
+                battery, firmware = await async_read_handles(client, handles)
+                if handles.firmware is not None and firmware != handles.firmware:
+                    # New firmware, the handles we read may have moved.
+                    _LOGGER.debug(
+                        "%s: firmware changed from %s to %s",
+                        address,
+                        handles.firmware,
+                        firmware,
                     )
-            # payload = await client.read_gatt_char(battery_char)
-        finally:
-            _LOGGER.warning("*** async_poll, disconnect")
+                    self.gatt_cache.invalidate(address)
+                    handles = self.gatt_cache.discover(address, client.services)
+                    battery, firmware = await async_read_handles(client, handles)
+                handles.firmware = firmware
+        except Exception:
+            self.poll_scheduler.poll_failed()
+            if (stats := self.stats) is not None:
+                stats.polls += 1
+                stats.poll_failures += 1
+            raise
+        self.poll_scheduler.poll_succeeded()
+        self.state.last_poll_success = monotonic()
+        if (stats := self.stats) is not None:
+            stats.polls += 1
+            stats.poll_duration.record(self.state.last_poll_success - started)
+        if firmware is not None:
+            self.set_device_sw_version(firmware)
+        if battery is not None:
+            self.state.readings[BATTERY] = battery
+            self.update_predefined_sensor(SensorLibrary.BATTERY__PERCENTAGE, battery)
+        return self._finish_update()
+
+    @asynccontextmanager
+    async def async_connection(
+        self,
+        ble_device: BLEDevice,
+        cached_services: BleakGATTServiceCollection | None = None,
+        source: str | None = None,
+    ) -> AsyncIterator[BleakClient]:
+        """Yield a connected client, reusing the kept-alive one if possible.
+
+        The kept-alive client is only reused if it goes through the source
+        the poll holds a slot on. Without keep-alive, or when the pool has
+        no room, the client is disconnected when the block exits.
+        """
+        # The GATT stack is only needed once a device is polled.
+        from bleak import BleakClient
+        from bleak_retry_connector import establish_connection
+
+        async with self._connection_lock:
+            client = self._client
+            if client is not None and self.keep_alive_pool.source(self) != source:
+                # Kept alive through another adapter or proxy.
+                await self.async_disconnect()
+                client = None
+            if client is not None and client.is_connected:
+                _LOGGER.debug("%s: reusing connection", ble_device.address)
+                self._cancel_idle()
+            else:
+                client = self._client = await establish_connection(
+                    BleakClient,
+                    ble_device,
+                    ble_device.address,
+                    disconnected_callback=self._async_on_disconnected,
+                    cached_services=cached_services,
+                )
+            try:
+                yield client
+            except BaseException:
+                await self.async_disconnect()
+                raise
+            if self.keep_alive and self.keep_alive_pool.keep(self, source):
+                self._idle_timer = asyncio.get_running_loop().call_later(
+                    self.keep_alive, self.schedule_disconnect
+                )
+            else:
+                await self.async_disconnect()
+
+    def _cancel_idle(self) -> None:
+        self.keep_alive_pool.forget(self)
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _async_on_disconnected(self, client: BleakClient) -> None:
+        if client is self._client:
+            _LOGGER.debug("%s: disconnected", client.address)
+            self._client = None
+            self._cancel_idle()
+
+    def idle_source(self) -> str | None:
+        """Return the source of the connection kept open, if any."""
+        if self._client is None:
+            return None
+        return self.keep_alive_pool.source(self)
+
+    def schedule_disconnect(self) -> None:
+        """Close the idle connection in the background."""
+        self._cancel_idle()
+        client, self._client = self._client, None
+        if client is not None:
+            self._disconnect_task = asyncio.get_running_loop().create_task(
+                client.disconnect()
+            )
+
+    async def async_disconnect(self) -> None:
+        """Close the connection to the device, if any."""
+        self._cancel_idle()
+        client, self._client = self._client, None
+        if client is not None:
+            _LOGGER.debug("%s: disconnecting", client.address)
             await client.disconnect()
 
-        self.set_device_sw_version("abcd".decode("utf-8"))
-        # self.update_predefined_sensor(SensorLibrary.BATTERY__PERCENTAGE, payload[0])
-        self.update_predefined_sensor(SensorLibrary.BATTERY__PERCENTAGE, 77)
-        return self._finish_update()
+    def _finish_update(self) -> SensorUpdate:
+        """Finish the update, handing its dicts over to the caller.
 
-    def _start_update(self, service_info: BluetoothServiceInfo) -> None:
-        _LOGGER.warning(
-            "*** _start_update Parsing Qing BLE advertisement data: %s", service_info
+        The processor merges every update into the data it keeps, so unlike
+        the base class the values are not carried over to the next update
+        or merged into a second copy, the readings live in the device state.
+        Events are transient anyway.
+        """
+        update = SensorUpdate(
+            title=self._title,
+            devices=self._device_id_info,
+            entity_descriptions=self._sensor_descriptions_updates,
+            entity_values=self._sensor_values_updates,
+            binary_entity_descriptions=self._binary_sensor_descriptions_updates,
+            binary_entity_values=self._binary_sensor_values_updates,
+            events=self._events_updates,
         )
-        for uuid, data in service_info.service_data.items():
-            _LOGGER.warning("%s:%s", uuid, data)
-        identifier = short_address(service_info.address)
+        self._sensor_descriptions_updates = {}
+        self._sensor_values_updates = {}
+        self._events_updates = {}
+        return update
+
+    def _identify(self, address: str) -> None:
+        """Set the device metadata, which only changes with the address."""
+        identifier = short_address(address)
         self.device_id = "cry_device_id"
         self.set_title(f"Cry Title {identifier}")
         self.set_device_name(f"Cry Device Name {identifier}")
         self.set_device_type("CRY device type")
         self.set_device_manufacturer("CRY anufacturer")
-        self.update_predefined_sensor(SensorLibrary.TEMPERATURE__CELSIUS, 12)
-        return True
+        self._identified_address = address
+        state = self.state
+        if state.bindkey is not None:
+            # Only devices with a bindkey load the crypto stack.
+            from .decryption import MiBeaconDecryptor
+
+            state.decryptor = MiBeaconDecryptor(state.bindkey, address)
+            state.decoders = {
+                **DECODERS,
+                UUID_MIBEACON: state.decryptor.decode,
+            }
+
+    def _start_update(self, service_info: BluetoothServiceInfo) -> bool:
+        """Decode the service data of an advertisement into sensor values."""
+        if service_info.address != self._identified_address:
+            self._identify(service_info.address)
+        decoded = False
+        decoders = self.state.decoders
+        readings = self.state.readings
+        update_sensor = self.update_predefined_sensor
+        for uuid, data in service_info.service_data.items():
+            if (decoder := decoders.get(uuid)) is None:
+                continue
+            for field, value in decoder(data):
+                readings[field] = value
+                update_sensor(FIELD_SENSORS[field], value)
+                if field == BATTERY:
+                    self.state.passive_battery = monotonic()
+                decoded = True
+            if uuid == UUID_MIBEACON:
+                self._fire_mibeacon_events(data)
+        if decoded and (history := self.state.history) is not None:
+            history.record(time(), readings)
+        return decoded
+
+    def _fire_mibeacon_events(self, data: bytes) -> None:
+        """Fire the events of a MiBeacon frame, once per frame counter.
+
+        Remotes send every press several times with the same counter. The
+        decryptor already drops the repeats of encrypted frames.
+        """
+        if len(data) < 5 or not data[0] & MIBEACON_FLAG_OBJECT:
+            return
+        if data[0] & MIBEACON_FLAG_ENCRYPTED:
+            decryptor = self.state.decryptor
+            if decryptor is None or (payload := decryptor.payload) is None:
+                return
+            offset = 0
+        else:
+            state = self.state
+            if data[4] == state.event_counter:
+                return
+            state.event_counter = data[4]
+            if (offset := mibeacon_payload_offset(data)) < 0:
+                return
+            payload = data
+        for event_class, event_type in decode_mibeacon_events(payload, offset):
+            self.fire_event(event_class, event_type)
+
+    def restore(self, address: str, readings: Sequence[float | None]) -> SensorUpdate:
+        """Return an update with the readings stored by a previous run."""
+        if address != self._identified_address:
+            self._identify(address)
+        state_readings = self.state.readings
+        update_sensor = self.update_predefined_sensor
+        for field, value in enumerate(readings[: len(state_readings)]):
+            if value is not None:
+                state_readings[field] = value
+                update_sensor(FIELD_SENSORS[field], value)
+        return self._finish_update()
 
     def update(self, data: BluetoothServiceInfo) -> SensorUpdate:
         """Update a device."""
-        # Ensure events from previous
-        # updates are not carried over
-        # as events are transient.
-        _LOGGER.warning("*** update")
-        self._events_updates.clear()
+        if (stats := self.stats) is not None:
+            began = perf_counter_ns()
+            stats.packets += 1
+        state = self.state
+        # Every packet counts for poll routing, repeats included.
+        state.signal.record(data.source, data.rssi, monotonic())
+        fingerprint = hash(
+            (tuple(data.service_data.items()), data.rssi >> RSSI_BUCKET_SHIFT)
+        )
+        if state.fingerprint == fingerprint:
+            if stats is not None:
+                stats.deduplicated += 1
+            return NO_CHANGE_UPDATE
+        state.fingerprint = fingerprint
+        state.rssi = data.rssi
+        if DEBUG_LOG.allow(data.address):
+            _LOGGER.debug(
+                "%s: rssi %s, service data %s",
+                data.address,
+                data.rssi,
+                data.service_data,
+            )
+        if stats is None:
+            self._start_update(data)
+            self.update_signal_strength(data.rssi)
+            return self._finish_update()
+        parse_began = perf_counter_ns()
         self._start_update(data)
+        stats.parse_ns.record(perf_counter_ns() - parse_began)
         self.update_signal_strength(data.rssi)
-        return self._finish_update()
+        update = self._finish_update()
+        stats.update_ns.record(perf_counter_ns() - began)
+        return update
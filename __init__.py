@@ -2,11 +2,15 @@
 
 from __future__ import annotations
 
+import asyncio
+from collections.abc import Callable
 import logging
-from typing import cast
+from pathlib import Path
+from time import monotonic
+from typing import TYPE_CHECKING, cast
 
 from home_assistant_bluetooth import BluetoothServiceInfo
-from xiaomi_ble import EncryptionScheme, SensorUpdate, XiaomiBluetoothDeviceData
+from sensor_state_data import SensorUpdate
 
 from homeassistant import config_entries
 from homeassistant.components.bluetooth import (
@@ -14,10 +18,11 @@ from homeassistant.components.bluetooth import (
     BluetoothScanningMode,
     BluetoothServiceInfoBleak,
     async_ble_device_from_address,
+    async_scanner_devices_by_address,
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import CoreState, HomeAssistant
+from homeassistant.core import CoreState, HomeAssistant, callback
 from homeassistant.helpers.device_registry import (
     CONNECTION_BLUETOOTH,
     DeviceRegistry,
@@ -26,11 +31,27 @@ from homeassistant.helpers.device_registry import (
 from homeassistant.helpers.dispatcher import async_dispatcher_send
 
 from .const import (
+    CONF_AGGREGATION_EXTREMES,
+    CONF_AGGREGATION_WINDOW,
+    CONF_BINDKEY,
     CONF_DISCOVERED_EVENT_CLASSES,
+    CONF_HISTORY,
+    CONF_KEEP_ALIVE,
+    CONF_POLL_INTERVAL,
+    CONF_RECORD,
     CONF_SLEEPY_DEVICE,
+    CONF_STATISTICS,
+    DATA_DISPATCHER,
+    DATA_GATT_CACHE,
+    DATA_KEEP_ALIVE_POOL,
+    DATA_POLL_ARBITER,
+    DATA_SETUP_LIMIT,
+    DEFAULT_POLL_INTERVAL,
     DOMAIN,
     XIAOMI_BLE_EVENT,
     XiaomiBleEvent,
+    format_discovered_event_class,
+    format_event_dispatcher_name,
 )
 from .QingActiveBluetoothProcessorCoordinator import (
     QingActiveBluetoothProcessorCoordinator,
@@ -38,81 +59,265 @@ from .QingActiveBluetoothProcessorCoordinator import (
 
 # from .coordinator import XiaomiActiveBluetoothProcessorCoordinator
 from .QingBluetoothDeviceData import QingBluetoothDeviceData
+from .aggregation import WindowAggregator
+from .debug import DEBUG_LOG
+from .dispatcher import AdvertisementDispatcher
+from .export import async_setup_services
+from .gatt import GattHandleCache, KeepAlivePool
+from .history import ReadingHistory
+from .poll import PollArbiter
+from .recorder import AdvertisementRecorder
+from .routing import MAX_POLL_ATTEMPTS, async_poll_with_failover
+from .stats import DeviceStats
+from .storage import async_get_device_store
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
 
 PLATFORMS: list[Platform] = [Platform.SENSOR]
+# Entries forwarding their platforms at the same time. HA sets up all the
+# entries of a domain concurrently, this keeps hundreds of them from
+# piling up on the entity platform and registries at once.
+MAX_CONCURRENT_SETUPS = 16
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@callback
+def _async_fire_events(
+    hass: HomeAssistant,
+    coordinator: QingActiveBluetoothProcessorCoordinator,
+    device_registry: DeviceRegistry,
+    update: SensorUpdate,
+    now: float,
+) -> None:
+    """Fire the events of an update on the bus and the dispatcher."""
+    address = coordinator.address
+    entry = coordinator.entry
+    discovered_event_classes = coordinator.discovered_event_classes
+    gate = coordinator.event_gate
+    device_id: str | None = None
+    for device_key, event in update.events.items():
+        event_class = device_key.key
+        event_type = event.event_type
+        if not gate.allow(event_class, event_type, now):
+            continue
+        if device_id is None:
+            sensor_device_info = update.devices.get(device_key.device_id)
+            device = device_registry.async_get_device(
+                connections={(CONNECTION_BLUETOOTH, address)}
+            ) or device_registry.async_get_or_create(
+                config_entry_id=entry.entry_id,
+                connections={(CONNECTION_BLUETOOTH, address)},
+                identifiers={(BLUETOOTH_DOMAIN, address)},
+                name=sensor_device_info.name if sensor_device_info else None,
+            )
+            device_id = device.id
+        if event_class not in discovered_event_classes:
+            # Saved with the entry, the update listener does not reload
+            # for data changes.
+            discovered_event_classes.add(event_class)
+            hass.config_entries.async_update_entry(
+                entry,
+                data=entry.data
+                | {CONF_DISCOVERED_EVENT_CLASSES: sorted(discovered_event_classes)},
+            )
+            async_dispatcher_send(
+                hass, format_discovered_event_class(address), event_class, event
+            )
+        hass.bus.async_fire(
+            XIAOMI_BLE_EVENT,
+            cast(
+                XiaomiBleEvent,
+                {
+                    "device_id": device_id,
+                    "address": address,
+                    "event_class": event_class,
+                    "event_type": event_type,
+                    "event_properties": event.event_properties,
+                },
+            ),
+        )
+        async_dispatcher_send(
+            hass, format_event_dispatcher_name(address, event_class), event
+        )
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    _LOGGER.warning("*** async_setup_entry:%s", entry)
+    _LOGGER.debug("Setting up %s", entry.title)
     address = entry.unique_id
     assert address is not None
 
-    data = QingBluetoothDeviceData()
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_POLL_ARBITER not in domain_data:
+        domain_data[DATA_POLL_ARBITER] = PollArbiter()
+    arbiter: PollArbiter = domain_data[DATA_POLL_ARBITER]
+    if DATA_GATT_CACHE not in domain_data:
+        domain_data[DATA_GATT_CACHE] = GattHandleCache()
+    if DATA_KEEP_ALIVE_POOL not in domain_data:
+        keep_alive_pool = domain_data[DATA_KEEP_ALIVE_POOL] = KeepAlivePool()
+        arbiter.idle_connections = keep_alive_pool.idle_on
+        arbiter.on_contention = keep_alive_pool.release_idle
+    if DATA_DISPATCHER not in domain_data:
+        domain_data[DATA_DISPATCHER] = AdvertisementDispatcher(hass)
+    if DATA_SETUP_LIMIT not in domain_data:
+        domain_data[DATA_SETUP_LIMIT] = asyncio.Semaphore(MAX_CONCURRENT_SETUPS)
+    async_setup_services(hass)
+
+    store = await async_get_device_store(hass)
+
+    bindkey = entry.data.get(CONF_BINDKEY)
+    data = QingBluetoothDeviceData(
+        bindkey=bytes.fromhex(bindkey) if bindkey else None,
+        poll_interval=entry.options.get(CONF_POLL_INTERVAL, DEFAULT_POLL_INTERVAL),
+        gatt_cache=domain_data[DATA_GATT_CACHE],
+        keep_alive=entry.options.get(CONF_KEEP_ALIVE, 0),
+        keep_alive_pool=domain_data[DATA_KEEP_ALIVE_POOL],
+        stats=DeviceStats() if entry.options.get(CONF_STATISTICS, False) else None,
+        history=ReadingHistory() if entry.options.get(CONF_HISTORY, False) else None,
+    )
+    # Last values, poll times and GATT handles of the previous run. The
+    # first poll waits for the interval since the last successful one.
+    restored = store.async_restore(address, data)
 
     def _needs_poll(
         service_info: BluetoothServiceInfoBleak, last_poll: float | None
     ) -> bool:
-        # Only poll if hass is running, we need to poll,
-        # and we actually have a way to connect to the device
+        # Only poll if hass is running, we actually have a way to connect
+        # to the device, and the scheduler says a poll is due. The scheduler
+        # is asked last since a positive answer reserves the poll.
         return (
             hass.state is CoreState.running
-            and data.poll_needed(service_info, last_poll)
             and bool(
                 async_ble_device_from_address(
                     hass, service_info.device.address, connectable=True
                 )
             )
+            and data.poll_needed(service_info, last_poll)
         )
 
-    async def _async_poll(service_info: BluetoothServiceInfoBleak) -> SensorUpdate:
-        # BluetoothServiceInfoBleak is defined in HA, otherwise would just pass it
-        # directly to the Xiaomi code
-        # Make sure the device we have is one that we can connect with
-        # in case its coming from a passive scanner
-        if service_info.connectable:
-            connectable_device = service_info.device
-        elif device := async_ble_device_from_address(
-            hass, service_info.device.address, True
+    async def _async_poll_through(source: str, ble_device: BLEDevice) -> SensorUpdate:
+        # Wait for a free connection slot on the adapter, the devices that
+        # went longest without a successful poll go first.
+        waiting = monotonic()
+        async with arbiter.async_slot(
+            source, data.poll_urgency(), data.idle_source() == source
         ):
-            connectable_device = device
-        else:
+            if (stats := data.stats) is not None:
+                stats.connection_wait.record(monotonic() - waiting)
+            return await data.async_poll(ble_device, source)
+
+    async def _async_poll(service_info: BluetoothServiceInfoBleak) -> SensorUpdate:
+        # The advertisement may come from a passive scanner, poll through
+        # the adapters and proxies that can connect to the device, those
+        # with a free slot and the best recent signal first.
+        now = monotonic()
+        signal = data.state.signal
+        candidates: list[tuple[str, BLEDevice]] = []
+        for scanner_device in async_scanner_devices_by_address(hass, address, True):
+            source = scanner_device.scanner.source
+            signal.record(source, scanner_device.advertisement.rssi, now)
+            candidates.append((source, scanner_device.ble_device))
+        if not candidates:
             # We have no bluetooth controller that is in range of
             # the device to poll it
-            raise RuntimeError(
-                f"No connectable device found for {service_info.device.address}"
-            )
-        return await data.async_poll(connectable_device)
-
-    def _update(service_info: BluetoothServiceInfo) -> SensorUpdate:
-        _LOGGER.warning("*** _update:%s", data)
-        return SensorUpdate()
-
-    coordinator = hass.data.setdefault(DOMAIN, {})[entry.entry_id] = (
-        QingActiveBluetoothProcessorCoordinator(
-            hass,
-            _LOGGER,
-            address=address,
-            mode=BluetoothScanningMode.PASSIVE,
-            update_method=data.update,
-            needs_poll_method=_needs_poll,
-            device_data=data,
-            discovered_event_classes=set(
-                entry.data.get(CONF_DISCOVERED_EVENT_CLASSES, [])
-            ),
-            poll_method=_async_poll,
-            # We will take advertisements from non-connectable devices
-            # since we will trade the BLEDevice for a connectable one
-            # if we need to poll it
-            connectable=False,
-            entry=entry,
+            raise RuntimeError(f"No connectable device found for {address}")
+        return await async_poll_with_failover(
+            signal.rank(candidates, arbiter.free_slots, now)[:MAX_POLL_ATTEMPTS],
+            _async_poll_through,
+            _failover,
+        )
+
+    def _failover(source: str, err: Exception) -> None:
+        _LOGGER.debug(
+            "%s: poll through %s failed, trying the next source: %s",
+            address,
+            source,
+            err,
+        )
+        if (stats := data.stats) is not None:
+            stats.failovers += 1
+
+    recorder: AdvertisementRecorder | None = None
+    if entry.options.get(CONF_RECORD, False):
+        recorder = AdvertisementRecorder(
+            Path(hass.config.path(f"{DOMAIN}_{address.replace(':', '').lower()}.rec"))
+        )
+        await hass.async_add_executor_job(recorder.start)
+
+        async def _async_stop_recorder() -> None:
+            await hass.async_add_executor_job(recorder.stop)
+
+        entry.async_on_unload(_async_stop_recorder)
+
+    device_registry = async_get(hass)
+
+    def _update_and_fire_events(service_info: BluetoothServiceInfo) -> SensorUpdate:
+        update = data.update(service_info)
+        if update.events:
+            _async_fire_events(hass, coordinator, device_registry, update, monotonic())
+        return update
+
+    aggregator: WindowAggregator | None = None
+    update_method: Callable[[BluetoothServiceInfo], SensorUpdate] = (
+        _update_and_fire_events
+    )
+    if window := entry.options.get(CONF_AGGREGATION_WINDOW, 0):
+        aggregator = window_aggregator = WindowAggregator(
+            window, entry.options.get(CONF_AGGREGATION_EXTREMES, False)
         )
+
+        def _aggregated_update(service_info: BluetoothServiceInfo) -> SensorUpdate:
+            return window_aggregator.update(_update_and_fire_events(service_info))
+
+        update_method = _aggregated_update
+
+    coordinator = domain_data[entry.entry_id] = QingActiveBluetoothProcessorCoordinator(
+        hass,
+        _LOGGER,
+        address=address,
+        mode=BluetoothScanningMode.PASSIVE,
+        update_method=update_method,
+        needs_poll_method=_needs_poll,
+        device_data=data,
+        discovered_event_classes=set(entry.data.get(CONF_DISCOVERED_EVENT_CLASSES, [])),
+        poll_method=_async_poll,
+        # We will take advertisements from non-connectable devices
+        # since we will trade the BLEDevice for a connectable one
+        # if we need to poll it
+        connectable=False,
+        entry=entry,
+        dispatcher=domain_data[DATA_DISPATCHER],
+        recorder=recorder,
+        aggregator=aggregator,
+        store=store,
     )
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    async with domain_data[DATA_SETUP_LIMIT]:
+        await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    if restored is not None:
+        coordinator.async_push_update(restored)
+    entry.async_on_unload(store.async_register(address, data))
     entry.async_on_unload(
         coordinator.async_start()
     )  # only start after all platforms have had a chance to subscribe
+    entry.async_on_unload(coordinator.async_disconnect)
+
+    def _forget_debug_buckets() -> None:
+        # The converter logs under the title, the device data under the address.
+        DEBUG_LOG.forget(address)
+        DEBUG_LOG.forget(data.title)
+
+    entry.async_on_unload(_forget_debug_buckets)
+
+    options = dict(entry.options)
+
+    async def _async_entry_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+        # The entry data also changes as event classes are discovered, only
+        # an options change needs a reload.
+        if entry.options != options:
+            await hass.config_entries.async_reload(entry.entry_id)
+
+    entry.async_on_unload(entry.add_update_listener(_async_entry_updated))
     return True
 
 
@@ -122,3 +327,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         hass.data[DOMAIN].pop(entry.entry_id)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Forget the stored state of a removed device."""
+    if entry.unique_id is not None:
+        (await async_get_device_store(hass)).async_remove(entry.unique_id)
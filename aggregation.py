@@ -0,0 +1,167 @@
+"""Windowed aggregation of Qing BLE sensor values."""
+
+from __future__ import annotations
+
+from sensor_state_data import DeviceKey, SensorDescription, SensorUpdate, SensorValue
+
+from .QingBluetoothDeviceData import NO_CHANGE_UPDATE
+
+# Sensors reported as the mean over the window. Scale readings and the
+# battery level pass straight through.
+AGGREGATED_KEYS = frozenset(
+    {"temperature", "humidity", "illuminance", "signal_strength"}
+)
+MEAN_PRECISION = 2
+
+
+class RunningStats:
+    """Count, sum, min, max and last value of one sensor in the window."""
+
+    __slots__ = (
+        "count",
+        "total",
+        "minimum",
+        "maximum",
+        "last",
+        "name",
+        "description",
+        "extremes",
+    )
+
+    def __init__(
+        self,
+        name: str | None,
+        description: SensorDescription | None,
+        extremes: tuple[DeviceKey, DeviceKey] | None,
+    ) -> None:
+        """Initialize the statistics."""
+        self.count = 0
+        self.total = 0.0
+        self.minimum = 0.0
+        self.maximum = 0.0
+        self.last = 0.0
+        self.name = name
+        self.description = description
+        # Device keys of the min and max sensors, if they are emitted.
+        self.extremes = extremes
+
+    def add(self, value: float) -> None:
+        """Add a sample."""
+        if self.count:
+            if value < self.minimum:
+                self.minimum = value
+            elif value > self.maximum:
+                self.maximum = value
+        else:
+            self.minimum = self.maximum = value
+        self.count += 1
+        self.total += value
+        self.last = value
+
+
+class WindowAggregator:
+    """Turn the samples of a window into one update per sensor.
+
+    Samples of the aggregated sensors are taken out of every update and
+    accumulated. flush() returns one update with their means, and the
+    min and max as extra sensors if enabled, and starts the next window.
+    The first sample of a sensor passes through so its entity has a state
+    right away. Memory is constant per sensor, whatever the window length.
+    """
+
+    __slots__ = ("window", "extremes", "_stats", "_title", "_devices")
+
+    def __init__(self, window: float, extremes: bool = False) -> None:
+        """Initialize the aggregator, flushed every window seconds."""
+        self.window = window
+        self.extremes = extremes
+        self._stats: dict[DeviceKey, RunningStats] = {}
+        self._title: str | None = None
+        self._devices: dict = {}
+
+    def _track(
+        self, device_key: DeviceKey, name: str | None, update: SensorUpdate
+    ) -> RunningStats:
+        extremes = None
+        if self.extremes:
+            extremes = (
+                DeviceKey(f"{device_key.key}_min", device_key.device_id),
+                DeviceKey(f"{device_key.key}_max", device_key.device_id),
+            )
+        stats = self._stats[device_key] = RunningStats(
+            name, update.entity_descriptions.get(device_key), extremes
+        )
+        return stats
+
+    def update(self, update: SensorUpdate) -> SensorUpdate:
+        """Accumulate the aggregated samples of an update, returning the rest.
+
+        The update is changed in place, the device data hands its dicts over.
+        """
+        if update is NO_CHANGE_UPDATE:
+            return update
+        self._title = update.title
+        self._devices = update.devices
+        entity_values = update.entity_values
+        aggregated: list[DeviceKey] | None = None
+        for device_key, sensor_value in entity_values.items():
+            value = sensor_value.native_value
+            if device_key.key not in AGGREGATED_KEYS or not isinstance(
+                value, (int, float)
+            ):
+                continue
+            if (stats := self._stats.get(device_key)) is None:
+                # First sample, let it through.
+                self._track(device_key, sensor_value.name, update).add(value)
+                continue
+            stats.add(value)
+            if aggregated is None:
+                aggregated = []
+            aggregated.append(device_key)
+        if aggregated:
+            for device_key in aggregated:
+                del entity_values[device_key]
+        return update
+
+    def flush(self) -> SensorUpdate | None:
+        """Return the aggregated values of the window and start a new one."""
+        entity_values: dict[DeviceKey, SensorValue] = {}
+        entity_descriptions: dict[DeviceKey, SensorDescription] = {}
+        for device_key, stats in self._stats.items():
+            if not stats.count:
+                continue
+            entity_values[device_key] = SensorValue(
+                device_key=device_key,
+                name=stats.name,
+                native_value=round(stats.total / stats.count, MEAN_PRECISION),
+            )
+            if stats.description is not None:
+                entity_descriptions[device_key] = stats.description
+            if stats.extremes is not None:
+                for extreme_key, suffix, value in (
+                    (stats.extremes[0], "min", stats.minimum),
+                    (stats.extremes[1], "max", stats.maximum),
+                ):
+                    entity_values[extreme_key] = SensorValue(
+                        device_key=extreme_key,
+                        name=f"{stats.name} {suffix}" if stats.name else suffix,
+                        native_value=value,
+                    )
+                    if stats.description is not None:
+                        entity_descriptions[extreme_key] = SensorDescription(
+                            device_key=extreme_key,
+                            device_class=stats.description.device_class,
+                            native_unit_of_measurement=(
+                                stats.description.native_unit_of_measurement
+                            ),
+                        )
+            stats.count = 0
+            stats.total = 0.0
+        if not entity_values:
+            return None
+        return SensorUpdate(
+            title=self._title,
+            devices=self._devices,
+            entity_descriptions=entity_descriptions,
+            entity_values=entity_values,
+        )
@@ -0,0 +1,117 @@
+"""Advertisement interval tracking for Qing BLE devices."""
+
+from __future__ import annotations
+
+import math
+from typing import Any
+
+# Weight of a new inter-arrival time in the smoothed mean and variance.
+INTERVAL_SMOOTHING = 0.1
+# Inter-arrival times seen before the estimate is trusted.
+MIN_SAMPLES = 8
+# A device is gone after its mean interval plus this many deviations.
+TIMEOUT_DEVIATIONS = 4
+# Bounds of the learned unavailable timeout.
+MIN_TIMEOUT = 60.0
+MAX_TIMEOUT = 6 * 60 * 60.0
+# With the interval Home Assistant learned, a device is gone after this
+# many of its longest gaps between advertisements.
+MISSED_INTERVALS = 3
+# A device advertising less often than this is sleepy. A device already
+# classified only changes class once its interval is this fraction past it.
+SLEEPY_INTERVAL = 5 * 60.0
+SLEEPY_HYSTERESIS = 0.2
+
+
+class AdvertisementInterval:
+    """Interval between the advertisements of a device.
+
+    The callbacks only see advertisements whose data changed, Home Assistant
+    drops the repeats before. The smoothed interval and variance of those
+    are an upper bound of how often the device advertises. Home Assistant
+    learns the real interval from every advertisement, the longest gap of
+    its first few, and once it is known it takes precedence.
+    """
+
+    __slots__ = ("last_seen", "mean", "variance", "samples", "advertising")
+
+    def __init__(self) -> None:
+        """Initialize the tracker."""
+        # Monotonic time of the last advertisement.
+        self.last_seen: float | None = None
+        self.mean = 0.0
+        self.variance = 0.0
+        self.samples = 0
+        # Longest gap between advertisements learned by Home Assistant.
+        self.advertising: float | None = None
+
+    def record(self, now: float) -> None:
+        """Add an advertisement seen at a monotonic time."""
+        last_seen = self.last_seen
+        self.last_seen = now
+        if last_seen is None or now <= last_seen:
+            return
+        interval = now - last_seen
+        if not self.samples:
+            self.mean = interval
+        else:
+            delta = interval - self.mean
+            self.mean += INTERVAL_SMOOTHING * delta
+            self.variance = (1 - INTERVAL_SMOOTHING) * (
+                self.variance + INTERVAL_SMOOTHING * delta * delta
+            )
+        self.samples += 1
+
+    @property
+    def learned(self) -> bool:
+        """Return True once there are enough samples to go by."""
+        return self.advertising is not None or self.samples >= MIN_SAMPLES
+
+    @property
+    def timeout(self) -> float | None:
+        """Return how long the device may be silent, None if not learned."""
+        if self.advertising is not None:
+            timeout = self.advertising * MISSED_INTERVALS
+        elif self.samples >= MIN_SAMPLES:
+            timeout = self.mean + TIMEOUT_DEVIATIONS * math.sqrt(self.variance)
+        else:
+            return None
+        return min(max(timeout, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    @property
+    def sleepy(self) -> bool | None:
+        """Return True if the device is sleepy, None if not known yet."""
+        return self.classify(None)
+
+    def classify(self, sleepy: bool | None) -> bool | None:
+        """Return whether the device is sleepy, given its current class.
+
+        Until Home Assistant learned the interval, the changed data only
+        tells that a device is not sleepy, by changing often enough.
+        """
+        if sleepy is None:
+            wakes = sleeps = SLEEPY_INTERVAL
+        else:
+            wakes = SLEEPY_INTERVAL * (1 - SLEEPY_HYSTERESIS)
+            sleeps = SLEEPY_INTERVAL * (1 + SLEEPY_HYSTERESIS)
+        if self.advertising is not None:
+            interval = self.advertising
+        elif self.samples >= MIN_SAMPLES and self.mean <= wakes:
+            return False
+        else:
+            return sleepy
+        if interval <= wakes:
+            return False
+        if interval > sleeps:
+            return True
+        return sleepy
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the interval for diagnostics."""
+        return {
+            "mean": round(self.mean, 1),
+            "deviation": round(math.sqrt(self.variance), 1),
+            "samples": self.samples,
+            "advertising": self.advertising,
+            "timeout": self.timeout,
+        }
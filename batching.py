@@ -0,0 +1,94 @@
+"""Batched entity state writes for all Qing BLE devices."""
+
+from __future__ import annotations
+
+from asyncio import Handle, TimerHandle
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.components.bluetooth.passive_update_processor import (
+    PassiveBluetoothEntityKey,
+)
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DATA_WRITE_BATCHERS, DOMAIN
+
+if TYPE_CHECKING:
+    from .QingActiveBluetoothProcessorCoordinator import (
+        QingPassiveBluetoothDataProcessor,
+    )
+
+
+class WriteBatcher:
+    """Collect the entities that changed and write them in one pass.
+
+    Advertisements of many devices often arrive within the same loop
+    iteration. The entities they change are marked dirty and written once
+    per window, zero meaning on the next loop iteration, so an entity
+    updated several times in a window is written once with its last value.
+    """
+
+    def __init__(self, hass: HomeAssistant, window: float = 0.0) -> None:
+        """Initialize the batcher."""
+        self._hass = hass
+        self.window = window
+        # processor -> dirty entity keys
+        self._pending: dict[
+            QingPassiveBluetoothDataProcessor, set[PassiveBluetoothEntityKey]
+        ] = {}
+        self._handle: Handle | TimerHandle | None = None
+        self.passes = 0
+        self.written = 0
+        self.coalesced = 0
+
+    @callback
+    def async_add(
+        self,
+        processor: QingPassiveBluetoothDataProcessor,
+        entity_keys: set[PassiveBluetoothEntityKey],
+    ) -> None:
+        """Mark entities of a processor to be written in the next pass."""
+        if (pending := self._pending.get(processor)) is None:
+            self._pending[processor] = set(entity_keys)
+        else:
+            dirty = len(pending)
+            pending |= entity_keys
+            self.coalesced += dirty + len(entity_keys) - len(pending)
+        if self._handle is None:
+            loop = self._hass.loop
+            if self.window:
+                self._handle = loop.call_later(self.window, self._async_flush)
+            else:
+                self._handle = loop.call_soon(self._async_flush)
+
+    @callback
+    def async_discard(self, processor: QingPassiveBluetoothDataProcessor) -> None:
+        """Forget the pending writes of a processor."""
+        self._pending.pop(processor, None)
+
+    @callback
+    def _async_flush(self) -> None:
+        self._handle = None
+        pending = self._pending
+        self._pending = {}
+        self.passes += 1
+        for processor, entity_keys in pending.items():
+            self.written += len(entity_keys)
+            processor.async_write_entities(entity_keys)
+
+    def metrics(self) -> dict[str, Any]:
+        """Return the batcher counters for diagnostics."""
+        return {
+            "window": self.window,
+            "passes": self.passes,
+            "written": self.written,
+            "coalesced": self.coalesced,
+        }
+
+
+@callback
+def async_get_write_batcher(hass: HomeAssistant, window: float) -> WriteBatcher:
+    """Return the batcher shared by all devices with the same window."""
+    batchers = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_WRITE_BATCHERS, {})
+    if (batcher := batchers.get(window)) is None:
+        batcher = batchers[window] = WriteBatcher(hass, window)
+    return batcher
@@ -0,0 +1,80 @@
+"""SensorUpdate -> PassiveBluetoothDataUpdate conversion cost.
+
+Compares SensorUpdateConverter against the per-packet conversion it
+replaced. Needs Home Assistant and sensor-state-data installed.
+"""
+
+from __future__ import annotations
+
+from common import load_integration, per_call_ns
+from home_assistant_bluetooth import BluetoothServiceInfo
+from sensor_state_data import SensorUpdate
+
+from homeassistant.components.bluetooth.passive_update_processor import (
+    PassiveBluetoothDataUpdate,
+)
+from homeassistant.helpers.sensor import sensor_device_info_to_hass_device_info
+
+sensor = load_integration("sensor")
+device = load_integration("device")
+QingBluetoothDeviceData = load_integration(
+    "QingBluetoothDeviceData"
+).QingBluetoothDeviceData
+UUID_QING = load_integration("parser").UUID_QING
+
+
+def legacy_sensor_update_to_bluetooth_data_update(
+    sensor_update: SensorUpdate,
+) -> PassiveBluetoothDataUpdate:
+    """The conversion as it was before SensorUpdateConverter."""
+    to_entity_key = device.device_key_to_bluetooth_entity_key
+    return PassiveBluetoothDataUpdate(
+        devices={
+            device_id: sensor_device_info_to_hass_device_info(device_info)
+            for device_id, device_info in sensor_update.devices.items()
+        },
+        entity_descriptions={
+            to_entity_key(device_key): sensor.SENSOR_DESCRIPTIONS[
+                (description.device_class, description.native_unit_of_measurement)
+            ]
+            for device_key, description in sensor_update.entity_descriptions.items()
+            if description.device_class
+        },
+        entity_data={
+            to_entity_key(device_key): sensor_values.native_value
+            for device_key, sensor_values in sensor_update.entity_values.items()
+        },
+        entity_names={
+            to_entity_key(device_key): sensor_values.name
+            for device_key, sensor_values in sensor_update.entity_values.items()
+        },
+    )
+
+
+def _sensor_update() -> SensorUpdate:
+    service_info = BluetoothServiceInfo(
+        name="Qing 1234",
+        address="AA:BB:CC:DD:12:34",
+        rssi=-71,
+        manufacturer_data={},
+        service_data={UUID_QING: bytes.fromhex("012a0c096f105a")},
+        service_uuids=[],
+        source="local",
+    )
+    return QingBluetoothDeviceData().update(service_info)
+
+
+def main(number: int = 20_000) -> None:
+    update = _sensor_update()
+    converter = sensor.SensorUpdateConverter()
+    converter(update)
+    legacy = per_call_ns(
+        lambda: legacy_sensor_update_to_bluetooth_data_update(update), number
+    )
+    current = per_call_ns(lambda: converter(update), number)
+    print(f"legacy:    {legacy:7.0f} ns/update")
+    print(f"converter: {current:7.0f} ns/update ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Callback registration and dispatch cost of the shared dispatcher.
+
+Drives the bluetooth manager's own BluetoothCallbackMatcherIndex with N
+per-address callbacks (one coordinator per entry registering itself) and
+with the four service data UUID callbacks of AdvertisementDispatcher.
+Needs Home Assistant installed.
+"""
+
+from __future__ import annotations
+
+import time
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from common import load_integration, per_call_ns
+
+from homeassistant.components.bluetooth import (
+    BluetoothCallbackMatcher,
+    BluetoothChange,
+    BluetoothServiceInfoBleak,
+)
+from homeassistant.components.bluetooth.match import (
+    CALLBACK,
+    BluetoothCallbackMatcherIndex,
+    BluetoothCallbackMatcherWithCallback,
+)
+
+dispatcher = load_integration("dispatcher")
+parser = load_integration("parser")
+
+DEVICES = 200
+
+
+def _address(index: int) -> str:
+    return f"AA:BB:CC:DD:{index >> 8:02X}:{index & 0xFF:02X}"
+
+
+def _service_info(address: str) -> BluetoothServiceInfoBleak:
+    service_data = {parser.UUID_QING: bytes.fromhex("012a0c096f105a")}
+    return BluetoothServiceInfoBleak(
+        name="Qing",
+        address=address,
+        rssi=-70,
+        manufacturer_data={},
+        service_data=service_data,
+        service_uuids=[],
+        source="local",
+        device=BLEDevice(address, "Qing", {}, -70),
+        advertisement=AdvertisementData(
+            local_name="Qing",
+            manufacturer_data={},
+            service_data=service_data,
+            service_uuids=[],
+            tx_power=None,
+            rssi=-70,
+            platform_data=(),
+        ),
+        connectable=False,
+        time=time.monotonic(),
+    )
+
+
+def _handler(service_info: BluetoothServiceInfoBleak, change: BluetoothChange) -> None:
+    pass
+
+
+def _deliver(index: BluetoothCallbackMatcherIndex, info) -> None:
+    for matcher in index.match_callbacks(info):
+        matcher[CALLBACK](info, BluetoothChange.ADVERTISEMENT)
+
+
+def _per_entry() -> tuple[float, BluetoothCallbackMatcherIndex]:
+    index = BluetoothCallbackMatcherIndex()
+    start = time.perf_counter()
+    for i in range(DEVICES):
+        matcher = BluetoothCallbackMatcherWithCallback(
+            **BluetoothCallbackMatcher(address=_address(i), connectable=False),
+            callback=_handler,
+        )
+        index.add_callback_matcher(matcher)
+    return time.perf_counter() - start, index
+
+
+def _shared() -> tuple[float, BluetoothCallbackMatcherIndex, object]:
+    index = BluetoothCallbackMatcherIndex()
+    shared = dispatcher.AdvertisementDispatcher(None)
+    start = time.perf_counter()
+    for uuid in parser.SERVICE_DATA_UUIDS:
+        index.add_callback_matcher(
+            BluetoothCallbackMatcherWithCallback(
+                **BluetoothCallbackMatcher(service_data_uuid=uuid, connectable=False),
+                callback=shared._async_dispatch,
+            )
+        )
+    # The manager is skipped here, register straight into the dict.
+    for i in range(DEVICES):
+        shared._handlers[_address(i)] = _handler
+    return time.perf_counter() - start, index, shared
+
+
+def main(number: int = 50_000) -> None:
+    info = _service_info(_address(DEVICES // 2))
+    registration, per_entry = _per_entry()
+    print(
+        f"per-entry: {DEVICES} manager callbacks, registration "
+        f"{registration * 1e6:.0f} us, dispatch "
+        f"{per_call_ns(lambda: _deliver(per_entry, info), number):.0f} ns/adv"
+    )
+    registration, shared_index, _ = _shared()
+    print(
+        f"shared:    {len(parser.SERVICE_DATA_UUIDS)} manager callbacks, registration "
+        f"{registration * 1e6:.0f} us, dispatch "
+        f"{per_call_ns(lambda: _deliver(shared_index, info), number):.0f} ns/adv"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Import time of the integration on top of what Home Assistant loaded.
+
+Runs a fresh interpreter with -X importtime, imports the Home Assistant
+modules that are loaded before the integration anyway, then the
+integration package and its sensor platform. Reports the time spent in
+the integration's own imports and the slowest modules they pulled in.
+Needs Home Assistant and the integration requirements installed.
+"""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+
+from common import ROOT
+
+PRELOADED = (
+    "homeassistant.components.bluetooth",
+    "homeassistant.components.bluetooth.active_update_processor",
+    "homeassistant.components.sensor",
+    "homeassistant.config_entries",
+    "homeassistant.helpers.storage",
+)
+MARKER = "--- integration ---"
+RUNS = 5
+TOP = 10
+
+CODE = f"""
+import importlib, sys
+sys.path.insert(0, {str(ROOT / "benchmarks")!r})
+for name in {PRELOADED!r}:
+    importlib.import_module(name)
+from common import load_integration
+sys.stderr.write({MARKER + chr(10)!r})
+load_integration("sensor")
+"""
+
+
+def _run() -> tuple[int, list[tuple[int, str]]]:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CODE],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    lines = stderr.split(MARKER + "\n", 1)[1].splitlines()
+    total = 0
+    modules = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[12:].split("|")
+        total += int(self_us)
+        modules.append((int(cumulative_us), name.rstrip()))
+    return total, modules
+
+
+def main() -> None:
+    runs = [_run() for _ in range(RUNS)]
+    totals = sorted(total for total, _ in runs)
+    print(f"integration import: median {totals[RUNS // 2] / 1000:.1f} ms")
+    _, modules = runs[0]
+    for cumulative_us, name in sorted(modules, reverse=True)[:TOP]:
+        print(f"{cumulative_us / 1000:8.1f} ms {name}")
+
+
+if __name__ == "__main__":
+    main()
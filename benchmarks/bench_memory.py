@@ -0,0 +1,105 @@
+"""Memory held per device by the integration's device data.
+
+Instantiates N devices the way async_setup_entry does, feeds each one
+advertisement and reports the bytes retained per device, next to those of
+the BluetoothData based device data the integration started from. Needs
+Home Assistant and the integration requirements installed.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+import gc
+import tracemalloc
+
+from bluetooth_data_tools import short_address
+from bluetooth_sensor_state_data import BluetoothData
+from common import load_integration
+from home_assistant_bluetooth import BluetoothServiceInfo
+from sensor_state_data import SensorLibrary, SensorUpdate
+
+device_data = load_integration("QingBluetoothDeviceData")
+gatt = load_integration("gatt")
+parser = load_integration("parser")
+
+DEVICES = 1000
+
+SENSORS = {
+    parser.TEMPERATURE: SensorLibrary.TEMPERATURE__CELSIUS,
+    parser.HUMIDITY: SensorLibrary.HUMIDITY__PERCENTAGE,
+    parser.BATTERY: SensorLibrary.BATTERY__PERCENTAGE,
+}
+
+
+class BaselineDeviceData(BluetoothData):
+    """The device data before the rewrite, without its logging."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.device_id = "default_device_id"
+
+    def _start_update(self, service_info: BluetoothServiceInfo) -> None:
+        identifier = short_address(service_info.address)
+        self.set_title(f"Qing {identifier}")
+        self.set_device_name(f"Qing {identifier}")
+        self.set_device_type("Qing")
+        self.set_device_manufacturer("Qing")
+        for uuid, data in service_info.service_data.items():
+            for field, value in parser.parse_service_data(uuid, data):
+                self.update_predefined_sensor(SENSORS[field], value)
+
+    def update(self, data: BluetoothServiceInfo) -> SensorUpdate:
+        """Update a device."""
+        self._events_updates.clear()
+        self._start_update(data)
+        self.update_signal_strength(data.rssi)
+        return self._finish_update()
+
+
+def _service_info(index: int) -> BluetoothServiceInfo:
+    return BluetoothServiceInfo(
+        name="Qing",
+        address=f"AA:BB:CC:DD:{index >> 8:02X}:{index & 0xFF:02X}",
+        rssi=-70,
+        manufacturer_data={},
+        service_data={parser.UUID_QING: bytes.fromhex("012a0c096f105a")},
+        service_uuids=[],
+        source="local",
+    )
+
+
+def _bytes_per_device(
+    new_device: Callable[[], BluetoothData | device_data.QingBluetoothDeviceData],
+    count: int = DEVICES,
+) -> float:
+    service_infos = [_service_info(i) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    devices = []
+    for service_info in service_infos:
+        data = new_device()
+        data.update(service_info)
+        devices.append(data)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+
+def main() -> None:
+    gatt_cache = gatt.GattHandleCache()
+    keep_alive_pool = gatt.KeepAlivePool()
+    before = _bytes_per_device(BaselineDeviceData)
+    after = _bytes_per_device(
+        lambda: device_data.QingBluetoothDeviceData(
+            gatt_cache=gatt_cache, keep_alive_pool=keep_alive_pool
+        )
+    )
+    print(f"{DEVICES} devices, bytes per device:")
+    print(f"  {'BluetoothData':<24} {before:6.0f}")
+    print(f"  {'QingBluetoothDeviceData':<24} {after:6.0f}  ({after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Per-packet cost of the service data decoder.
+
+Run with ``python benchmarks/bench_parser.py``. The decoder has no
+dependencies outside the standard library, so it is loaded straight from
+``parser.py`` without importing Home Assistant.
+"""
+
+from __future__ import annotations
+
+from common import load_standalone, per_call_ns
+
+PAYLOADS = {
+    "0000fd50-0000-1000-8000-00805f9b34fb": bytes.fromhex("012a0c096f105a"),
+    "0000fe95-0000-1000-8000-00805f9b34fb": bytes.fromhex(
+        "5020aa01c5a1b2c3d4e5f60d1004d200b801"
+    ),
+    "0000181d-0000-1000-8000-00805f9b34fb": bytes.fromhex("22d43ae707010a0b0c0d"),
+    "0000181b-0000-1000-8000-00805f9b34fb": bytes.fromhex("0226e707010a0b0c0df401d43a"),
+}
+
+
+def main(number: int = 200_000) -> None:
+    parser = load_standalone("parser")
+    parse = parser.parse_service_data
+    for uuid, payload in PAYLOADS.items():
+        readings = parse(uuid, payload)
+        assert readings, uuid
+        ns = per_call_ns(lambda: parse(uuid, payload), number)
+        print(f"{uuid[4:8]}: {ns:7.0f} ns/packet  {readings}")
+
+
+if __name__ == "__main__":
+    main()
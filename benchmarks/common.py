@@ -0,0 +1,43 @@
+"""Helpers shared by the benchmark scripts."""
+
+from __future__ import annotations
+
+import importlib
+import importlib.util
+from pathlib import Path
+import sys
+from types import ModuleType
+import timeit
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE = "qing_ble"
+
+
+def load_standalone(name: str) -> ModuleType:
+    """Load a dependency-free module of the integration on its own."""
+    spec = importlib.util.spec_from_file_location(
+        f"{PACKAGE}_{name}", ROOT / f"{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_integration(name: str) -> ModuleType:
+    """Import a module of the integration as part of its package.
+
+    This needs Home Assistant and the integration requirements installed.
+    """
+    if PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE, ROOT / "__init__.py", submodule_search_locations=[str(ROOT)]
+        )
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def per_call_ns(func, number: int) -> float:
+    """Return the best per-call time of func in nanoseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
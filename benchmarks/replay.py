@@ -0,0 +1,298 @@
+"""Replay advertisements through the integration's hot path.
+
+Every packet goes through QingBluetoothDeviceData.update, the
+SensorUpdateConverter and a QingPassiveBluetoothDataProcessor, the way
+the coordinator drives them, with a stand-in for the coordinator. By
+default the packets are synthetic service data for the manifest UUIDs,
+``--capture`` replays a ``.rec`` ring file written by the recorder, or a
+JSON lines file with one advertisement per line::
+
+    {"address": "AA:BB:CC:DD:EE:FF", "rssi": -70,
+     "service_data": {"0000fd50-0000-1000-8000-00805f9b34fb": "012a0c096f105a"}}
+
+Reports packets per second, p50/p99 latency per advertisement and memory
+allocated per packet. ``--save`` writes the results as JSON and
+``--baseline`` compares against a saved run, exiting non-zero when
+throughput or p99 latency regress by more than ``--tolerance``.
+Needs Home Assistant and the integration requirements installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Iterable, Iterator
+import gc
+import json
+import logging
+from pathlib import Path
+import random
+import struct
+import sys
+import time
+import tracemalloc
+
+from common import load_integration
+from home_assistant_bluetooth import BluetoothServiceInfo
+
+parser = load_integration("parser")
+sensor = load_integration("sensor")
+device_data = load_integration("QingBluetoothDeviceData")
+coordinator = load_integration("QingActiveBluetoothProcessorCoordinator")
+recorder = load_integration("recorder")
+
+_QING = struct.Struct("<BBhHB")
+_MIBEACON_TEMPERATURE_HUMIDITY = struct.Struct("<HHBHBhH")
+_SCALE_V1 = struct.Struct("<BH7x")
+_SCALE_V2 = struct.Struct("<BB7xHH")
+
+
+class StandInCoordinator:
+    """The parts of the coordinator a processor touches."""
+
+    available = True
+    restore_data = None
+    device_data = None
+    name = "replay"
+    logger = logging.getLogger(__name__)
+
+
+def _qing(rng: random.Random, counter: int) -> tuple[str, bytes]:
+    return parser.UUID_QING, _QING.pack(
+        parser.QING_FRAME_VERSION,
+        counter & 0xFF,
+        rng.randint(1800, 2600),
+        rng.randint(3500, 6500),
+        rng.randint(60, 100),
+    )
+
+
+def _mibeacon(rng: random.Random, counter: int) -> tuple[str, bytes]:
+    return parser.UUID_MIBEACON, _MIBEACON_TEMPERATURE_HUMIDITY.pack(
+        parser.MIBEACON_FLAG_OBJECT,
+        0x0576,
+        counter & 0xFF,
+        0x100D,
+        4,
+        rng.randint(180, 260),
+        rng.randint(350, 650),
+    )
+
+
+def _weight_scale(rng: random.Random, counter: int) -> tuple[str, bytes]:
+    return parser.UUID_WEIGHT_SCALE, _SCALE_V1.pack(0x22, rng.randint(10000, 20000))
+
+
+def _body_composition(rng: random.Random, counter: int) -> tuple[str, bytes]:
+    return parser.UUID_BODY_COMPOSITION, _SCALE_V2.pack(
+        0x02, 0x26, rng.randint(400, 600), rng.randint(10000, 20000)
+    )
+
+
+# Relative share of each kind of device in the synthetic fleet.
+_GENERATORS = (
+    (_qing, 6),
+    (_mibeacon, 3),
+    (_weight_scale, 1),
+    (_body_composition, 1),
+)
+
+
+def synthetic_service_infos(
+    devices: int, packets: int, repeat: float = 0.5, seed: int = 0
+) -> list[BluetoothServiceInfo]:
+    """Return packets round robin across devices.
+
+    A repeat share of the packets repeats the previous advertisement of
+    its device, as sensors do between measurements.
+    """
+    rng = random.Random(seed)
+    generators = rng.choices(
+        [generator for generator, _ in _GENERATORS],
+        [weight for _, weight in _GENERATORS],
+        k=devices,
+    )
+    last: list[dict[str, bytes] | None] = [None] * devices
+    service_infos = []
+    for index in range(packets):
+        number = index % devices
+        service_data = last[number]
+        if service_data is None or rng.random() >= repeat:
+            uuid, payload = generators[number](rng, index // devices)
+            service_data = last[number] = {uuid: payload}
+        service_infos.append(
+            _service_info(
+                f"AA:BB:CC:{number >> 16:02X}:{number >> 8 & 0xFF:02X}:{number & 0xFF:02X}",
+                rng.randint(-90, -60) if rng.random() < 0.2 else -70,
+                service_data,
+            )
+        )
+    return service_infos
+
+
+def _service_info(
+    address: str, rssi: int, service_data: dict[str, bytes]
+) -> BluetoothServiceInfo:
+    return BluetoothServiceInfo(
+        name="Qing",
+        address=address,
+        rssi=rssi,
+        manufacturer_data={},
+        service_data=service_data,
+        service_uuids=list(service_data),
+        source="local",
+    )
+
+
+def load_capture(path: Path) -> Iterator[BluetoothServiceInfo]:
+    """Load advertisements from a recorder ring file or a JSON lines capture."""
+    if path.suffix == ".rec":
+        for record in recorder.iter_records(path):
+            yield _service_info(record.address, record.rssi, {record.uuid: record.data})
+        return
+    with path.open(encoding="utf-8") as capture:
+        for line in capture:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield _service_info(
+                record["address"],
+                record["rssi"],
+                {
+                    uuid: bytes.fromhex(payload)
+                    for uuid, payload in record["service_data"].items()
+                },
+            )
+
+
+class Pipeline:
+    """Device data, converter and processor of one device."""
+
+    __slots__ = ("data", "processor")
+
+    def __init__(self) -> None:
+        self.data = device_data.QingBluetoothDeviceData()
+        self.processor = coordinator.QingPassiveBluetoothDataProcessor(
+            sensor.SensorUpdateConverter()
+        )
+        stand_in = StandInCoordinator()
+        stand_in.device_data = self.data
+        self.processor.async_register_coordinator(stand_in, None)
+        self.processor.async_add_listener(lambda data: None)
+
+    def handle(self, service_info: BluetoothServiceInfo) -> None:
+        self.processor.async_handle_update(self.data.update(service_info), True)
+
+
+def _pipelines(service_infos: Iterable[BluetoothServiceInfo]) -> dict[str, Pipeline]:
+    return {service_info.address: Pipeline() for service_info in service_infos}
+
+
+def _percentile(ordered: list[int], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(service_infos: list[BluetoothServiceInfo]) -> dict[str, float]:
+    """Replay the packets and return the measurements."""
+    pipelines = _pipelines(service_infos)
+    # Warm up the per-device caches so the run measures steady state.
+    for service_info in service_infos[: len(pipelines)]:
+        pipelines[service_info.address].handle(service_info)
+
+    latencies = []
+    clock = time.perf_counter_ns
+    gc.collect()
+    start = clock()
+    for service_info in service_infos:
+        pipeline = pipelines[service_info.address]
+        began = clock()
+        pipeline.handle(service_info)
+        latencies.append(clock() - began)
+    elapsed = clock() - start
+    latencies.sort()
+
+    pipelines = _pipelines(service_infos)
+    for service_info in service_infos[: len(pipelines)]:
+        pipelines[service_info.address].handle(service_info)
+    sample = service_infos[: min(len(service_infos), 20_000)]
+    gc.collect()
+    tracemalloc.start()
+    peak = 0
+    blocks = sys.getallocatedblocks()
+    for service_info in sample:
+        pipeline = pipelines[service_info.address]
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        pipeline.handle(service_info)
+        peak += tracemalloc.get_traced_memory()[1] - current
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    return {
+        "packets": len(service_infos),
+        "devices": len(pipelines),
+        "packets_per_second": len(service_infos) / elapsed * 1e9,
+        "p50_us": _percentile(latencies, 0.50) / 1000,
+        "p99_us": _percentile(latencies, 0.99) / 1000,
+        "peak_bytes_per_packet": peak / len(sample),
+        "retained_blocks_per_packet": blocks / len(sample),
+    }
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], tolerance: float
+) -> list[str]:
+    """Return the regressions of results against a baseline."""
+    regressions = []
+    if results["packets_per_second"] < baseline["packets_per_second"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {results['packets_per_second']:.0f} pkt/s,"
+            f" baseline {baseline['packets_per_second']:.0f} pkt/s"
+        )
+    if results["p99_us"] > baseline["p99_us"] * (1 + tolerance):
+        regressions.append(
+            f"p99 {results['p99_us']:.1f} us, baseline {baseline['p99_us']:.1f} us"
+        )
+    return regressions
+
+
+def main() -> int:
+    arguments = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arguments.add_argument("--capture", type=Path, help="JSON lines capture to replay")
+    arguments.add_argument("--devices", type=int, default=200)
+    arguments.add_argument("--packets", type=int, default=200_000)
+    arguments.add_argument(
+        "--repeat", type=float, default=0.5, help="share of repeated advertisements"
+    )
+    arguments.add_argument("--seed", type=int, default=0)
+    arguments.add_argument("--save", type=Path, help="write the results as JSON")
+    arguments.add_argument("--baseline", type=Path, help="results to compare against")
+    arguments.add_argument("--tolerance", type=float, default=0.2)
+    options = arguments.parse_args()
+
+    if options.capture:
+        service_infos = list(load_capture(options.capture))
+    else:
+        service_infos = synthetic_service_infos(
+            options.devices, options.packets, options.repeat, options.seed
+        )
+    results = run(service_infos)
+    print(
+        f"{results['packets']} packets from {results['devices']} devices:"
+        f" {results['packets_per_second']:.0f} pkt/s,"
+        f" p50 {results['p50_us']:.1f} us, p99 {results['p99_us']:.1f} us,"
+        f" {results['peak_bytes_per_packet']:.0f} bytes allocated/packet,"
+        f" {results['retained_blocks_per_packet']:.3f} blocks retained/packet"
+    )
+    if options.save:
+        options.save.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if options.baseline:
+        baseline = json.loads(options.baseline.read_text(encoding="utf-8"))
+        if regressions := compare(results, baseline, options.tolerance):
+            for regression in regressions:
+                print(f"REGRESSION: {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
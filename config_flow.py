@@ -8,24 +8,55 @@ import logging
 from typing import Any
 
 import voluptuous as vol
-from xiaomi_ble.parser import EncryptionScheme
 
 from homeassistant.components import onboarding
 from homeassistant.components.bluetooth import (
     BluetoothScanningMode,
     BluetoothServiceInfo,
     async_discovered_service_info,
+    async_last_service_info,
     async_process_advertisements,
 )
-from homeassistant.config_entries import ConfigFlow, ConfigFlowResult
-from homeassistant.const import CONF_ADDRESS
-
-from .const import DOMAIN
-from .QingBluetoothDeviceData import QingBluetoothDeviceData as DeviceData
+from homeassistant.config_entries import (
+    ConfigEntry,
+    ConfigFlow,
+    ConfigFlowResult,
+    OptionsFlow,
+    OptionsFlowWithConfigEntry,
+)
+from homeassistant.const import CONF_ADDRESS, CONF_NAME
+from homeassistant.core import callback
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    CONF_ADDRESSES,
+    CONF_AGGREGATION_EXTREMES,
+    CONF_AGGREGATION_WINDOW,
+    CONF_BATCH_WINDOW,
+    CONF_BATCH_WRITES,
+    CONF_BINDKEY,
+    CONF_HISTORY,
+    CONF_HUMIDITY_DEADBAND,
+    CONF_KEEP_ALIVE,
+    CONF_MAX_AGE,
+    CONF_MIN_INTERVAL,
+    CONF_POLL_INTERVAL,
+    CONF_RECORD,
+    CONF_SIGNAL_STRENGTH_DEADBAND,
+    CONF_STATISTICS,
+    CONF_TEMPERATURE_DEADBAND,
+    DEFAULT_POLL_INTERVAL,
+    DOMAIN,
+)
+from .discovery import async_get_discovery_matcher, encryption_scheme
+from .parser import UUID_MIBEACON, EncryptionScheme
+from .throttle import DEFAULT_DEADBAND, DEFAULT_MAX_AGE, DEFAULT_MIN_INTERVAL
 
 _LOGGER = logging.getLogger(__name__)
 # How long to wait for additional advertisement packets if we don't have the right ones
 ADDITIONAL_DISCOVERY_TIMEOUT = 60
+# Source of the flows creating the entries of devices selected together.
+SOURCE_BULK = "bulk"
 
 
 @dataclasses.dataclass
@@ -34,11 +65,6 @@ class Discovery:
 
     title: str
     discovery_info: BluetoothServiceInfo
-    device: DeviceData
-
-
-def _title(discovery_info: BluetoothServiceInfo, device: DeviceData) -> str:
-    return device.title or device.get_device_name() or discovery_info.name
 
 
 class RenphoConfigFlow(ConfigFlow, domain=DOMAIN):
@@ -46,37 +72,39 @@ class RenphoConfigFlow(ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        """Return the options flow."""
+        return QingOptionsFlow(config_entry)
+
     def __init__(self) -> None:
         """Initialize the config flow."""
         self._discovery_info: BluetoothServiceInfo | None = None
-        self._discovered_device: DeviceData | None = None
         self._discovered_devices: dict[str, Discovery] = {}
 
     async def async_step_bluetooth(
         self, discovery_info: BluetoothServiceInfo
     ) -> ConfigFlowResult:
         """Handle the bluetooth discovery step."""
-        _LOGGER.warning("*** async_step_bluetooth")
         # 设置的是entry的uniq id,会被setup entry使用
         await self.async_set_unique_id(discovery_info.address)
         self._abort_if_unique_id_configured()
-        device = DeviceData()
-        # if not device.supported(discovery_info):
-        if "Qing" not in discovery_info.name:
+        matcher = await async_get_discovery_matcher(self.hass)
+        if (title := matcher.validate(discovery_info)) is None:
             return self.async_abort(reason="not_supported")
 
-        title = _title(discovery_info, device)
         self.context["title_placeholders"] = {"name": title}
+        self._discovery_info = discovery_info
 
-        self._discovered_device = device
-
+        if (result := await self._async_get_encryption_key()) is not None:
+            return result
         return await self.async_step_bluetooth_confirm()
 
     async def async_step_bluetooth_confirm(
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
         """Confirm discovery."""
-        _LOGGER.warning("*** async_step_bluetooth_confirm")
         if user_input is not None or not onboarding.async_is_onboarded(self.hass):
             return self._async_get_or_create_entry()
 
@@ -89,51 +117,47 @@ class RenphoConfigFlow(ConfigFlow, domain=DOMAIN):
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
-        """Handle the user step to pick discovered device."""
-        _LOGGER.warning("*** async_step_user")
+        """Handle the user step to pick discovered devices."""
+        errors: dict[str, str] = {}
         if user_input is not None:
-            _LOGGER.warning("*** User input:%s", user_input)
-            address = user_input[CONF_ADDRESS]
-            await self.async_set_unique_id(address, raise_on_progress=False)
-            self._abort_if_unique_id_configured()
-            discovery = self._discovered_devices[address]
-            _LOGGER.warning("*** discovery:%s", discovery)
-
-            self.context["title_placeholders"] = {"name": discovery.title}
-
-            self._discovered_device = discovery.device
-
-            # if discovery.device.encryption_scheme == EncryptionScheme.MIBEACON_LEGACY:
-            #     return await self.async_step_get_encryption_key_legacy()
-
-            # if discovery.device.encryption_scheme == EncryptionScheme.MIBEACON_4_5:
-            #     return await self.async_step_get_encryption_key_4_5()
-            _LOGGER.warning("*** goto _async_get_or_create_entry")
-            return self._async_get_or_create_entry()
-
+            addresses: list[str] = user_input[CONF_ADDRESSES]
+            if addresses:
+                address, *others = addresses
+                # Every other device gets a flow of its own that creates its
+                # entry right away, HA sets them up concurrently.
+                for other in others:
+                    self.hass.async_create_task(
+                        self.hass.config_entries.flow.async_init(
+                            DOMAIN,
+                            context={"source": SOURCE_BULK},
+                            data={
+                                CONF_ADDRESS: other,
+                                CONF_NAME: self._discovered_devices[other].title,
+                            },
+                        )
+                    )
+                await self.async_set_unique_id(address, raise_on_progress=False)
+                self._abort_if_unique_id_configured()
+                discovery = self._discovered_devices[address]
+
+                self.context["title_placeholders"] = {"name": discovery.title}
+                self._discovery_info = discovery.discovery_info
+
+                if (result := await self._async_get_encryption_key()) is not None:
+                    return result
+                return self._async_get_or_create_entry()
+            errors["base"] = "no_devices_selected"
+
+        matcher = await async_get_discovery_matcher(self.hass)
         current_addresses = self._async_current_ids()
         for discovery_info in async_discovered_service_info(self.hass, False):
             address = discovery_info.address
             if address in current_addresses or address in self._discovered_devices:
                 continue
-            device = DeviceData()
-            # if device.supported(discovery_info):
-            if "Qing" in discovery_info.name:
+            if (title := matcher.validate(discovery_info)) is not None:
+                _LOGGER.debug("Discovered %s at %s", title, address)
                 self._discovered_devices[address] = Discovery(
-                    title=_title(discovery_info, device),
-                    discovery_info=discovery_info,
-                    device=device,
-                )
-                _LOGGER.warning("Found My Device")
-                _LOGGER.warning("=== Discovery address: %s", address)
-                _LOGGER.warning("=== Man Data: %s", discovery_info.manufacturer_data)
-                _LOGGER.warning("=== advertisement: %s", discovery_info.advertisement)
-                _LOGGER.warning("=== device: %s", discovery_info.device)
-                _LOGGER.warning("=== service data: %s", discovery_info.service_data)
-                _LOGGER.warning("=== service uuids: %s", discovery_info.service_uuids)
-                _LOGGER.warning("=== rssi: %s", discovery_info.rssi)
-                _LOGGER.warning(
-                    "=== advertisement: %s", discovery_info.advertisement.local_name
+                    title=title, discovery_info=discovery_info
                 )
 
         if not self._discovered_devices:
@@ -145,25 +169,185 @@ class RenphoConfigFlow(ConfigFlow, domain=DOMAIN):
         }
         return self.async_show_form(
             step_id="user",
-            data_schema=vol.Schema({vol.Required(CONF_ADDRESS): vol.In(titles)}),
+            data_schema=vol.Schema(
+                {vol.Required(CONF_ADDRESSES): cv.multi_select(titles)}
+            ),
+            errors=errors,
+        )
+
+    async def async_step_bulk(self, discovery: dict[str, str]) -> ConfigFlowResult:
+        """Create the entry of a device selected together with others."""
+        await self.async_set_unique_id(discovery[CONF_ADDRESS], raise_on_progress=False)
+        self._abort_if_unique_id_configured()
+        self.context["title_placeholders"] = {"name": discovery[CONF_NAME]}
+        if discovery_info := async_last_service_info(
+            self.hass, discovery[CONF_ADDRESS], False
+        ):
+            self._discovery_info = discovery_info
+            # Devices that encrypt their readings stay in progress until
+            # their bindkey is entered.
+            if (result := await self._async_get_encryption_key()) is not None:
+                return result
+        return self._async_get_or_create_entry()
+
+    async def _async_get_encryption_key(self) -> ConfigFlowResult | None:
+        """Ask for the bindkey if the device encrypts its readings."""
+        assert self._discovery_info is not None
+        scheme = encryption_scheme(self._discovery_info)
+        if scheme is EncryptionScheme.MIBEACON_LEGACY:
+            return await self.async_step_get_encryption_key_legacy()
+        if scheme is EncryptionScheme.MIBEACON_4_5:
+            return await self.async_step_get_encryption_key_4_5()
+        return None
+
+    async def async_step_get_encryption_key_legacy(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Enter the 24 character bindkey of a MiBeacon v2 or v3 device."""
+        return self._async_step_get_encryption_key(
+            "get_encryption_key_legacy", 24, user_input
+        )
+
+    async def async_step_get_encryption_key_4_5(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Enter the 32 character bindkey of a MiBeacon v4 or v5 device."""
+        return self._async_step_get_encryption_key(
+            "get_encryption_key_4_5", 32, user_input
         )
 
+    def _async_step_get_encryption_key(
+        self, step_id: str, length: int, user_input: dict[str, Any] | None
+    ) -> ConfigFlowResult:
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            bindkey: str = user_input[CONF_BINDKEY].strip()
+            try:
+                key = bytes.fromhex(bindkey)
+            except ValueError:
+                key = b""
+            if len(bindkey) != length or len(key) * 2 != length:
+                errors[CONF_BINDKEY] = f"expected_{length}_characters"
+            elif not self._bindkey_decrypts(key):
+                errors[CONF_BINDKEY] = "decryption_failed"
+            else:
+                return self._async_get_or_create_entry(bindkey.lower())
+
+        return self.async_show_form(
+            step_id=step_id,
+            description_placeholders=self.context["title_placeholders"],
+            data_schema=vol.Schema({vol.Required(CONF_BINDKEY): str}),
+            errors=errors,
+        )
+
+    def _bindkey_decrypts(self, bindkey: bytes) -> bool:
+        """Return True if the bindkey decrypts the last frame of the device."""
+        # Only flows for encrypted devices load the crypto stack.
+        from .decryption import bindkey_decrypts
+
+        assert self._discovery_info is not None
+        address = self._discovery_info.address
+        discovery_info = (
+            async_last_service_info(self.hass, address, False) or self._discovery_info
+        )
+        if (data := discovery_info.service_data.get(UUID_MIBEACON)) is None:
+            return False
+        return bindkey_decrypts(bindkey, address, data)
+
     def _async_get_or_create_entry(
         self, bindkey: str | None = None
     ) -> ConfigFlowResult:
         data: dict[str, Any] = {}
 
         data["hello"] = "world"
+        if bindkey:
+            data[CONF_BINDKEY] = bindkey
 
         if entry_id := self.context.get("entry_id"):
-            _LOGGER.warning("*** _async_get_or_create_entry: %s", entry_id)
             entry = self.hass.config_entries.async_get_entry(entry_id)
             assert entry is not None
-            _LOGGER.warning("*** goto async_update_reload_and_abort: %s", entry)
             return self.async_update_reload_and_abort(entry, data=data)
 
-        _LOGGER.warning("*** goto async_create_entry: %s", data)
         return self.async_create_entry(
             title=self.context["title_placeholders"]["name"],
             data=data,
         )
+
+
+class QingOptionsFlow(OptionsFlowWithConfigEntry):
+    """Handle the options of a device."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Manage polling, connection, recording and state write options."""
+        if user_input is not None:
+            return self.async_create_entry(data=user_input)
+
+        options = self.options
+        seconds = vol.All(vol.Coerce(int), vol.Range(min=0))
+        deadband = vol.All(vol.Coerce(float), vol.Range(min=0))
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_POLL_INTERVAL,
+                        default=options.get(CONF_POLL_INTERVAL, DEFAULT_POLL_INTERVAL),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=60)),
+                    vol.Optional(
+                        CONF_KEEP_ALIVE, default=options.get(CONF_KEEP_ALIVE, 0)
+                    ): seconds,
+                    vol.Optional(
+                        CONF_MIN_INTERVAL,
+                        default=options.get(CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL),
+                    ): seconds,
+                    vol.Optional(
+                        CONF_MAX_AGE,
+                        default=options.get(CONF_MAX_AGE, DEFAULT_MAX_AGE),
+                    ): seconds,
+                    vol.Optional(
+                        CONF_TEMPERATURE_DEADBAND,
+                        default=options.get(
+                            CONF_TEMPERATURE_DEADBAND, DEFAULT_DEADBAND["temperature"]
+                        ),
+                    ): deadband,
+                    vol.Optional(
+                        CONF_HUMIDITY_DEADBAND,
+                        default=options.get(
+                            CONF_HUMIDITY_DEADBAND, DEFAULT_DEADBAND["humidity"]
+                        ),
+                    ): deadband,
+                    vol.Optional(
+                        CONF_SIGNAL_STRENGTH_DEADBAND,
+                        default=options.get(
+                            CONF_SIGNAL_STRENGTH_DEADBAND,
+                            DEFAULT_DEADBAND["signal_strength"],
+                        ),
+                    ): deadband,
+                    vol.Optional(
+                        CONF_BATCH_WRITES, default=options.get(CONF_BATCH_WRITES, False)
+                    ): bool,
+                    vol.Optional(
+                        CONF_BATCH_WINDOW, default=options.get(CONF_BATCH_WINDOW, 0.0)
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                    vol.Optional(
+                        CONF_AGGREGATION_WINDOW,
+                        default=options.get(CONF_AGGREGATION_WINDOW, 0),
+                    ): seconds,
+                    vol.Optional(
+                        CONF_AGGREGATION_EXTREMES,
+                        default=options.get(CONF_AGGREGATION_EXTREMES, False),
+                    ): bool,
+                    vol.Optional(
+                        CONF_RECORD, default=options.get(CONF_RECORD, False)
+                    ): bool,
+                    vol.Optional(
+                        CONF_STATISTICS, default=options.get(CONF_STATISTICS, False)
+                    ): bool,
+                    vol.Optional(
+                        CONF_HISTORY, default=options.get(CONF_HISTORY, False)
+                    ): bool,
+                }
+            ),
+        )
@@ -6,13 +6,42 @@ from typing import Final, TypedDict
 
 DOMAIN = "qing_ble"
 
+# Shared objects kept in hass.data[DOMAIN] next to the per-entry coordinators
+DATA_POLL_ARBITER: Final = "poll_arbiter"
+DATA_GATT_CACHE: Final = "gatt_cache"
+DATA_KEEP_ALIVE_POOL: Final = "keep_alive_pool"
+DATA_DISPATCHER: Final = "dispatcher"
+DATA_DISCOVERY: Final = "discovery"
+DATA_SETUP_LIMIT: Final = "setup_limit"
+DATA_STORE: Final = "store"
+DATA_WRITE_BATCHERS: Final = "write_batchers"
 
+
+CONF_ADDRESSES: Final = "addresses"
+CONF_BINDKEY: Final = "bindkey"
+CONF_BATCH_WRITES: Final = "batch_writes"
+CONF_BATCH_WINDOW: Final = "batch_window"
+CONF_AGGREGATION_WINDOW: Final = "aggregation_window"
+CONF_AGGREGATION_EXTREMES: Final = "aggregation_extremes"
 CONF_DISCOVERED_EVENT_CLASSES: Final = "known_events"
+CONF_POLL_INTERVAL: Final = "poll_interval"
 CONF_EVENT_PROPERTIES: Final = "event_properties"
 CONF_EVENT_CLASS: Final = "event_class"
+CONF_KEEP_ALIVE: Final = "keep_alive"
+CONF_MIN_INTERVAL: Final = "min_interval"
+CONF_MAX_AGE: Final = "max_age"
+CONF_HISTORY: Final = "history"
+CONF_TEMPERATURE_DEADBAND: Final = "temperature_deadband"
+CONF_HUMIDITY_DEADBAND: Final = "humidity_deadband"
+CONF_SIGNAL_STRENGTH_DEADBAND: Final = "signal_strength_deadband"
+CONF_RECORD: Final = "record"
 CONF_SLEEPY_DEVICE: Final = "sleepy_device"
+CONF_STATISTICS: Final = "statistics"
 CONF_SUBTYPE: Final = "subtype"
 
+# Battery and firmware change over hours, not seconds.
+DEFAULT_POLL_INTERVAL: Final = 6 * 60 * 60
+
 EVENT_CLASS: Final = "event_class"
 EVENT_TYPE: Final = "event_type"
 EVENT_SUBTYPE: Final = "event_subtype"
@@ -58,3 +87,13 @@ class XiaomiBleEvent(TypedDict):
     event_class: str  # ie 'button'
     event_type: str  # ie 'press'
     event_properties: dict[str, str | int | float | None] | None
+
+
+def format_event_dispatcher_name(address: str, event_class: str) -> str:
+    """Format an event dispatcher name."""
+    return f"{DOMAIN}_event_{address}_{event_class}"
+
+
+def format_discovered_event_class(address: str) -> str:
+    """Format a discovered event class."""
+    return f"{DOMAIN}_discovered_event_class_{address}"
@@ -0,0 +1,58 @@
+"""Rate limited debug logging for the advertisement hot path."""
+
+from __future__ import annotations
+
+import logging
+from time import monotonic
+
+# Sustained messages per second and burst size, per device.
+DEFAULT_RATE = 0.2
+DEFAULT_BURST = 5
+
+
+class DebugChannel:
+    """Token bucket per device in front of a logger's debug level.
+
+    The channel is open while the logger is enabled for DEBUG, so it can be
+    toggled at runtime with the ``logger.set_level`` service. Callers guard
+    any formatting or object construction behind :meth:`allow`, which is a
+    single cached level check while the channel is closed.
+    """
+
+    __slots__ = ("_logger", "_rate", "_burst", "_buckets")
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+    ) -> None:
+        """Initialize the channel."""
+        self._logger = logger
+        self._rate = rate
+        self._burst = burst
+        # key -> [tokens, last refill]
+        self._buckets: dict[str | None, list[float]] = {}
+
+    def allow(self, key: str | None) -> bool:
+        """Take a token for key, returning False if the message should be dropped."""
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return False
+        now = monotonic()
+        if (bucket := self._buckets.get(key)) is None:
+            self._buckets[key] = [self._burst - 1, now]
+            return True
+        tokens = min(self._burst, bucket[0] + (now - bucket[1]) * self._rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def forget(self, key: str | None) -> None:
+        """Drop the bucket for key."""
+        self._buckets.pop(key, None)
+
+
+DEBUG_LOG = DebugChannel(logging.getLogger(__package__))
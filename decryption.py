@@ -0,0 +1,159 @@
+"""Decryption of encrypted MiBeacon frames for Qing BLE devices."""
+
+from __future__ import annotations
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESCCM
+
+from .parser import (
+    DECODERS,
+    UUID_MIBEACON,
+    MIBEACON_FLAG_MAC,
+    EncryptionScheme,
+    Reading,
+    decode_mibeacon_events,
+    decode_mibeacon_objects,
+    mibeacon_encryption,
+    mibeacon_payload_offset,
+)
+
+# Fixed bytes completing a 12 byte legacy bindkey to an AES-128 key.
+_LEGACY_KEY_FILL = bytes.fromhex("8d3d3c97")
+_ASSOCIATED_DATA = b"\x11"
+# Frame counters remembered to drop repeated and replayed frames.
+REPLAY_WINDOW = 8
+
+_NO_READINGS: tuple[Reading, ...] = ()
+_decode_plaintext = DECODERS[UUID_MIBEACON]
+
+
+def bindkey_scheme(bindkey: bytes) -> EncryptionScheme | None:
+    """Return the encryption scheme a bindkey is for, None if it is invalid."""
+    if len(bindkey) == 12:
+        return EncryptionScheme.MIBEACON_LEGACY
+    if len(bindkey) == 16:
+        return EncryptionScheme.MIBEACON_4_5
+    return None
+
+
+def bindkey_decrypts(bindkey: bytes, address: str, data: bytes) -> bool:
+    """Return True if a bindkey decrypts an encrypted MiBeacon frame.
+
+    The CCM tag of v4 and v5 frames proves the key, whatever objects the
+    frame carries. Legacy frames have no usable tag, the key is taken as
+    right if the decrypted objects parse to readings or events.
+    """
+    decryptor = MiBeaconDecryptor(bindkey, address)
+    readings = decryptor.decode(data)
+    if (payload := decryptor.payload) is None:
+        return False
+    if decryptor.scheme is EncryptionScheme.MIBEACON_4_5:
+        return True
+    return bool(readings or decode_mibeacon_events(payload, 0))
+
+
+class MiBeaconDecryptor:
+    """Decrypt and decode the MiBeacon frames of one device.
+
+    The module loads the crypto stack, so it is only imported for devices
+    with a bindkey. The cipher is set up once from the bindkey. Frames
+    whose counter was seen recently are dropped before any crypto work,
+    which covers both the repeats every device sends and replayed frames.
+    """
+
+    __slots__ = (
+        "scheme",
+        "_mac",
+        "_ccm",
+        "_aes",
+        "_seen",
+        "_next",
+        "payload",
+        "decrypted",
+        "replayed",
+        "failed",
+    )
+
+    def __init__(self, bindkey: bytes, address: str) -> None:
+        """Initialize the decryptor, the bindkey being 12 or 16 bytes."""
+        if (scheme := bindkey_scheme(bindkey)) is None:
+            raise ValueError("A bindkey is 12 or 16 bytes long")
+        self.scheme = scheme
+        # Device address as it appears in frames, least significant first.
+        self._mac = bytes.fromhex(address.replace(":", ""))[::-1]
+        self._ccm: AESCCM | None = None
+        self._aes: algorithms.AES | None = None
+        if scheme is EncryptionScheme.MIBEACON_4_5:
+            self._ccm = AESCCM(bindkey, tag_length=4)
+        else:
+            self._aes = algorithms.AES(bindkey[:6] + _LEGACY_KEY_FILL + bindkey[6:])
+        self._seen = [-1] * REPLAY_WINDOW
+        self._next = 0
+        # Plaintext objects of the last frame decrypted by decode(), if any.
+        self.payload: bytes | None = None
+        self.decrypted = 0
+        self.replayed = 0
+        self.failed = 0
+
+    def decode(self, data: bytes) -> tuple[Reading, ...]:
+        """Decode a MiBeacon frame, decrypting it if needed."""
+        self.payload = None
+        if (scheme := mibeacon_encryption(data)) is EncryptionScheme.NONE:
+            return _decode_plaintext(data)
+        if scheme is not self.scheme or (offset := mibeacon_payload_offset(data)) < 0:
+            return _NO_READINGS
+        if scheme is EncryptionScheme.MIBEACON_4_5:
+            # Payload, 3 byte counter extension, 4 byte tag.
+            if len(data) < offset + 9:
+                return _NO_READINGS
+            counter = data[4] | int.from_bytes(data[-7:-4], "little") << 8
+        else:
+            # Payload, 3 byte counter extension, 1 byte tag.
+            if len(data) < offset + 7:
+                return _NO_READINGS
+            counter = data[4] | int.from_bytes(data[-4:-1], "little") << 8
+        if counter in self._seen:
+            self.replayed += 1
+            return _NO_READINGS
+        if scheme is EncryptionScheme.MIBEACON_4_5:
+            payload = self._decrypt_4_5(data, offset)
+        else:
+            payload = self._decrypt_legacy(data, offset)
+        if payload is None:
+            self.failed += 1
+            return _NO_READINGS
+        self._seen[self._next] = counter
+        self._next = (self._next + 1) % REPLAY_WINDOW
+        self.decrypted += 1
+        self.payload = payload
+        return decode_mibeacon_objects(payload, 0)
+
+    def _frame_mac(self, data: bytes) -> bytes:
+        if data[0] & MIBEACON_FLAG_MAC:
+            return data[5:11]
+        return self._mac
+
+    def _decrypt_4_5(self, data: bytes, offset: int) -> bytes | None:
+        assert self._ccm is not None
+        nonce = self._frame_mac(data) + data[2:5] + data[-7:-4]
+        try:
+            return self._ccm.decrypt(
+                nonce, data[offset:-7] + data[-4:], _ASSOCIATED_DATA
+            )
+        except InvalidTag:
+            return None
+
+    def _decrypt_legacy(self, data: bytes, offset: int) -> bytes:
+        """Decrypt a legacy frame.
+
+        Legacy frames carry no usable tag, so the CCM payload is decrypted
+        as the CTR stream it is. A wrong key shows as objects that do not
+        parse.
+        """
+        assert self._aes is not None
+        nonce = data[0:5] + data[-4:-1] + self._frame_mac(data)[:-1]
+        # CCM counter block of the first payload block, 13 byte nonce.
+        counter_block = b"\x01" + nonce + b"\x00\x01"
+        decryptor = Cipher(self._aes, modes.CTR(counter_block)).decryptor()
+        return decryptor.update(data[offset:-4]) + decryptor.finalize()
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from xiaomi_ble import DeviceKey
+from sensor_state_data import DeviceKey
 
 from homeassistant.components.bluetooth.passive_update_processor import (
     PassiveBluetoothEntityKey,
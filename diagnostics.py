@@ -0,0 +1,87 @@
+"""Diagnostics support for Qing BLE."""
+
+from __future__ import annotations
+
+from time import monotonic
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    CONF_BATCH_WINDOW,
+    CONF_BATCH_WRITES,
+    CONF_BINDKEY,
+    DATA_DISPATCHER,
+    DATA_POLL_ARBITER,
+    DATA_WRITE_BATCHERS,
+    DOMAIN,
+)
+from .parser import FIELD_COUNT
+from .QingActiveBluetoothProcessorCoordinator import (
+    QingActiveBluetoothProcessorCoordinator,
+)
+
+TO_REDACT = {CONF_BINDKEY}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    domain_data = hass.data[DOMAIN]
+    coordinator: QingActiveBluetoothProcessorCoordinator = domain_data[entry.entry_id]
+    device_data = coordinator.device_data
+    state = device_data.state
+    dispatcher = domain_data[DATA_DISPATCHER]
+    diagnostics: dict[str, Any] = {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "state": {
+            "readings": [state.reading(field) for field in range(FIELD_COUNT)],
+            "rssi": state.rssi,
+            "last_poll": state.last_poll,
+            "last_poll_success": state.last_poll_success,
+            "poll_failures": device_data.poll_scheduler.failures,
+            "next_poll": device_data.poll_scheduler.next_poll,
+            "signal": state.signal.as_dict(monotonic()),
+            "interval": state.interval.as_dict(),
+        },
+        "statistics": (
+            None if device_data.stats is None else device_data.stats.as_dict()
+        ),
+        "poll_arbiter": domain_data[DATA_POLL_ARBITER].metrics(),
+        "dispatcher": {
+            "devices": len(dispatcher),
+            "dispatched": dispatcher.dispatched,
+            "unmatched": dispatcher.unmatched,
+            "repeated": dispatcher.repeated,
+        },
+        "events": {
+            "fired": coordinator.event_gate.fired,
+            "coalesced": coordinator.event_gate.coalesced,
+            "dropped": coordinator.event_gate.dropped,
+        },
+    }
+    if (decryptor := device_data.decryptor) is not None:
+        diagnostics["decryption"] = {
+            "scheme": decryptor.scheme,
+            "decrypted": decryptor.decrypted,
+            "replayed": decryptor.replayed,
+            "failed": decryptor.failed,
+        }
+    if entry.options.get(CONF_BATCH_WRITES, False):
+        batcher = domain_data[DATA_WRITE_BATCHERS][
+            entry.options.get(CONF_BATCH_WINDOW, 0.0)
+        ]
+        diagnostics["write_batcher"] = batcher.metrics()
+    if (recorder := coordinator.recorder) is not None:
+        diagnostics["recorder"] = {
+            "path": str(recorder.path),
+            "recorded": recorder.recorded,
+            "dropped": recorder.dropped,
+        }
+    return diagnostics
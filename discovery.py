@@ -0,0 +1,128 @@
+"""Discovery matching for Qing BLE devices."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+
+from homeassistant.core import HomeAssistant
+from homeassistant.loader import async_get_integration
+
+from .const import DATA_DISCOVERY, DOMAIN
+from .parser import (
+    DECODERS,
+    MIBEACON_PRODUCTS,
+    UUID_MIBEACON,
+    EncryptionScheme,
+    mibeacon_encryption,
+    mibeacon_product_id,
+)
+
+# Advertised names of devices that may not have sent decodable service
+# data yet.
+NAME_PREFIXES = ("Qing",)
+# Confirmed addresses remembered, the least recently validated are dropped.
+MAX_FOUND = 256
+
+
+class DiscoveryMatcher:
+    """Screen advertisements for Qing devices.
+
+    The manifest matchers are compiled into sets, so unrelated devices are
+    rejected with a few set and prefix tests before anything is allocated.
+    Candidates are then confirmed with the payload decoder, and the last
+    MAX_FOUND confirmed addresses are remembered with their title.
+    """
+
+    __slots__ = ("service_data_uuids", "manufacturer_ids", "name_prefixes", "_found")
+
+    def __init__(
+        self,
+        service_data_uuids: Iterable[str],
+        manufacturer_ids: Iterable[int] = (),
+        name_prefixes: Iterable[str] = NAME_PREFIXES,
+    ) -> None:
+        """Initialize the matcher."""
+        self.service_data_uuids = frozenset(service_data_uuids)
+        self.manufacturer_ids = frozenset(manufacturer_ids)
+        self.name_prefixes = tuple(name_prefixes)
+        # address -> title, insertion ordered, least recently used first.
+        self._found: dict[str, str] = {}
+
+    @classmethod
+    def from_manifest(cls, matchers: Iterable[Mapping[str, Any]]) -> DiscoveryMatcher:
+        """Compile the bluetooth matchers of a manifest."""
+        service_data_uuids = set()
+        manufacturer_ids = set()
+        name_prefixes = set(NAME_PREFIXES)
+        for matcher in matchers:
+            if uuid := matcher.get("service_data_uuid"):
+                service_data_uuids.add(uuid)
+            if (manufacturer_id := matcher.get("manufacturer_id")) is not None:
+                manufacturer_ids.add(manufacturer_id)
+            if local_name := matcher.get("local_name"):
+                name_prefixes.add(local_name.rstrip("*"))
+        return cls(service_data_uuids, manufacturer_ids, sorted(name_prefixes))
+
+    def matches(self, service_info: BluetoothServiceInfo) -> bool:
+        """Return True if an advertisement may come from a Qing device."""
+        return (
+            not self.service_data_uuids.isdisjoint(service_info.service_data)
+            or (
+                bool(self.manufacturer_ids)
+                and not self.manufacturer_ids.isdisjoint(service_info.manufacturer_data)
+            )
+            or service_info.name.startswith(self.name_prefixes)
+        )
+
+    def validate(self, service_info: BluetoothServiceInfo) -> str | None:
+        """Return the title of a Qing device, or None if it is not one."""
+        address = service_info.address
+        if (title := self._found.pop(address, None)) is not None:
+            self._found[address] = title
+            return title
+        if not self.matches(service_info):
+            return None
+        # Service data UUIDs like the MiBeacon one are shared with other
+        # products, so the payload has to decode, unless the name says so.
+        # Encrypted MiBeacon frames are decoded once a bindkey is entered,
+        # they are only taken from the products the decoder knows.
+        service_data = service_info.service_data
+        if (
+            not service_info.name.startswith(self.name_prefixes)
+            and not any(
+                decoder(data)
+                for uuid, data in service_data.items()
+                if (decoder := DECODERS.get(uuid)) is not None
+            )
+            and not (
+                encryption_scheme(service_info) is not EncryptionScheme.NONE
+                and mibeacon_product_id(service_data[UUID_MIBEACON])
+                in MIBEACON_PRODUCTS
+            )
+        ):
+            return None
+        if len(self._found) >= MAX_FOUND:
+            del self._found[next(iter(self._found))]
+        title = self._found[address] = service_info.name or address
+        return title
+
+
+async def async_get_discovery_matcher(hass: HomeAssistant) -> DiscoveryMatcher:
+    """Return the matcher compiled from the manifest, shared by all flows."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if (matcher := domain_data.get(DATA_DISCOVERY)) is None:
+        integration = await async_get_integration(hass, DOMAIN)
+        matcher = domain_data[DATA_DISCOVERY] = DiscoveryMatcher.from_manifest(
+            integration.manifest.get("bluetooth", [])
+        )
+    return matcher
+
+
+def encryption_scheme(service_info: BluetoothServiceInfo) -> EncryptionScheme:
+    """Return how the readings in an advertisement are encrypted."""
+    if (data := service_info.service_data.get(UUID_MIBEACON)) is None:
+        return EncryptionScheme.NONE
+    return mibeacon_encryption(data)
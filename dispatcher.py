@@ -0,0 +1,106 @@
+"""Shared advertisement dispatcher for all Qing BLE devices."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+
+from homeassistant.components.bluetooth import (
+    BluetoothCallbackMatcher,
+    BluetoothChange,
+    BluetoothScanningMode,
+    BluetoothServiceInfoBleak,
+    async_last_service_info,
+    async_register_callback,
+)
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .parser import SERVICE_DATA_UUIDS
+
+AdvertisementHandler = Callable[[BluetoothServiceInfoBleak, BluetoothChange], None]
+
+
+class AdvertisementDispatcher:
+    """Route advertisements to per-device handlers.
+
+    The bluetooth manager gets one callback per manifest service data UUID,
+    however many devices are configured, and advertisements are routed to
+    the device handler through a dict keyed by address. An advertisement
+    carrying several of the UUIDs matches several callbacks, it is only
+    dispatched once.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        mode: BluetoothScanningMode = BluetoothScanningMode.PASSIVE,
+    ) -> None:
+        """Initialize the dispatcher."""
+        self._hass = hass
+        self._mode = mode
+        self._handlers: dict[str, AdvertisementHandler] = {}
+        # address -> service info dispatched last
+        self._last: dict[str, BluetoothServiceInfoBleak] = {}
+        self._unsubs: list[CALLBACK_TYPE] = []
+        self.dispatched = 0
+        self.unmatched = 0
+        self.repeated = 0
+
+    def __len__(self) -> int:
+        """Return the number of registered devices."""
+        return len(self._handlers)
+
+    @callback
+    def _async_start(self) -> None:
+        for uuid in SERVICE_DATA_UUIDS:
+            self._unsubs.append(
+                async_register_callback(
+                    self._hass,
+                    self._async_dispatch,
+                    BluetoothCallbackMatcher(service_data_uuid=uuid, connectable=False),
+                    self._mode,
+                )
+            )
+
+    @callback
+    def _async_stop(self) -> None:
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs.clear()
+
+    @callback
+    def _async_dispatch(
+        self, service_info: BluetoothServiceInfoBleak, change: BluetoothChange
+    ) -> None:
+        address = service_info.address
+        if (handler := self._handlers.get(address)) is None:
+            self.unmatched += 1
+            return
+        if self._last.get(address) is service_info:
+            self.repeated += 1
+            return
+        self._last[address] = service_info
+        self.dispatched += 1
+        handler(service_info, change)
+
+    @callback
+    def async_register(
+        self, address: str, handler: AdvertisementHandler
+    ) -> CALLBACK_TYPE:
+        """Register the advertisement handler of a device."""
+        self._handlers[address] = handler
+        if not self._unsubs:
+            # The manager replays the last advertisement of every matching
+            # device when the callbacks are registered.
+            self._async_start()
+        elif service_info := async_last_service_info(self._hass, address, False):
+            handler(service_info, BluetoothChange.ADVERTISEMENT)
+
+        @callback
+        def _async_unregister() -> None:
+            if self._handlers.get(address) is handler:
+                del self._handlers[address]
+                self._last.pop(address, None)
+            if not self._handlers:
+                self._async_stop()
+
+        return _async_unregister
@@ -0,0 +1,48 @@
+"""Event rate limiting for Qing BLE devices."""
+
+from __future__ import annotations
+
+# The same event again within this many seconds is one event. It catches
+# repeats with a new frame counter, like a motion sensor that re-triggers.
+COALESCE_WINDOW = 0.5
+# Events a device may fire in a burst, and per second after that.
+EVENT_BURST = 10
+EVENT_RATE = 2.0
+
+
+class EventGate:
+    """Coalesce and rate limit the events of one device.
+
+    A device that floods the air with events, or a faulty one, can not
+    flood the event bus and the automations listening to it.
+    """
+
+    __slots__ = ("_last", "_tokens", "_refilled", "fired", "coalesced", "dropped")
+
+    def __init__(self) -> None:
+        """Initialize the gate."""
+        # (event class, event type) -> monotonic time it last passed
+        self._last: dict[tuple[str, str], float] = {}
+        self._tokens = float(EVENT_BURST)
+        self._refilled = 0.0
+        self.fired = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def allow(self, event_class: str, event_type: str, now: float) -> bool:
+        """Return True if an event should be fired."""
+        key = (event_class, event_type)
+        if (last := self._last.get(key)) is not None and now - last < COALESCE_WINDOW:
+            self.coalesced += 1
+            return False
+        self._tokens = min(
+            float(EVENT_BURST), self._tokens + (now - self._refilled) * EVENT_RATE
+        )
+        self._refilled = now
+        if self._tokens < 1:
+            self.dropped += 1
+            return False
+        self._tokens -= 1
+        self._last[key] = now
+        self.fired += 1
+        return True
@@ -0,0 +1,293 @@
+"""Fleet history export for Qing BLE devices.
+
+The histories of all devices are written as columns, one file per sensor
+class, each holding a row of HISTORY_SIZE samples per device::
+
+    addresses.bin    <6s  address of every device, sorted
+    times.bin        <I   sample times
+    temperature.bin  <h   readings in hundredths, likewise for
+    humidity.bin          humidity and battery
+    battery.bin
+
+Every file starts with a <4sHH header: magic, devices and samples per
+device. Empty slots and missing readings keep the values ReadingHistory
+uses. A column loads with the standard library, or with
+numpy.fromfile(path, "<i2", offset=8).reshape(devices, samples).
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Sequence
+from itertools import compress
+import json
+import math
+from operator import countOf, mul
+from pathlib import Path
+import statistics
+import struct
+import sys
+from typing import Any, NamedTuple
+
+import voluptuous as vol
+
+from homeassistant.core import (
+    Config,
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+
+from .const import DOMAIN
+from .history import (
+    HISTORY_EMPTY,
+    HISTORY_FIELDS,
+    HISTORY_MISSING,
+    HISTORY_SCALE,
+    HISTORY_SIZE,
+)
+from .parser import BATTERY, HUMIDITY, TEMPERATURE
+
+SERVICE_EXPORT_HISTORY = "export_history"
+ATTR_DIRECTORY = "directory"
+EXPORT_DIRECTORY = f"{DOMAIN}_export"
+ADDRESS_FILE = "addresses.bin"
+TIMES_FILE = "times.bin"
+COLUMN_FILES = {
+    TEMPERATURE: "temperature.bin",
+    HUMIDITY: "humidity.bin",
+    BATTERY: "battery.bin",
+}
+TABLE_MAGIC = b"QBC1"
+TABLE_HEADER = struct.Struct("<4sHH")
+TEMPERATURE_PERCENTILES = (5, 50, 95)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+EXPORT_HISTORY_SCHEMA = vol.Schema(
+    {vol.Optional(ATTR_DIRECTORY, default=EXPORT_DIRECTORY): cv.string}
+)
+
+# address -> (times, rows) as returned by ReadingHistory.snapshot
+Histories = dict[str, tuple[array, array]]
+
+
+class HistoryTable(NamedTuple):
+    """Histories of the fleet, one row of HISTORY_SIZE samples per device."""
+
+    addresses: list[str]
+    times: array
+    # field -> readings in hundredths
+    columns: dict[int, array]
+
+
+def history_table(histories: Histories) -> HistoryTable:
+    """Return the histories as columns, devices sorted by address."""
+    addresses = sorted(histories)
+    times = array("I")
+    columns = {field: array("h") for field in HISTORY_FIELDS}
+    width = len(HISTORY_FIELDS)
+    for address in addresses:
+        device_times, rows = histories[address]
+        times += device_times
+        for index, field in enumerate(HISTORY_FIELDS):
+            columns[field] += rows[index::width]
+    return HistoryTable(addresses, times, columns)
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "little":
+        return values.tobytes()
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def write_history_table(directory: Path, table: HistoryTable) -> None:
+    """Write the columns of the table, one file each."""
+    header = TABLE_HEADER.pack(TABLE_MAGIC, len(table.addresses), HISTORY_SIZE)
+    (directory / ADDRESS_FILE).write_bytes(
+        header
+        + b"".join(
+            bytes.fromhex(address.replace(":", "")) for address in table.addresses
+        )
+    )
+    (directory / TIMES_FILE).write_bytes(header + _little_endian(table.times))
+    for field, name in COLUMN_FILES.items():
+        (directory / name).write_bytes(header + _little_endian(table.columns[field]))
+
+
+def _read_column(path: Path) -> tuple[int, memoryview]:
+    data = path.read_bytes()
+    magic, devices, samples = TABLE_HEADER.unpack_from(data)
+    if magic != TABLE_MAGIC or samples != HISTORY_SIZE:
+        raise ValueError(f"{path} is not a history column")
+    return devices, memoryview(data)[TABLE_HEADER.size :]
+
+
+def read_history_table(directory: Path) -> HistoryTable:
+    """Read the columns of a table back."""
+    devices, data = _read_column(directory / ADDRESS_FILE)
+    addresses = [
+        ":".join(f"{octet:02X}" for octet in data[offset : offset + 6])
+        for offset in range(0, devices * 6, 6)
+    ]
+    columns: dict[str, array] = {}
+    for name, typecode in (
+        (TIMES_FILE, "I"),
+        *((name, "h") for name in COLUMN_FILES.values()),
+    ):
+        column = columns[name] = array(typecode)
+        column.frombytes(_read_column(directory / name)[1])
+        if sys.byteorder != "little":
+            column.byteswap()
+    return HistoryTable(
+        addresses,
+        columns[TIMES_FILE],
+        {field: columns[name] for field, name in COLUMN_FILES.items()},
+    )
+
+
+def _seen(times: memoryview, readings: memoryview) -> tuple[list[int], list[int]]:
+    """Return the times and readings of the samples with a reading."""
+    seen = list(map(HISTORY_MISSING.__ne__, readings))
+    return list(compress(times, seen)), list(compress(readings, seen))
+
+
+def _drain_per_day(times: Sequence[int], levels: Sequence[int]) -> float | None:
+    """Return the least squares battery drop per day, None below two samples.
+
+    Times are whole seconds and levels hundredths, so the sums are exact.
+    """
+    count = len(levels)
+    if count < 2:
+        return None
+    time_sum = sum(times)
+    variance = count * sum(map(mul, times, times)) - time_sum * time_sum
+    if not variance:
+        return None
+    covariance = count * sum(map(mul, times, levels)) - time_sum * sum(levels)
+    return _number(-covariance / variance * SECONDS_PER_DAY / HISTORY_SCALE)
+
+
+def _percentiles(readings: Sequence[int]) -> dict[str, float | None]:
+    """Return the percentiles of readings in hundredths.
+
+    Values between ranks are interpolated linearly from the closest two.
+    """
+    if not readings:
+        cuts: Sequence[float | None] = [None] * len(TEMPERATURE_PERCENTILES)
+    elif len(readings) == 1:
+        cuts = [readings[0] / HISTORY_SCALE] * len(TEMPERATURE_PERCENTILES)
+    else:
+        quantiles = statistics.quantiles(readings, n=100, method="inclusive")
+        cuts = [
+            quantiles[percentile - 1] / HISTORY_SCALE
+            for percentile in TEMPERATURE_PERCENTILES
+        ]
+    return {
+        f"p{percentile}": _number(cut)
+        for percentile, cut in zip(TEMPERATURE_PERCENTILES, cuts)
+    }
+
+
+def export_history(directory: Path, histories: Histories) -> dict[str, Any]:
+    """Write the histories as columns and return their summary.
+
+    The summary holds the battery drain of every device, the percentiles
+    of its temperature and those of the whole fleet. Devices are read as
+    slices of the columns, without copying them.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    table = history_table(histories)
+    write_history_table(directory, table)
+
+    times = memoryview(table.times)
+    temperature = memoryview(table.columns[TEMPERATURE])
+    battery = memoryview(table.columns[BATTERY])
+    devices: dict[str, Any] = {}
+    for index, address in enumerate(table.addresses):
+        device = slice(index * HISTORY_SIZE, (index + 1) * HISTORY_SIZE)
+        device_times = times[device]
+        devices[address] = {
+            "samples": HISTORY_SIZE - countOf(device_times, HISTORY_EMPTY),
+            "battery_drain_per_day": _drain_per_day(
+                *_seen(device_times, battery[device])
+            ),
+            "temperature_percentiles": _percentiles(
+                list(filter(HISTORY_MISSING.__ne__, temperature[device]))
+            ),
+        }
+    summary = {
+        "directory": str(directory),
+        "files": [ADDRESS_FILE, TIMES_FILE, *COLUMN_FILES.values()],
+        "devices": devices,
+        "temperature_percentiles": _percentiles(
+            list(filter(HISTORY_MISSING.__ne__, temperature))
+        ),
+    }
+    (directory / "summary.json").write_text(json.dumps(summary, indent=2))
+    return summary
+
+
+def export_directory(config: Config, directory: str) -> Path:
+    """Return the folder to export to, relative to the configuration directory.
+
+    A folder outside of it has to be in allowlist_external_dirs. This does
+    blocking I/O.
+    """
+    path = Path(config.path(directory)).resolve()
+    if not path.is_relative_to(
+        Path(config.config_dir).resolve()
+    ) and not config.is_allowed_path(str(path)):
+        raise HomeAssistantError(
+            f"Cannot export to {path}, it is outside the configuration directory"
+            " and not in allowlist_external_dirs"
+        )
+    return path
+
+
+def _number(value: float | None) -> float | None:
+    return None if value is None or math.isnan(value) else round(value, 3)
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the export service, once for all entries."""
+    if hass.services.has_service(DOMAIN, SERVICE_EXPORT_HISTORY):
+        return
+
+    async def _async_export_history(call: ServiceCall) -> ServiceResponse:
+        domain_data = hass.data.get(DOMAIN, {})
+        histories: Histories = {}
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            if (coordinator := domain_data.get(entry.entry_id)) is None:
+                continue
+            if (history := coordinator.device_data.state.history) is None or (
+                snapshot := history.snapshot()
+            ) is None:
+                continue
+            histories[coordinator.address] = snapshot
+        if not histories:
+            raise HomeAssistantError(
+                "No device with the history option has readings to export yet"
+            )
+
+        def _export() -> dict[str, Any]:
+            return export_history(
+                export_directory(hass.config, call.data[ATTR_DIRECTORY]), histories
+            )
+
+        summary = await hass.async_add_executor_job(_export)
+        return summary if call.return_response else None
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_EXPORT_HISTORY,
+        _async_export_history,
+        schema=EXPORT_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
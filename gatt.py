@@ -0,0 +1,146 @@
+"""GATT handle cache and connection reuse for Qing BLE devices."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Protocol
+
+if TYPE_CHECKING:
+    from bleak import BleakClient
+    from bleak.backends.service import BleakGATTServiceCollection
+
+BATTERY_LEVEL_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
+FIRMWARE_REVISION_UUID = "00002a26-0000-1000-8000-00805f9b34fb"
+
+# Idle connections kept open at once across all devices.
+DEFAULT_KEEP_ALIVE_CONNECTIONS = 3
+
+
+class KeepAliveDevice(Protocol):
+    """A device whose idle connection can be closed by the pool."""
+
+    def schedule_disconnect(self) -> None:
+        """Close the idle connection in the background."""
+
+
+class GattHandles:
+    """Characteristic handles of one device, valid for one firmware version."""
+
+    __slots__ = ("firmware", "battery", "firmware_revision", "services")
+
+    def __init__(
+        self,
+        battery: int | None,
+        firmware_revision: int | None,
+        services: BleakGATTServiceCollection | None = None,
+    ) -> None:
+        """Initialize the handles."""
+        self.firmware: str | None = None
+        self.battery = battery
+        self.firmware_revision = firmware_revision
+        self.services = services
+
+
+class GattHandleCache:
+    """Remember where the polled characteristics live on each device.
+
+    The first connection resolves the characteristics from the discovered
+    services. Later polls pass the cached services to the connector and
+    read the handles directly. A firmware change drops the entry, because
+    the handles may have moved.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the cache."""
+        self._handles: dict[str, GattHandles] = {}
+
+    def get(self, address: str) -> GattHandles | None:
+        """Return the cached handles of a device."""
+        return self._handles.get(address)
+
+    def restore(self, address: str, handles: GattHandles) -> None:
+        """Cache handles stored by a previous run, without their services."""
+        self._handles.setdefault(address, handles)
+
+    def invalidate(self, address: str) -> None:
+        """Forget the handles of a device."""
+        self._handles.pop(address, None)
+
+    def discover(
+        self, address: str, services: BleakGATTServiceCollection
+    ) -> GattHandles:
+        """Resolve and cache the handles of a device from its services."""
+        battery = services.get_characteristic(BATTERY_LEVEL_UUID)
+        firmware_revision = services.get_characteristic(FIRMWARE_REVISION_UUID)
+        handles = self._handles[address] = GattHandles(
+            battery.handle if battery else None,
+            firmware_revision.handle if firmware_revision else None,
+            services,
+        )
+        return handles
+
+
+async def async_read_handles(
+    client: BleakClient, handles: GattHandles
+) -> tuple[int | None, str | None]:
+    """Read battery level and firmware revision in one connection window."""
+    battery: int | None = None
+    firmware: str | None = None
+    if handles.firmware_revision is not None:
+        payload = await client.read_gatt_char(handles.firmware_revision)
+        firmware = bytes(payload).rstrip(b"\x00").decode("utf-8", "replace")
+    if handles.battery is not None:
+        payload = await client.read_gatt_char(handles.battery)
+        if payload:
+            battery = payload[0]
+    return battery, firmware
+
+
+class KeepAlivePool:
+    """Cap the number of idle connections kept open across all devices.
+
+    Devices hand their connection to the pool after a poll, along with the
+    adapter or proxy it goes through. When the pool is full, or when a
+    poll needs the connection slot an idle connection holds, the least
+    recently used idle connection is closed and its device goes back to
+    connecting for every poll.
+    """
+
+    def __init__(self, limit: int = DEFAULT_KEEP_ALIVE_CONNECTIONS) -> None:
+        """Initialize the pool."""
+        self.limit = limit
+        # device -> source, insertion ordered, least recently used first.
+        self._idle: dict[KeepAliveDevice, str | None] = {}
+
+    def __len__(self) -> int:
+        """Return the number of idle connections."""
+        return len(self._idle)
+
+    def keep(self, device: KeepAliveDevice, source: str | None = None) -> bool:
+        """Take an idle connection, returning False if it should be closed."""
+        self._idle.pop(device, None)
+        if self.limit <= 0:
+            return False
+        while len(self._idle) >= self.limit:
+            self.release_idle()
+        self._idle[device] = source
+        return True
+
+    def forget(self, device: KeepAliveDevice) -> None:
+        """Drop a device whose connection is in use or closed."""
+        self._idle.pop(device, None)
+
+    def source(self, device: KeepAliveDevice) -> str | None:
+        """Return the source the idle connection of a device goes through."""
+        return self._idle.get(device)
+
+    def idle_on(self, source: str) -> int:
+        """Return the number of idle connections through a source."""
+        return sum(1 for idle_source in self._idle.values() if idle_source == source)
+
+    def release_idle(self, source: str | None = None) -> None:
+        """Close the least recently used idle connection, on source if given."""
+        for device, idle_source in self._idle.items():
+            if source is None or idle_source == source:
+                del self._idle[device]
+                device.schedule_disconnect()
+                return
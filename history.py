@@ -0,0 +1,72 @@
+"""Recent reading history of Qing BLE devices, for fleet exports."""
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Sequence
+import math
+
+from .parser import BATTERY, HUMIDITY, TEMPERATURE
+
+# Fields kept in the history, the columns of a history row.
+HISTORY_FIELDS = (TEMPERATURE, HUMIDITY, BATTERY)
+# Seconds between history samples, and samples kept: one week.
+HISTORY_INTERVAL = 15 * 60.0
+HISTORY_SIZE = 7 * 24 * 4
+# Readings are kept in hundredths, as 16 bit integers.
+HISTORY_SCALE = 100
+# Stored value of a reading not seen yet, and time of an empty slot.
+HISTORY_MISSING = -(2**15)
+HISTORY_EMPTY = 0
+
+
+class ReadingHistory:
+    """Ring of the readings of one device, sampled every HISTORY_INTERVAL.
+
+    Times are whole wall clock seconds as unsigned 32 bit integers, values
+    are hundredths as signed 16 bit integers, HISTORY_MISSING meaning not
+    seen yet. The arrays are allocated on the first sample so devices
+    without readings cost nothing.
+    """
+
+    __slots__ = ("times", "values", "_next", "next_due")
+
+    def __init__(self) -> None:
+        """Initialize the history."""
+        self.times: array[int] | None = None
+        self.values: array[int] | None = None
+        self._next = 0
+        self.next_due = 0.0
+
+    def record(self, now: float, readings: Sequence[float]) -> None:
+        """Add a sample of the readings if one is due."""
+        if now < self.next_due:
+            return
+        self.next_due = now + HISTORY_INTERVAL
+        if self.times is None or self.values is None:
+            self.times = array("I", [HISTORY_EMPTY]) * HISTORY_SIZE
+            self.values = array("h", [HISTORY_MISSING]) * (
+                HISTORY_SIZE * len(HISTORY_FIELDS)
+            )
+        slot = self._next
+        self.times[slot] = int(now)
+        row = slot * len(HISTORY_FIELDS)
+        for column, field in enumerate(HISTORY_FIELDS):
+            value = readings[field]
+            self.values[row + column] = (
+                HISTORY_MISSING
+                if math.isnan(value)
+                else min(max(round(value * HISTORY_SCALE), -(2**15) + 1), 2**15 - 1)
+            )
+        self._next = (slot + 1) % HISTORY_SIZE
+
+    def snapshot(self) -> tuple[array[int], array[int]] | None:
+        """Return copies of the times and rows, oldest first, None if empty."""
+        if self.times is None or self.values is None:
+            return None
+        slot = self._next
+        row = slot * len(HISTORY_FIELDS)
+        return (
+            self.times[slot:] + self.times[:slot],
+            self.values[row:] + self.values[:row],
+        )
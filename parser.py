@@ -0,0 +1,325 @@
+"""Decoder for Qing BLE service data payloads.
+
+Every advertisement passes through here on the event loop, so decoding is
+table driven: the service data UUID selects a decoder and each decoder unpacks
+its fields with a precompiled ``struct.Struct``. Decoders return a tuple of
+``(field, value)`` readings, the field being one of the constants below.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from enum import StrEnum
+import struct
+
+UUID_BODY_COMPOSITION = "0000181b-0000-1000-8000-00805f9b34fb"
+UUID_WEIGHT_SCALE = "0000181d-0000-1000-8000-00805f9b34fb"
+UUID_QING = "0000fd50-0000-1000-8000-00805f9b34fb"
+UUID_MIBEACON = "0000fe95-0000-1000-8000-00805f9b34fb"
+
+SERVICE_DATA_UUIDS = (
+    UUID_BODY_COMPOSITION,
+    UUID_WEIGHT_SCALE,
+    UUID_QING,
+    UUID_MIBEACON,
+)
+
+TEMPERATURE = 0
+HUMIDITY = 1
+BATTERY = 2
+MASS = 3
+MASS_NON_STABILIZED = 4
+IMPEDANCE = 5
+ILLUMINANCE = 6
+FIELD_COUNT = 7
+
+Reading = tuple[int, float]
+
+_NO_READINGS: tuple[Reading, ...] = ()
+
+POUND_TO_KILOGRAM = 0.45359237
+CATTY_TO_KILOGRAM = 0.5
+
+# Weight Scale (Mi Scale v1): control byte, weight, 7 bytes of date/time.
+_SCALE_V1 = struct.Struct("<BH7x")
+# Body Composition (Mi Scale v2): 2 control bytes, 7 bytes of date/time,
+# impedance, weight.
+_SCALE_V2 = struct.Struct("<BB7xHH")
+# Qing native frame: version, frame counter, temperature (0.01 °C),
+# humidity (0.01 %), battery (%).
+_QING_V1 = struct.Struct("<BBhHB")
+QING_FRAME_VERSION = 1
+
+# MiBeacon header: frame control, product id, frame counter.
+_MIBEACON_HEADER = struct.Struct("<HHB")
+_MIBEACON_OBJECT = struct.Struct("<HB")
+_INT16 = struct.Struct("<h")
+_UINT16 = struct.Struct("<H")
+_TEMPERATURE_HUMIDITY = struct.Struct("<hH")
+_UINT24 = struct.Struct("<HB")
+
+MIBEACON_FLAG_ENCRYPTED = 0x08
+MIBEACON_FLAG_MAC = 0x10
+MIBEACON_FLAG_CAPABILITY = 0x20
+MIBEACON_FLAG_OBJECT = 0x40
+MIBEACON_CAPABILITY_IO = 0x20
+# Frames of versions 2 and 3 use the legacy encryption.
+MIBEACON_LEGACY_MAX_VERSION = 3
+
+# MiBeacon product id -> model, of the devices whose objects are decoded.
+MIBEACON_PRODUCTS = {
+    0x0098: "HHCCJCY01",
+    0x0153: "YLYK01YL",
+    0x01AA: "LYWSDCGQ",
+    0x0347: "CGG1",
+    0x0387: "MHO-C401",
+    0x045B: "LYWSD02",
+    0x055B: "LYWSD03MMC",
+    0x0576: "CGD1",
+    0x066F: "CGDK2",
+    0x07F6: "MJYD02YL",
+    0x0863: "RTCGQ02LM",
+    0x0B48: "CGG1-ENCRYPTED",
+    0x16E4: "LYWSD02MMC",
+    0x2832: "MJWSD05MMC",
+}
+
+
+class EncryptionScheme(StrEnum):
+    """How the readings of a frame are encrypted."""
+
+    NONE = "none"
+    MIBEACON_LEGACY = "mibeacon_legacy"
+    MIBEACON_4_5 = "mibeacon_4_5"
+
+
+def _scale_mass(control: int, raw: int) -> float:
+    """Convert a raw scale reading to kilograms."""
+    if control & 0x01:
+        return raw / 100 * POUND_TO_KILOGRAM
+    if control & 0x10:
+        return raw / 100 * CATTY_TO_KILOGRAM
+    return raw / 200
+
+
+def _decode_weight_scale(data: bytes) -> tuple[Reading, ...]:
+    """Decode a Weight Scale (0x181d) payload."""
+    if len(data) != _SCALE_V1.size:
+        return _NO_READINGS
+    control, raw = _SCALE_V1.unpack(data)
+    mass = _scale_mass(control, raw)
+    if control & 0x20 and not control & 0x80:
+        return ((MASS_NON_STABILIZED, mass), (MASS, mass))
+    return ((MASS_NON_STABILIZED, mass),)
+
+
+def _decode_body_composition(data: bytes) -> tuple[Reading, ...]:
+    """Decode a Body Composition (0x181b) payload."""
+    if len(data) != _SCALE_V2.size:
+        return _NO_READINGS
+    unit, control, impedance, raw = _SCALE_V2.unpack(data)
+    mass = _scale_mass((unit & 0x01) | (control & 0x40) >> 2, raw)
+    if not control & 0x20 or control & 0x80:
+        # Not stabilized yet, or the person stepped off the scale.
+        return ((MASS_NON_STABILIZED, mass),)
+    if control & 0x02:
+        return (
+            (MASS_NON_STABILIZED, mass),
+            (MASS, mass),
+            (IMPEDANCE, float(impedance)),
+        )
+    return ((MASS_NON_STABILIZED, mass), (MASS, mass))
+
+
+def _decode_qing(data: bytes) -> tuple[Reading, ...]:
+    """Decode a Qing native (0xfd50) payload."""
+    if len(data) < _QING_V1.size or data[0] != QING_FRAME_VERSION:
+        return _NO_READINGS
+    _, _, temperature, humidity, battery = _QING_V1.unpack_from(data)
+    return (
+        (TEMPERATURE, temperature / 100),
+        (HUMIDITY, humidity / 100),
+        (BATTERY, float(battery)),
+    )
+
+
+def _object_temperature(data: bytes, offset: int) -> tuple[Reading, ...]:
+    return ((TEMPERATURE, _INT16.unpack_from(data, offset)[0] / 10),)
+
+
+def _object_humidity(data: bytes, offset: int) -> tuple[Reading, ...]:
+    return ((HUMIDITY, _UINT16.unpack_from(data, offset)[0] / 10),)
+
+
+def _object_battery(data: bytes, offset: int) -> tuple[Reading, ...]:
+    return ((BATTERY, float(data[offset])),)
+
+
+def _object_temperature_humidity(data: bytes, offset: int) -> tuple[Reading, ...]:
+    temperature, humidity = _TEMPERATURE_HUMIDITY.unpack_from(data, offset)
+    return ((TEMPERATURE, temperature / 10), (HUMIDITY, humidity / 10))
+
+
+def _object_illuminance(data: bytes, offset: int) -> tuple[Reading, ...]:
+    low, high = _UINT24.unpack_from(data, offset)
+    return ((ILLUMINANCE, float(low | high << 16)),)
+
+
+# MiBeacon object id -> (minimum payload length, decoder)
+MIBEACON_OBJECTS: dict[int, tuple[int, Callable[[bytes, int], tuple[Reading, ...]]]] = {
+    0x1004: (2, _object_temperature),
+    0x1006: (2, _object_humidity),
+    0x1007: (3, _object_illuminance),
+    0x100A: (1, _object_battery),
+    0x100D: (4, _object_temperature_humidity),
+}
+
+
+# An event is an (event class, event type) pair.
+ParsedEvent = tuple[str, str]
+
+_NO_EVENTS: tuple[ParsedEvent, ...] = ()
+
+_BUTTON_PRESSES = ("press", "double_press", "long_press")
+_LOCK_ACTIONS = {
+    0x00: "unlock_outside_the_door",
+    0x01: "locked",
+    0x02: "turn_on_antilock",
+    0x03: "release_the_antilock",
+    0x04: "unlock_inside_the_door",
+    0x05: "lock_inside_the_door",
+    0x06: "turn_on_child_lock",
+    0x07: "turn_off_child_lock",
+    0x08: "lock_outside_the_door",
+    0x0F: "abnormal",
+}
+
+
+def _event_button(data: bytes, offset: int) -> ParsedEvent | None:
+    press = data[offset + 2]
+    if press >= len(_BUTTON_PRESSES):
+        return None
+    return ("button", _BUTTON_PRESSES[press])
+
+
+def _event_motion(data: bytes, offset: int) -> ParsedEvent | None:
+    return ("motion", "motion_detected")
+
+
+def _event_lock(data: bytes, offset: int) -> ParsedEvent | None:
+    if (action := _LOCK_ACTIONS.get(data[offset] & 0x0F)) is None:
+        return None
+    return ("lock", action)
+
+
+# MiBeacon object id -> (minimum payload length, event decoder)
+MIBEACON_EVENTS: dict[int, tuple[int, Callable[[bytes, int], ParsedEvent | None]]] = {
+    0x0003: (1, _event_motion),
+    0x000B: (1, _event_lock),
+    0x000F: (3, _event_motion),
+    0x1001: (3, _event_button),
+}
+
+
+def mibeacon_payload_offset(data: bytes) -> int:
+    """Return the offset of the first object in a MiBeacon frame, or -1."""
+    if len(data) < _MIBEACON_HEADER.size:
+        return -1
+    frame_control = data[0]
+    offset = _MIBEACON_HEADER.size
+    if frame_control & MIBEACON_FLAG_MAC:
+        offset += 6
+    if frame_control & MIBEACON_FLAG_CAPABILITY:
+        if len(data) <= offset:
+            return -1
+        if data[offset] & MIBEACON_CAPABILITY_IO:
+            offset += 2
+        offset += 1
+    return offset
+
+
+def mibeacon_encryption(data: bytes) -> EncryptionScheme:
+    """Return the encryption scheme of a MiBeacon frame with objects."""
+    if (
+        len(data) < _MIBEACON_HEADER.size
+        or not data[0] & MIBEACON_FLAG_OBJECT
+        or not data[0] & MIBEACON_FLAG_ENCRYPTED
+    ):
+        return EncryptionScheme.NONE
+    if data[1] >> 4 <= MIBEACON_LEGACY_MAX_VERSION:
+        return EncryptionScheme.MIBEACON_LEGACY
+    return EncryptionScheme.MIBEACON_4_5
+
+
+def mibeacon_product_id(data: bytes) -> int | None:
+    """Return the product id of a MiBeacon frame, None if it is too short."""
+    if len(data) < _MIBEACON_HEADER.size:
+        return None
+    return _MIBEACON_HEADER.unpack_from(data)[1]
+
+
+def decode_mibeacon_objects(data: bytes, offset: int) -> tuple[Reading, ...]:
+    """Decode the plaintext object list of a MiBeacon frame."""
+    readings = _NO_READINGS
+    end = len(data)
+    objects = MIBEACON_OBJECTS
+    while offset + _MIBEACON_OBJECT.size <= end:
+        object_id, length = _MIBEACON_OBJECT.unpack_from(data, offset)
+        offset += _MIBEACON_OBJECT.size
+        if offset + length > end:
+            break
+        entry = objects.get(object_id)
+        if entry is not None and length >= entry[0]:
+            readings += entry[1](data, offset)
+        offset += length
+    return readings
+
+
+def decode_mibeacon_events(data: bytes, offset: int) -> tuple[ParsedEvent, ...]:
+    """Decode the events in the plaintext object list of a MiBeacon frame."""
+    events = _NO_EVENTS
+    end = len(data)
+    decoders = MIBEACON_EVENTS
+    while offset + _MIBEACON_OBJECT.size <= end:
+        object_id, length = _MIBEACON_OBJECT.unpack_from(data, offset)
+        offset += _MIBEACON_OBJECT.size
+        if offset + length > end:
+            break
+        entry = decoders.get(object_id)
+        if (
+            entry is not None
+            and length >= entry[0]
+            and (event := entry[1](data, offset)) is not None
+        ):
+            events += (event,)
+        offset += length
+    return events
+
+
+def _decode_mibeacon(data: bytes) -> tuple[Reading, ...]:
+    """Decode an unencrypted MiBeacon (0xfe95) payload."""
+    if len(data) < _MIBEACON_HEADER.size:
+        return _NO_READINGS
+    frame_control = data[0]
+    if not frame_control & MIBEACON_FLAG_OBJECT or (
+        frame_control & MIBEACON_FLAG_ENCRYPTED
+    ):
+        return _NO_READINGS
+    if (offset := mibeacon_payload_offset(data)) < 0:
+        return _NO_READINGS
+    return decode_mibeacon_objects(data, offset)
+
+
+DECODERS: dict[str, Callable[[bytes], tuple[Reading, ...]]] = {
+    UUID_BODY_COMPOSITION: _decode_body_composition,
+    UUID_WEIGHT_SCALE: _decode_weight_scale,
+    UUID_QING: _decode_qing,
+    UUID_MIBEACON: _decode_mibeacon,
+}
+
+
+def parse_service_data(uuid: str, data: bytes) -> tuple[Reading, ...]:
+    """Decode one service data entry into readings."""
+    if (decoder := DECODERS.get(uuid)) is None:
+        return _NO_READINGS
+    return decoder(data)
@@ -0,0 +1,219 @@
+"""Poll scheduling for Qing BLE devices."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from heapq import heappop, heappush
+from itertools import count
+import random
+from time import monotonic
+from typing import Any
+
+# Retry delay after the first failed poll, doubled for every further failure
+# up to the poll interval.
+RETRY_BASE = 60.0
+# Fraction of the interval added as random jitter to every scheduled poll.
+JITTER_FRACTION = 0.1
+# First polls after startup are spread over this many seconds.
+STARTUP_SPREAD = 600.0
+# How long a started poll holds off further polls until it reports back.
+POLL_TIMEOUT = 120.0
+# Concurrent GATT connections allowed per adapter or proxy.
+DEFAULT_ADAPTER_CONNECTIONS = 2
+
+
+class PollScheduler:
+    """Decide when a device should be polled over GATT.
+
+    Polls run every ``interval`` seconds plus jitter, back off exponentially
+    while they fail, and are spread out at startup so devices do not all
+    connect at once.
+    """
+
+    __slots__ = ("interval", "failures", "_not_before")
+
+    def __init__(self, interval: float, start_spread: float = STARTUP_SPREAD) -> None:
+        """Initialize the scheduler."""
+        self.interval = interval
+        self.failures = 0
+        self._not_before = monotonic() + random.uniform(0, min(interval, start_spread))
+
+    def _jitter(self) -> float:
+        return random.uniform(0, self.interval * JITTER_FRACTION)
+
+    @property
+    def next_poll(self) -> float:
+        """Return the monotonic time of the next poll."""
+        return self._not_before
+
+    def delay(self, seconds: float) -> None:
+        """Hold off the next poll for at least seconds from now."""
+        self._not_before = max(self._not_before, monotonic() + seconds)
+
+    def poll_needed(self) -> bool:
+        """Return True if a poll is due, reserving it if so."""
+        now = monotonic()
+        if now < self._not_before:
+            return False
+        self._not_before = now + POLL_TIMEOUT
+        return True
+
+    def poll_skipped(self) -> None:
+        """Record that a due poll was not needed after all."""
+        self._not_before = monotonic() + self.interval + self._jitter()
+
+    def poll_succeeded(self) -> None:
+        """Record a successful poll."""
+        self.failures = 0
+        self._not_before = monotonic() + self.interval + self._jitter()
+
+    def poll_failed(self) -> None:
+        """Record a failed poll and back off."""
+        self.failures += 1
+        backoff = min(RETRY_BASE * 2 ** (self.failures - 1), self.interval)
+        self._not_before = monotonic() + backoff + self._jitter()
+
+
+class _AdapterSlots:
+    """Connection slots of one adapter."""
+
+    __slots__ = ("active", "waiters")
+
+    def __init__(self) -> None:
+        self.active = 0
+        # [-urgency, sequence, future], most urgent first
+        self.waiters: list[list[Any]] = []
+
+
+class PollArbiter:
+    """Bound concurrent GATT connections per adapter across all entries.
+
+    Waiters are served most urgent first, urgency being the number of
+    seconds since the device was last polled successfully. Idle connections
+    kept open on an adapter count against its slots, one is closed when a
+    poll needs its slot.
+    """
+
+    def __init__(self, limit: int = DEFAULT_ADAPTER_CONNECTIONS) -> None:
+        """Initialize the arbiter."""
+        self.limit = limit
+        # Number of idle connections kept open on an adapter, and the call
+        # closing one of them when a poll needs the slot.
+        self.idle_connections: Callable[[str], int] | None = None
+        self.on_contention: Callable[[str], None] | None = None
+        self._adapters: dict[str, _AdapterSlots] = {}
+        self._sequence = count()
+        self.acquired = 0
+        self.waited = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _slots(self, adapter: str) -> _AdapterSlots:
+        if (slots := self._adapters.get(adapter)) is None:
+            slots = self._adapters[adapter] = _AdapterSlots()
+        return slots
+
+    def queue_depth(self, adapter: str | None = None) -> int:
+        """Return the number of polls waiting for a slot."""
+        if adapter is None:
+            adapters = list(self._adapters.values())
+        elif adapter in self._adapters:
+            adapters = [self._adapters[adapter]]
+        else:
+            return 0
+        return sum(
+            1 for slots in adapters for waiter in slots.waiters if not waiter[2].done()
+        )
+
+    def _idle(self, adapter: str) -> int:
+        if self.idle_connections is None:
+            return 0
+        return self.idle_connections(adapter)
+
+    def free_slots(self, adapter: str) -> int:
+        """Return the free connection slots of an adapter, less its queue."""
+        free = self.limit - self._idle(adapter)
+        if (slots := self._adapters.get(adapter)) is None:
+            return free
+        return free - slots.active - self.queue_depth(adapter)
+
+    def metrics(self) -> dict[str, Any]:
+        """Return queue depth and wait time metrics."""
+        return {
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "queue_depth": self.queue_depth(),
+            "wait_time_max": self.wait_time_max,
+            "wait_time_mean": (
+                self.wait_time_total / self.waited if self.waited else 0.0
+            ),
+            "adapters": {
+                adapter: {
+                    "active": slots.active,
+                    "idle": self._idle(adapter),
+                    "queue_depth": self.queue_depth(adapter),
+                }
+                for adapter, slots in self._adapters.items()
+            },
+        }
+
+    def _make_room(self, adapter: str, reuses_idle: bool) -> None:
+        """Close idle connections on adapter until the taken slots fit."""
+        if self.on_contention is None:
+            return
+        idle = self._idle(adapter) - (1 if reuses_idle else 0)
+        for _ in range(self._adapters[adapter].active + idle - self.limit):
+            self.on_contention(adapter)
+
+    async def _async_acquire(
+        self, adapter: str, urgency: float, reuses_idle: bool
+    ) -> None:
+        slots = self._slots(adapter)
+        self.acquired += 1
+        if slots.active < self.limit and not slots.waiters:
+            slots.active += 1
+            self._make_room(adapter, reuses_idle)
+            return
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heappush(slots.waiters, [-urgency, next(self._sequence), future])
+        start = monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation.
+                self._release(adapter)
+            raise
+        # Connections kept open while waiting may hold the slot handed over.
+        self._make_room(adapter, reuses_idle)
+        waited = monotonic() - start
+        self.waited += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+
+    def _release(self, adapter: str) -> None:
+        slots = self._adapters[adapter]
+        while slots.waiters:
+            future = heappop(slots.waiters)[2]
+            if not future.done():
+                # Hand the slot straight to the next waiter.
+                future.set_result(None)
+                return
+        slots.active -= 1
+
+    @asynccontextmanager
+    async def async_slot(
+        self, adapter: str, urgency: float, reuses_idle: bool = False
+    ) -> AsyncIterator[None]:
+        """Hold a connection slot on adapter for the duration of the block.
+
+        A poll that reuses its own idle connection on the adapter does not
+        count that connection against the slot it takes.
+        """
+        await self._async_acquire(adapter, urgency, reuses_idle)
+        try:
+            yield
+        finally:
+            self._release(adapter)
@@ -0,0 +1,249 @@
+"""Advertisement recorder for Qing BLE devices.
+
+Advertisements are appended to a fixed size ring file made of segments::
+
+    segment header  <QI   sequence number, bytes used
+    record          <H    length of the record body
+                    <d6sbH  timestamp, address, RSSI, 16-bit service UUID
+                    ...   raw service data
+
+Sequence 0 marks a segment that was never written. When the last segment
+fills up the writer wraps around and overwrites the oldest one, so the
+file always holds the most recent traffic. Only the event loop side of
+the recorder packs records, the file is written from a background thread.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+import logging
+import mmap
+import os
+from pathlib import Path
+from queue import SimpleQueue
+import struct
+import threading
+from typing import NamedTuple
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+
+_LOGGER = logging.getLogger(__name__)
+
+SEGMENT_HEADER = struct.Struct("<QI")
+RECORD_LENGTH = struct.Struct("<H")
+RECORD = struct.Struct("<d6sbH")
+
+BLUETOOTH_BASE_UUID_SUFFIX = "-0000-1000-8000-00805f9b34fb"
+
+DEFAULT_SEGMENT_SIZE = 1 << 20
+DEFAULT_SEGMENTS = 16
+# Records waiting for the writer before new ones are dropped.
+MAX_PENDING = 10_000
+
+# Queued to stop the writer, records are never empty.
+_STOP = b""
+
+
+class Record(NamedTuple):
+    """One service data entry of a recorded advertisement."""
+
+    timestamp: float
+    address: str
+    rssi: int
+    uuid: str
+    data: bytes
+
+
+def _pack_address(address: str) -> bytes:
+    return bytes.fromhex(address.replace(":", ""))
+
+
+def _unpack_address(address: bytes) -> str:
+    return ":".join(f"{octet:02X}" for octet in address)
+
+
+def _uuid16(uuid: str) -> int | None:
+    if len(uuid) != 36 or not uuid.endswith(BLUETOOTH_BASE_UUID_SUFFIX):
+        return None
+    return int(uuid[4:8], 16)
+
+
+def _uuid128(uuid: int) -> str:
+    return f"0000{uuid:04x}{BLUETOOTH_BASE_UUID_SUFFIX}"
+
+
+class AdvertisementRecorder:
+    """Append advertisements to a ring file from a background thread."""
+
+    def __init__(
+        self,
+        path: Path,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        segments: int = DEFAULT_SEGMENTS,
+    ) -> None:
+        """Initialize the recorder, call start to open the file."""
+        self.path = path
+        self.segment_size = segment_size
+        self.segments = segments
+        self.recorded = 0
+        self.dropped = 0
+        self._queue: SimpleQueue[bytes] = SimpleQueue()
+        self._addresses: dict[str, bytes] = {}
+        self._thread: threading.Thread | None = None
+
+    def record(self, service_info: BluetoothServiceInfo, timestamp: float) -> None:
+        """Queue the service data of an advertisement for writing."""
+        if self._thread is None:
+            return
+        if self._queue.qsize() >= MAX_PENDING:
+            self.dropped += 1
+            return
+        if (address := self._addresses.get(service_info.address)) is None:
+            try:
+                address = _pack_address(service_info.address)
+            except ValueError:
+                # Not a MAC address, like the UUIDs macOS hands out.
+                self.dropped += 1
+                return
+            self._addresses[service_info.address] = address
+        rssi = max(-128, min(127, service_info.rssi))
+        put = self._queue.put
+        for uuid, data in service_info.service_data.items():
+            if (uuid16 := _uuid16(uuid)) is None:
+                continue
+            body = RECORD.pack(timestamp, address, rssi, uuid16) + data
+            put(RECORD_LENGTH.pack(len(body)) + body)
+            self.recorded += 1
+
+    def start(self) -> None:
+        """Open the file and start the writer thread."""
+        file = _open_ring(self.path, self.segment_size, self.segments)
+        self._thread = threading.Thread(
+            target=self._write, args=(file,), name=f"qing_ble recorder {self.path.name}"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write out the queued records and stop the writer, this blocks."""
+        if (thread := self._thread) is None:
+            return
+        self._thread = None
+        self._queue.put(_STOP)
+        thread.join()
+
+    def _write(self, file: int) -> None:
+        segment_size = self.segment_size
+        capacity = segment_size - SEGMENT_HEADER.size
+        segment, sequence, used = _last_segment(file, segment_size, self.segments)
+        queue = self._queue
+        try:
+            while True:
+                # Block for the first record, then take whatever queued up
+                # meanwhile and write it with one call per segment.
+                record = queue.get()
+                batch: list[bytes] = []
+                start = used
+                while record:
+                    if used + len(record) > capacity:
+                        _write_batch(file, segment, segment_size, start, batch)
+                        _write_header(file, segment, segment_size, sequence, used)
+                        segment = (segment + 1) % self.segments
+                        sequence += 1
+                        start = used = 0
+                        batch = []
+                        # Claim the oldest segment before overwriting it, so
+                        # readers never mix its old and new records.
+                        _write_header(file, segment, segment_size, sequence, used)
+                    batch.append(record)
+                    used += len(record)
+                    if queue.empty():
+                        break
+                    record = queue.get()
+                if batch:
+                    _write_batch(file, segment, segment_size, start, batch)
+                    _write_header(file, segment, segment_size, sequence, used)
+                if not record:
+                    return
+        except OSError as err:
+            _LOGGER.error("Stopped recording to %s: %s", self.path, err)
+        finally:
+            os.close(file)
+
+
+def _open_ring(path: Path, segment_size: int, segments: int) -> int:
+    file = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if os.fstat(file).st_size != segment_size * segments:
+        # New file, or one recorded with another geometry.
+        os.ftruncate(file, 0)
+        os.ftruncate(file, segment_size * segments)
+    return file
+
+
+def _write_batch(
+    file: int, segment: int, segment_size: int, start: int, batch: list[bytes]
+) -> None:
+    os.pwrite(
+        file, b"".join(batch), segment * segment_size + SEGMENT_HEADER.size + start
+    )
+
+
+def _write_header(
+    file: int, segment: int, segment_size: int, sequence: int, used: int
+) -> None:
+    os.pwrite(file, SEGMENT_HEADER.pack(sequence, used), segment * segment_size)
+
+
+def _last_segment(file: int, segment_size: int, segments: int) -> tuple[int, int, int]:
+    """Return the segment, sequence and bytes used to continue writing at."""
+    last = (0, 1, 0)
+    for segment in range(segments):
+        header = os.pread(file, SEGMENT_HEADER.size, segment * segment_size)
+        sequence, used = SEGMENT_HEADER.unpack(header)
+        if sequence >= last[1]:
+            last = (segment, sequence, used)
+    return last
+
+
+def iter_records(
+    path: Path, segment_size: int = DEFAULT_SEGMENT_SIZE
+) -> Iterator[Record]:
+    """Iterate over the records of a ring file, oldest first.
+
+    The file is memory mapped, so only the pages being read are loaded.
+    """
+    with open(path, "rb") as file:
+        if not (size := os.fstat(file.fileno()).st_size):
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            headers = []
+            for start in range(0, size - segment_size + 1, segment_size):
+                sequence, used = SEGMENT_HEADER.unpack_from(mapped, start)
+                if sequence:
+                    headers.append((sequence, start, used))
+            headers.sort()
+            unpack_length = RECORD_LENGTH.unpack_from
+            unpack_record = RECORD.unpack_from
+            addresses: dict[bytes, str] = {}
+            uuids: dict[int, str] = {}
+            for _, start, used in headers:
+                offset = start + SEGMENT_HEADER.size
+                end = offset + min(used, segment_size - SEGMENT_HEADER.size)
+                while offset + RECORD_LENGTH.size <= end:
+                    (length,) = unpack_length(mapped, offset)
+                    offset += RECORD_LENGTH.size
+                    if length < RECORD.size or offset + length > end:
+                        break
+                    timestamp, address, rssi, uuid = unpack_record(mapped, offset)
+                    if (text := addresses.get(address)) is None:
+                        text = addresses[address] = _unpack_address(address)
+                    if (uuid_text := uuids.get(uuid)) is None:
+                        uuid_text = uuids[uuid] = _uuid128(uuid)
+                    yield Record(
+                        timestamp,
+                        text,
+                        rssi,
+                        uuid_text,
+                        mapped[offset + RECORD.size : offset + length],
+                    )
+                    offset += length
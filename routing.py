@@ -0,0 +1,96 @@
+"""Poll routing over the adapters and proxies that hear a Qing BLE device."""
+
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from typing import Any, TypeVar
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+# Weight of a new sample in the smoothed RSSI of a source.
+RSSI_SMOOTHING = 0.25
+# A source not heard from for this long no longer counts as hearing it.
+SOURCE_STALE = 10 * 60.0
+# Sources a poll is tried through before it fails.
+MAX_POLL_ATTEMPTS = 3
+
+
+class SignalHistory:
+    """Smoothed RSSI of one device as heard by each adapter or proxy.
+
+    Home Assistant forwards the advertisements of a device from one source
+    at a time, so the samples come both from the advertisements and from
+    what every scanner reports when a poll is routed.
+    """
+
+    __slots__ = ("_sources",)
+
+    def __init__(self) -> None:
+        """Initialize the history."""
+        # source -> [smoothed RSSI, monotonic time of the last sample]
+        self._sources: dict[str, list[float]] = {}
+
+    def record(self, source: str, rssi: float, now: float) -> None:
+        """Add an RSSI sample of a source."""
+        if (entry := self._sources.get(source)) is None:
+            self._sources[source] = [rssi, now]
+            return
+        entry[0] += RSSI_SMOOTHING * (rssi - entry[0])
+        entry[1] = now
+
+    def rssi(self, source: str, now: float) -> float | None:
+        """Return the smoothed RSSI of a source, None if it went quiet."""
+        if (entry := self._sources.get(source)) is None or (
+            now - entry[1] > SOURCE_STALE
+        ):
+            return None
+        return entry[0]
+
+    def rank(
+        self,
+        candidates: Iterable[tuple[str, _T]],
+        free_slots: Callable[[str], int],
+        now: float,
+    ) -> list[tuple[str, _T]]:
+        """Order sources to poll through, best first.
+
+        Sources with a free connection slot go first, then the stronger
+        recent signal wins.
+        """
+
+        def _key(candidate: tuple[str, _T]) -> tuple[bool, float]:
+            source = candidate[0]
+            rssi = self.rssi(source, now)
+            return (
+                free_slots(source) > 0,
+                float("-inf") if rssi is None else rssi,
+            )
+
+        return sorted(candidates, key=_key, reverse=True)
+
+    def as_dict(self, now: float) -> dict[str, Any]:
+        """Return the history for diagnostics."""
+        return {
+            source: {"rssi": round(rssi, 1), "age": round(now - seen, 1)}
+            for source, (rssi, seen) in self._sources.items()
+        }
+
+
+async def async_poll_with_failover(
+    sources: Sequence[tuple[str, _T]],
+    poll_through: Callable[[str, _T], Awaitable[_R]],
+    on_failover: Callable[[str, Exception], None],
+) -> _R:
+    """Poll through the sources in turn until one succeeds.
+
+    on_failover is told about every source but the last that failed, the
+    error of the last one is raised.
+    """
+    *failover, (last_source, last_device) = sources
+    for source, device in failover:
+        try:
+            return await poll_through(source, device)
+        except Exception as err:
+            on_failover(source, err)
+    return await poll_through(last_source, last_device)
@@ -2,7 +2,13 @@
 
 from __future__ import annotations
 
+from collections.abc import Callable
+import dataclasses
+from dataclasses import dataclass
+from functools import partial
 import logging
+from time import monotonic, perf_counter_ns
+from typing import Any
 
 from sensor_state_data import (
     DeviceClass,
@@ -17,6 +23,7 @@ from sensor_state_data import (
 from homeassistant import config_entries
 from homeassistant.components.bluetooth.passive_update_processor import (
     PassiveBluetoothDataUpdate,
+    PassiveBluetoothEntityKey,
     PassiveBluetoothProcessorEntity,
 )
 from homeassistant.components.sensor import (
@@ -39,18 +46,25 @@ from homeassistant.const import (
     UnitOfTime,
 )
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import CONNECTION_BLUETOOTH, DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.sensor import sensor_device_info_to_hass_device_info
 
-from .const import DOMAIN
+from .batching import WriteBatcher, async_get_write_batcher
+from .const import CONF_BATCH_WINDOW, CONF_BATCH_WRITES, DOMAIN
+from .debug import DEBUG_LOG
 from .device import device_key_to_bluetooth_entity_key
 from .QingActiveBluetoothProcessorCoordinator import (
     QingActiveBluetoothProcessorCoordinator,
     QingPassiveBluetoothDataProcessor,
 )
+from .stats import DeviceStats
+from .throttle import WriteThrottle, write_policies
 
 _LOGGER = logging.getLogger(__name__)
 
+_UNSET = object()
+
 SENSOR_DESCRIPTIONS = {
     (DeviceClass.BATTERY, Units.PERCENTAGE): SensorEntityDescription(
         key=f"{DeviceClass.BATTERY}_{Units.PERCENTAGE}",
@@ -71,6 +85,30 @@ SENSOR_DESCRIPTIONS = {
         native_unit_of_measurement=UnitOfTemperature.CELSIUS,
         state_class=SensorStateClass.MEASUREMENT,
     ),
+    (DeviceClass.ILLUMINANCE, Units.LIGHT_LUX): SensorEntityDescription(
+        key=f"{DeviceClass.ILLUMINANCE}_{Units.LIGHT_LUX}",
+        device_class=SensorDeviceClass.ILLUMINANCE,
+        native_unit_of_measurement=LIGHT_LUX,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    (DeviceClass.IMPEDANCE, Units.OHM): SensorEntityDescription(
+        key=f"{DeviceClass.IMPEDANCE}_{Units.OHM}",
+        icon="mdi:omega",
+        native_unit_of_measurement=Units.OHM,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    (DeviceClass.MASS, Units.MASS_KILOGRAMS): SensorEntityDescription(
+        key=f"{DeviceClass.MASS}_{Units.MASS_KILOGRAMS}",
+        device_class=SensorDeviceClass.WEIGHT,
+        native_unit_of_measurement=UnitOfMass.KILOGRAMS,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    (DeviceClass.MASS_NON_STABILIZED, Units.MASS_KILOGRAMS): SensorEntityDescription(
+        key=f"{DeviceClass.MASS_NON_STABILIZED}_{Units.MASS_KILOGRAMS}",
+        device_class=SensorDeviceClass.WEIGHT,
+        native_unit_of_measurement=UnitOfMass.KILOGRAMS,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
     (
         DeviceClass.SIGNAL_STRENGTH,
         Units.SIGNAL_STRENGTH_DECIBELS_MILLIWATT,
@@ -85,70 +123,179 @@ SENSOR_DESCRIPTIONS = {
 }
 
 
-def sensor_update_to_bluetooth_data_update(
-    sensor_update: SensorUpdate,
-) -> PassiveBluetoothDataUpdate:
-    """Convert a sensor update to a bluetooth data update."""
-    _LOGGER.warning("***+++ sensor_update_to_bluetooth_data_update:%s", sensor_update)
-    for device_id, device_info in sensor_update.devices.items():
-        _LOGGER.warning(
-            "*** device_id %s:%s",
-            device_id,
-            sensor_device_info_to_hass_device_info(device_info),
-        )
+@dataclass(frozen=True, kw_only=True)
+class QingStatisticsSensorEntityDescription(SensorEntityDescription):
+    """Describes a hot path statistics sensor."""
+
+    value_fn: Callable[[DeviceStats], float | int | None]
+
+
+def _microseconds(value: float | None) -> float | None:
+    return None if value is None else round(value / 1000, 1)
 
-    # PassiveBluetoothEntityKey(key='temperature', device_id=None):Temperature
-    for device_key, sensor_values in sensor_update.entity_values.items():
-        _LOGGER.warning(
-            "*** entity_names %s:%s",
-            device_key_to_bluetooth_entity_key(device_key),
-            sensor_values.name,
-        )
 
-    return PassiveBluetoothDataUpdate(
-        # (title=None, anufacturer=None, sw_version='123456', hw_version=None)},
-        # devices={None: SensorDeviceInfo(name=None, model=None, manufacturer=None, sw_version='123456', hw_version=None)}
-        devices={
-            device_id: sensor_device_info_to_hass_device_info(device_info)
-            for device_id, device_info in sensor_update.devices.items()
-        },
-        # entity_descriptions={DeviceKey(key='battery', device_id=None): SensorDescription(device_key=DeviceKey(key='battery', device_id=None), device_class=<SensorDeviceClass.BATTERY: 'battery'>, native_unit_of_measurement=<Units.PERCENTAGE: '%'>)},
-        entity_descriptions={
-            device_key_to_bluetooth_entity_key(device_key): SENSOR_DESCRIPTIONS[
+def _seconds(value: float | None) -> float | None:
+    return None if value is None else round(value, 2)
+
+
+STATISTICS_SENSOR_DESCRIPTIONS = (
+    QingStatisticsSensorEntityDescription(
+        key="packets",
+        translation_key="packets",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda stats: stats.packets,
+    ),
+    QingStatisticsSensorEntityDescription(
+        key="deduplicated",
+        translation_key="deduplicated",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda stats: stats.deduplicated,
+    ),
+    QingStatisticsSensorEntityDescription(
+        key="poll_failures",
+        translation_key="poll_failures",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda stats: stats.poll_failures,
+    ),
+    QingStatisticsSensorEntityDescription(
+        key="parse_time",
+        translation_key="parse_time",
+        native_unit_of_measurement=UnitOfTime.MICROSECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda stats: _microseconds(stats.parse_ns.mean),
+    ),
+    QingStatisticsSensorEntityDescription(
+        key="update_time_p99",
+        translation_key="update_time_p99",
+        native_unit_of_measurement=UnitOfTime.MICROSECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda stats: _microseconds(stats.update_ns.percentile(0.99)),
+    ),
+    QingStatisticsSensorEntityDescription(
+        key="poll_duration",
+        translation_key="poll_duration",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda stats: _seconds(stats.poll_duration.mean),
+    ),
+    QingStatisticsSensorEntityDescription(
+        key="connection_wait",
+        translation_key="connection_wait",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda stats: _seconds(stats.connection_wait.mean),
+    ),
+)
+
+
+class SensorUpdateConverter:
+    """Convert sensor updates to bluetooth data updates for one processor.
+
+    The processor merges every update into the data it already holds, so
+    descriptions, names and devices are only emitted when they change, and
+    entity keys are interned per DeviceKey instead of being rebuilt for
+    every advertisement.
+    """
+
+    __slots__ = ("_entities", "_descriptions", "_devices", "stats", "throttle")
+
+    def __init__(
+        self,
+        stats: DeviceStats | None = None,
+        throttle: WriteThrottle | None = None,
+    ) -> None:
+        """Initialize the converter."""
+        self.stats = stats
+        self.throttle = throttle
+        # DeviceKey hashing is not free, so the interned entity key and the
+        # last emitted name share one lookup: [entity key, name].
+        self._entities: dict[DeviceKey, list[Any]] = {}
+        self._descriptions: dict[DeviceKey, SensorDescription] = {}
+        self._devices: dict[str | None, SensorDeviceInfo] = {}
+
+    def _entity(self, device_key: DeviceKey) -> list[Any]:
+        if (entity := self._entities.get(device_key)) is None:
+            entity = self._entities[device_key] = [
+                device_key_to_bluetooth_entity_key(device_key),
+                _UNSET,
+            ]
+        return entity
+
+    def entity_key(self, device_key: DeviceKey) -> PassiveBluetoothEntityKey:
+        """Return the interned entity key for a device key."""
+        return self._entity(device_key)[0]
+
+    def __call__(self, sensor_update: SensorUpdate) -> PassiveBluetoothDataUpdate:
+        """Convert a sensor update to a bluetooth data update."""
+        if (stats := self.stats) is None:
+            return self._convert(sensor_update)
+        began = perf_counter_ns()
+        update = self._convert(sensor_update)
+        stats.convert_ns.record(perf_counter_ns() - began)
+        return update
+
+    def _convert(self, sensor_update: SensorUpdate) -> PassiveBluetoothDataUpdate:
+        if DEBUG_LOG.allow(sensor_update.title):
+            for device_id, device_info in sensor_update.devices.items():
+                _LOGGER.debug(
+                    "Device %s: %s",
+                    device_id,
+                    sensor_device_info_to_hass_device_info(device_info),
+                )
+            for device_key, sensor_values in sensor_update.entity_values.items():
+                _LOGGER.debug(
+                    "Entity %s: %s = %s",
+                    self.entity_key(device_key),
+                    sensor_values.name,
+                    sensor_values.native_value,
+                )
+
+        devices = {}
+        known_devices = self._devices
+        for device_id, device_info in sensor_update.devices.items():
+            if known_devices.get(device_id) != device_info:
+                # The device data mutates its SensorDeviceInfo in place,
+                # so keep a copy to compare against.
+                known_devices[device_id] = dataclasses.replace(device_info)
+                devices[device_id] = sensor_device_info_to_hass_device_info(device_info)
+
+        entity_descriptions = {}
+        known_descriptions = self._descriptions
+        for device_key, description in sensor_update.entity_descriptions.items():
+            if (
+                not description.device_class
+                or known_descriptions.get(device_key) == description
+            ):
+                continue
+            known_descriptions[device_key] = description
+            entity_descriptions[self.entity_key(device_key)] = SENSOR_DESCRIPTIONS[
                 (description.device_class, description.native_unit_of_measurement)
             ]
-            for device_key, description in sensor_update.entity_descriptions.items()
-            if description.device_class
-        },
-        entity_data={
-            device_key_to_bluetooth_entity_key(device_key): sensor_values.native_value
-            for device_key, sensor_values in sensor_update.entity_values.items()
-        },
-        # entity_values={DeviceKey(key='battery', device_id=None): SensorValue(device_key=DeviceKey(key='battery', device_id=None), name='Battery', native_value=99)}
-        entity_names={
-            device_key_to_bluetooth_entity_key(device_key): sensor_values.name
-            for device_key, sensor_values in sensor_update.entity_values.items()
-        },
-        # devices={
-        #     device_id: sensor_device_info_to_hass_device_info(device_info)
-        #     for device_id, device_info in sensor_update.devices.items()
-        # },
-        # entity_descriptions={
-        #     device_key_to_bluetooth_entity_key(device_key): SENSOR_DESCRIPTIONS[
-        #         (description.device_class, description.native_unit_of_measurement)
-        #     ]
-        #     for device_key, description in sensor_update.entity_descriptions.items()
-        #     if description.device_class
-        # },
-        # entity_data={
-        #     device_key_to_bluetooth_entity_key(device_key): sensor_values.native_value
-        #     for device_key, sensor_values in sensor_update.entity_values.items()
-        # },
-        # entity_names={
-        #     device_key_to_bluetooth_entity_key(device_key): sensor_values.name
-        #     for device_key, sensor_values in sensor_update.entity_values.items()
-        # },
-    )
+
+        entity_data = {}
+        entity_names = {}
+        entities = self._entities
+        for device_key, sensor_values in sensor_update.entity_values.items():
+            if (entity := entities.get(device_key)) is None:
+                entity = self._entity(device_key)
+            entity_data[entity[0]] = sensor_values.native_value
+            if entity[1] != sensor_values.name:
+                entity[1] = entity_names[entity[0]] = sensor_values.name
+
+        if (throttle := self.throttle) is not None:
+            now = monotonic()
+            throttle.filter(entity_data, now)
+            if throttle.next_due <= now:
+                entity_data.update(throttle.flush(now))
+
+        return PassiveBluetoothDataUpdate(
+            devices=devices,
+            entity_descriptions=entity_descriptions,
+            entity_data=entity_data,
+            entity_names=entity_names,
+        )
 
 
 async def async_setup_entry(
@@ -157,13 +304,22 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up the Xiaomi BLE sensors."""
-    _LOGGER.warning("*** sensor async_setup_entry:%s", entry)
     coordinator: QingActiveBluetoothProcessorCoordinator = hass.data[DOMAIN][
         entry.entry_id
     ]
+    stats = coordinator.device_data.stats
+    throttle = WriteThrottle(write_policies(entry.options))
+    batcher: WriteBatcher | None = None
+    if entry.options.get(CONF_BATCH_WRITES, False):
+        batcher = async_get_write_batcher(
+            hass, entry.options.get(CONF_BATCH_WINDOW, 0.0)
+        )
     processor = QingPassiveBluetoothDataProcessor(
-        sensor_update_to_bluetooth_data_update
+        SensorUpdateConverter(stats, throttle), throttle=throttle, batcher=batcher
     )
+    entry.async_on_unload(processor.async_cancel_flush)
+    if batcher is not None:
+        entry.async_on_unload(partial(batcher.async_discard, processor))
     entry.async_on_unload(
         processor.async_add_entities_listener(
             QingBluetoothSensorEntity, async_add_entities
@@ -172,6 +328,11 @@ async def async_setup_entry(
     entry.async_on_unload(
         coordinator.async_register_processor(processor, SensorEntityDescription)
     )
+    if stats is not None:
+        async_add_entities(
+            QingStatisticsSensorEntity(coordinator, stats, description)
+            for description in STATISTICS_SENSOR_DESCRIPTIONS
+        )
 
 
 class QingBluetoothSensorEntity(
@@ -189,3 +350,30 @@ class QingBluetoothSensorEntity(
     def available(self) -> bool:
         """Return True if entity is available."""
         return super().available
+
+
+class QingStatisticsSensorEntity(SensorEntity):
+    """Hot path statistics of a device, refreshed by polling."""
+
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    entity_description: QingStatisticsSensorEntityDescription
+
+    def __init__(
+        self,
+        coordinator: QingActiveBluetoothProcessorCoordinator,
+        stats: DeviceStats,
+        description: QingStatisticsSensorEntityDescription,
+    ) -> None:
+        """Initialize the statistics sensor."""
+        self.entity_description = description
+        self._stats = stats
+        self._attr_unique_id = f"{coordinator.address}-{description.key}"
+        self._attr_device_info = DeviceInfo(
+            connections={(CONNECTION_BLUETOOTH, coordinator.address)}
+        )
+
+    @property
+    def native_value(self) -> float | int | None:
+        """Return the native value."""
+        return self.entity_description.value_fn(self._stats)
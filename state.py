@@ -0,0 +1,73 @@
+"""Compact per-device state for Qing BLE devices."""
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Callable
+import math
+from typing import TYPE_CHECKING
+
+from .availability import AdvertisementInterval
+from .parser import DECODERS, FIELD_COUNT, Reading
+from .routing import SignalHistory
+
+if TYPE_CHECKING:
+    from .decryption import MiBeaconDecryptor
+    from .history import ReadingHistory
+
+_NO_READINGS = array("d", [math.nan]) * FIELD_COUNT
+
+
+class DeviceState:
+    """What the integration remembers about one device between updates.
+
+    Readings are kept in a flat float array indexed by the field constants
+    in parser.py, NaN meaning never seen, instead of a dict of sensor value
+    objects per device.
+    """
+
+    __slots__ = (
+        "readings",
+        "fingerprint",
+        "rssi",
+        "last_poll",
+        "last_poll_success",
+        "passive_battery",
+        "signal",
+        "event_counter",
+        "interval",
+        "history",
+        "bindkey",
+        "decryptor",
+        "decoders",
+    )
+
+    def __init__(
+        self, bindkey: bytes | None = None, history: ReadingHistory | None = None
+    ) -> None:
+        """Initialize the state."""
+        self.readings = array("d", _NO_READINGS)
+        # Hash of the last decoded advertisement.
+        self.fingerprint: int | None = None
+        self.rssi: int | None = None
+        # Monotonic times of the last poll attempt and success, and of the
+        # last battery level seen in an advertisement.
+        self.last_poll: float | None = None
+        self.last_poll_success: float | None = None
+        self.passive_battery: float | None = None
+        self.signal = SignalHistory()
+        # Frame counter of the last plaintext MiBeacon frame.
+        self.event_counter: int | None = None
+        self.interval = AdvertisementInterval()
+        # Recent readings for the fleet export, None unless enabled.
+        self.history = history
+        # The decryptor and the decoders using it are set up once the
+        # device address is known, for devices with a bindkey.
+        self.bindkey = bindkey
+        self.decryptor: MiBeaconDecryptor | None = None
+        self.decoders: dict[str, Callable[[bytes], tuple[Reading, ...]]] = DECODERS
+
+    def reading(self, field: int) -> float | None:
+        """Return the last value of a field, or None if it was never seen."""
+        value = self.readings[field]
+        return None if math.isnan(value) else value
@@ -0,0 +1,119 @@
+"""Hot path statistics for Qing BLE devices.
+
+Everything is recorded from the event loop, so counters and histograms are
+plain integers without locks. Statistics are opt-in: devices without them
+carry ``None`` and the instrumented code skips the timing altogether.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Any
+
+# Upper bucket bounds, powers of two from 256 ns to about 4 ms.
+NANOSECOND_BUCKETS = tuple(1 << shift for shift in range(8, 23))
+# Upper bucket bounds in seconds for GATT polls and connection slot waits.
+SECOND_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Fixed bucket histogram, the last bucket counts everything larger."""
+
+    __slots__ = ("bounds", "buckets", "count", "total", "maximum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        """Initialize the histogram."""
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total: float = 0
+        self.maximum: float = 0
+
+    def record(self, value: float) -> None:
+        """Add a value."""
+        self.buckets[bisect_right(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    @property
+    def mean(self) -> float | None:
+        """Return the mean value."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, fraction: float) -> float | None:
+        """Return the upper bound of the bucket holding the percentile."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                break
+        if index == len(self.bounds):
+            return self.maximum
+        return self.bounds[index]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the histogram for diagnostics."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.maximum,
+            "buckets": dict(zip((*self.bounds, "inf"), self.buckets, strict=True)),
+        }
+
+
+class DeviceStats:
+    """Counters and timings of one device, from advertisement to state."""
+
+    __slots__ = (
+        "packets",
+        "deduplicated",
+        "polls",
+        "poll_failures",
+        "failovers",
+        "update_ns",
+        "parse_ns",
+        "convert_ns",
+        "process_ns",
+        "poll_duration",
+        "connection_wait",
+    )
+
+    def __init__(self) -> None:
+        """Initialize the statistics."""
+        self.packets = 0
+        self.deduplicated = 0
+        self.polls = 0
+        self.poll_failures = 0
+        # Polls retried through another adapter or proxy
+        self.failovers = 0
+        # QingBluetoothDeviceData.update and its decoding step
+        self.update_ns = Histogram(NANOSECOND_BUCKETS)
+        self.parse_ns = Histogram(NANOSECOND_BUCKETS)
+        # SensorUpdateConverter and the processor update it feeds
+        self.convert_ns = Histogram(NANOSECOND_BUCKETS)
+        self.process_ns = Histogram(NANOSECOND_BUCKETS)
+        self.poll_duration = Histogram(SECOND_BUCKETS)
+        self.connection_wait = Histogram(SECOND_BUCKETS)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the statistics for diagnostics."""
+        return {
+            "packets": self.packets,
+            "deduplicated": self.deduplicated,
+            "polls": self.polls,
+            "poll_failures": self.poll_failures,
+            "failovers": self.failovers,
+            "update_ns": self.update_ns.as_dict(),
+            "parse_ns": self.parse_ns.as_dict(),
+            "convert_ns": self.convert_ns.as_dict(),
+            "process_ns": self.process_ns.as_dict(),
+            "poll_duration": self.poll_duration.as_dict(),
+            "connection_wait": self.connection_wait.as_dict(),
+        }
@@ -0,0 +1,168 @@
+"""Persistent device state for Qing BLE devices."""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from time import monotonic, time
+from typing import TypedDict
+
+from sensor_state_data import SensorUpdate
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DATA_STORE, DOMAIN
+from .gatt import GattHandles
+from .QingBluetoothDeviceData import QingBluetoothDeviceData
+
+STORAGE_KEY = f"{DOMAIN}.devices"
+STORAGE_VERSION = 1
+# Changes of all devices within this many seconds go out in one write.
+SAVE_DELAY = 60.0
+
+
+class StoredDevice(TypedDict):
+    """What is kept of one device, times being wall clock timestamps."""
+
+    readings: list[float | None]
+    last_poll: float | None
+    last_poll_success: float | None
+    firmware: str | None
+    handles: list[int | None] | None
+
+
+def _to_timestamp(monotonic_time: float | None) -> float | None:
+    if monotonic_time is None:
+        return None
+    return time() - (monotonic() - monotonic_time)
+
+
+def _to_monotonic(timestamp: float | None) -> float | None:
+    if timestamp is None:
+        return None
+    return monotonic() - (time() - timestamp)
+
+
+class DeviceStore:
+    """Keep the last readings, poll times and GATT handles across restarts.
+
+    All devices share one store. Devices mark it dirty as often as they
+    like, a save is scheduled only once until it has been written, so busy
+    devices cannot keep postponing it and one write covers all of them.
+    The data is taken from the live device state when the save runs.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the store."""
+        self._store: Store[dict[str, StoredDevice]] = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY
+        )
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+        # Devices of entries that are not loaded keep their stored data.
+        self._stored: dict[str, StoredDevice] = {}
+        self._devices: dict[str, QingBluetoothDeviceData] = {}
+        self._save_pending = False
+
+    async def async_load(self) -> None:
+        """Load the stored data, once for all entries."""
+        async with self._load_lock:
+            if not self._loaded:
+                self._stored = await self._store.async_load() or {}
+                self._loaded = True
+
+    @callback
+    def async_restore(
+        self, address: str, device_data: QingBluetoothDeviceData
+    ) -> SensorUpdate | None:
+        """Restore the stored state of a device, returning its last values.
+
+        The next poll is held off until the poll interval has passed since
+        the last successful one.
+        """
+        if (stored := self._stored.get(address)) is None:
+            return None
+        state = device_data.state
+        state.last_poll = _to_monotonic(stored["last_poll"])
+        state.last_poll_success = _to_monotonic(stored["last_poll_success"])
+        if state.last_poll_success is not None:
+            device_data.poll_scheduler.delay(
+                state.last_poll_success
+                + device_data.poll_scheduler.interval
+                - monotonic()
+            )
+        if (handles := stored["handles"]) is not None:
+            gatt_handles = GattHandles(*handles)
+            gatt_handles.firmware = stored["firmware"]
+            device_data.gatt_cache.restore(address, gatt_handles)
+        if stored["firmware"] is not None:
+            device_data.set_device_sw_version(stored["firmware"])
+        return device_data.restore(address, stored["readings"])
+
+    @callback
+    def async_register(
+        self, address: str, device_data: QingBluetoothDeviceData
+    ) -> CALLBACK_TYPE:
+        """Save the state of a device from now on."""
+        self._devices[address] = device_data
+
+        @callback
+        def _unregister() -> None:
+            if self._devices.get(address) is device_data:
+                del self._devices[address]
+                self._stored[address] = self._device_data_to_store(address, device_data)
+                self.async_schedule_save()
+
+        return _unregister
+
+    @callback
+    def async_remove(self, address: str) -> None:
+        """Forget a device."""
+        self._devices.pop(address, None)
+        if self._stored.pop(address, None) is not None:
+            self.async_schedule_save()
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Mark the store dirty."""
+        if self._save_pending:
+            return
+        self._save_pending = True
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def _device_data_to_store(
+        self, address: str, device_data: QingBluetoothDeviceData
+    ) -> StoredDevice:
+        state = device_data.state
+        handles = device_data.gatt_cache.get(address)
+        return {
+            "readings": [
+                None if math.isnan(value) else value for value in state.readings
+            ],
+            "last_poll": _to_timestamp(state.last_poll),
+            "last_poll_success": _to_timestamp(state.last_poll_success),
+            "firmware": None if handles is None else handles.firmware,
+            "handles": (
+                None
+                if handles is None
+                else [handles.battery, handles.firmware_revision]
+            ),
+        }
+
+    @callback
+    def _data_to_save(self) -> dict[str, StoredDevice]:
+        self._save_pending = False
+        data = dict(self._stored)
+        for address, device_data in self._devices.items():
+            data[address] = self._device_data_to_store(address, device_data)
+        return data
+
+
+async def async_get_device_store(hass: HomeAssistant) -> DeviceStore:
+    """Return the loaded store shared by all entries."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if (store := domain_data.get(DATA_STORE)) is None:
+        store = domain_data[DATA_STORE] = DeviceStore(hass)
+    await store.async_load()
+    return store
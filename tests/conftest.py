@@ -0,0 +1,29 @@
+"""Test setup for Qing BLE.
+
+The integration is loaded as the qing_ble package from the repository root,
+the way Home Assistant loads a custom component, so the tests import its
+modules with ``from qing_ble import ...``.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE = "qing_ble"
+
+
+def _load_package() -> None:
+    if PACKAGE in sys.modules:
+        return
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE, ROOT / "__init__.py", submodule_search_locations=[str(ROOT)]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = package
+    spec.loader.exec_module(package)
+
+
+_load_package()
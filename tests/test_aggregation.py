@@ -0,0 +1,86 @@
+"""Tests for the windowed aggregation."""
+
+from __future__ import annotations
+
+from sensor_state_data import (
+    DeviceKey,
+    SensorDescription,
+    SensorDeviceClass,
+    SensorUpdate,
+    SensorValue,
+    Units,
+)
+
+from qing_ble.aggregation import WindowAggregator
+from qing_ble.QingBluetoothDeviceData import NO_CHANGE_UPDATE
+
+TEMPERATURE = DeviceKey("temperature", None)
+BATTERY = DeviceKey("battery", None)
+DESCRIPTION = SensorDescription(
+    device_key=TEMPERATURE,
+    device_class=SensorDeviceClass.TEMPERATURE,
+    native_unit_of_measurement=Units.TEMP_CELSIUS,
+)
+
+
+def _update(temperature: float, battery: float | None = None) -> SensorUpdate:
+    entity_values = {
+        TEMPERATURE: SensorValue(TEMPERATURE, "Temperature", temperature),
+    }
+    if battery is not None:
+        entity_values[BATTERY] = SensorValue(BATTERY, "Battery", battery)
+    return SensorUpdate(
+        title="Qing",
+        devices={},
+        entity_descriptions={TEMPERATURE: DESCRIPTION},
+        entity_values=entity_values,
+    )
+
+
+def _values(update: SensorUpdate) -> dict[str, float]:
+    return {
+        device_key.key: value.native_value
+        for device_key, value in update.entity_values.items()
+    }
+
+
+def test_first_sample_passes_then_mean() -> None:
+    """Test the first sample passes, later ones come out as the window mean."""
+    aggregator = WindowAggregator(60)
+    assert _values(aggregator.update(_update(20.0, battery=90))) == {
+        "temperature": 20.0,
+        "battery": 90,
+    }
+    assert _values(aggregator.update(_update(21.0, battery=89))) == {"battery": 89}
+    assert _values(aggregator.update(_update(22.5))) == {}
+    flushed = aggregator.flush()
+    assert _values(flushed) == {"temperature": 21.17}
+    assert flushed.entity_descriptions == {TEMPERATURE: DESCRIPTION}
+    # An empty window flushes nothing.
+    assert aggregator.flush() is None
+    aggregator.update(_update(23.0))
+    assert _values(aggregator.flush()) == {"temperature": 23.0}
+
+
+def test_extremes() -> None:
+    """Test the min and max sensors of the window."""
+    aggregator = WindowAggregator(60, extremes=True)
+    for temperature in (20.0, 18.5, 24.0, 21.0):
+        aggregator.update(_update(temperature))
+    flushed = aggregator.flush()
+    assert _values(flushed) == {
+        "temperature": 20.88,
+        "temperature_min": 18.5,
+        "temperature_max": 24.0,
+    }
+    description = flushed.entity_descriptions[DeviceKey("temperature_min", None)]
+    assert description.native_unit_of_measurement == Units.TEMP_CELSIUS
+    assert (
+        flushed.entity_values[DeviceKey("temperature_max", None)].name
+        == "Temperature max"
+    )
+
+
+def test_no_change_update_passes() -> None:
+    """Test the repeat marker is handed back untouched."""
+    assert WindowAggregator(60).update(NO_CHANGE_UPDATE) is NO_CHANGE_UPDATE
@@ -0,0 +1,78 @@
+"""Tests for the advertisement interval tracking."""
+
+from __future__ import annotations
+
+import pytest
+
+from qing_ble import availability
+
+
+def _interval(every, count=availability.MIN_SAMPLES + 1):
+    interval = availability.AdvertisementInterval()
+    for sample in range(count):
+        interval.record(sample * every)
+    return interval
+
+
+def test_smoothed_interval() -> None:
+    """Test the mean follows new gaps and the timeout waits for samples."""
+    interval = _interval(10, availability.MIN_SAMPLES)
+    assert interval.samples == availability.MIN_SAMPLES - 1
+    assert interval.timeout is None
+    interval.record(interval.last_seen + 20)
+    assert interval.learned
+    assert interval.mean == pytest.approx(11)
+    assert interval.variance > 0
+    # A repeated or earlier time is not a sample.
+    interval.record(interval.last_seen)
+    assert interval.samples == availability.MIN_SAMPLES
+    assert interval.timeout == availability.MIN_TIMEOUT
+
+
+def test_timeout_from_advertising_interval() -> None:
+    """Test the interval Home Assistant learned takes precedence."""
+    interval = availability.AdvertisementInterval()
+    interval.advertising = 100.0
+    assert interval.learned
+    assert interval.timeout == 100.0 * availability.MISSED_INTERVALS
+    interval.advertising = 10 * availability.MAX_TIMEOUT
+    assert interval.timeout == availability.MAX_TIMEOUT
+
+
+def test_sleepy_from_changes() -> None:
+    """Test the changes alone only show a device is not sleepy."""
+    assert availability.AdvertisementInterval().sleepy is None
+    assert _interval(60).sleepy is False
+    assert _interval(600).sleepy is None
+    assert _interval(600).classify(True) is True
+
+
+@pytest.mark.parametrize(
+    ("advertising", "stored", "sleepy"),
+    [
+        (270.0, None, False),
+        (330.0, None, True),
+        (270.0, True, True),
+        (230.0, True, False),
+        (330.0, False, False),
+        (370.0, False, True),
+    ],
+)
+def test_sleepy_hysteresis(advertising, stored, sleepy) -> None:
+    """Test a classified device only changes class well past the threshold."""
+    interval = availability.AdvertisementInterval()
+    interval.advertising = advertising
+    assert interval.classify(stored) is sleepy
+
+
+def test_as_dict() -> None:
+    """Test the diagnostics of the interval."""
+    interval = _interval(10)
+    interval.advertising = 12.0
+    assert interval.as_dict() == {
+        "mean": 10.0,
+        "deviation": 0.0,
+        "samples": availability.MIN_SAMPLES,
+        "advertising": 12.0,
+        "timeout": availability.MIN_TIMEOUT,
+    }
@@ -0,0 +1,88 @@
+"""Tests for the batched entity state writes."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from homeassistant.components.bluetooth.passive_update_processor import (
+    PassiveBluetoothEntityKey,
+)
+
+from qing_ble import batching
+from qing_ble.const import DATA_WRITE_BATCHERS, DOMAIN
+
+TEMPERATURE = PassiveBluetoothEntityKey("temperature", None)
+HUMIDITY = PassiveBluetoothEntityKey("humidity", None)
+BATTERY = PassiveBluetoothEntityKey("battery", None)
+
+
+class _Processor:
+    """Processor recording the entities it writes."""
+
+    def __init__(self) -> None:
+        self.writes: list[set[PassiveBluetoothEntityKey]] = []
+
+    def async_write_entities(self, entity_keys) -> None:
+        self.writes.append(set(entity_keys))
+
+
+def _hass() -> SimpleNamespace:
+    return SimpleNamespace(loop=asyncio.get_running_loop(), data={})
+
+
+def test_writes_coalesced_on_next_iteration() -> None:
+    """Test entities changed in the same iteration are written once."""
+    first, second = _Processor(), _Processor()
+
+    async def _run() -> batching.WriteBatcher:
+        batcher = batching.WriteBatcher(_hass())
+        batcher.async_add(first, {TEMPERATURE, HUMIDITY})
+        batcher.async_add(first, {TEMPERATURE, BATTERY})
+        batcher.async_add(second, {TEMPERATURE})
+        assert not first.writes
+        await asyncio.sleep(0)
+        batcher.async_add(first, {HUMIDITY})
+        await asyncio.sleep(0)
+        return batcher
+
+    batcher = asyncio.run(_run())
+    assert first.writes == [{TEMPERATURE, HUMIDITY, BATTERY}, {HUMIDITY}]
+    assert second.writes == [{TEMPERATURE}]
+    assert batcher.metrics() == {
+        "window": 0.0,
+        "passes": 2,
+        "written": 5,
+        "coalesced": 1,
+    }
+
+
+def test_window_and_discard() -> None:
+    """Test a window delays the pass and a discarded processor is skipped."""
+    first, second = _Processor(), _Processor()
+
+    async def _run() -> None:
+        batcher = batching.WriteBatcher(_hass(), window=0.01)
+        batcher.async_add(first, {TEMPERATURE})
+        batcher.async_add(second, {TEMPERATURE})
+        batcher.async_discard(second)
+        await asyncio.sleep(0)
+        assert not first.writes
+        await asyncio.sleep(0.02)
+
+    asyncio.run(_run())
+    assert first.writes == [{TEMPERATURE}]
+    assert not second.writes
+
+
+def test_batcher_shared_per_window() -> None:
+    """Test devices with the same window share a batcher."""
+
+    async def _run() -> None:
+        hass = _hass()
+        batcher = batching.async_get_write_batcher(hass, 0.0)
+        assert batching.async_get_write_batcher(hass, 0.0) is batcher
+        assert batching.async_get_write_batcher(hass, 0.5) is not batcher
+        assert set(hass.data[DOMAIN][DATA_WRITE_BATCHERS]) == {0.0, 0.5}
+
+    asyncio.run(_run())
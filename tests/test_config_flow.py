@@ -0,0 +1,121 @@
+"""Tests for adding several discovered devices in one config flow pass."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+from homeassistant import config_entries
+import pytest
+
+if not hasattr(config_entries, "ConfigFlowResult"):
+    pytest.skip(
+        "the config flow needs Home Assistant 2024.4 or later",
+        allow_module_level=True,
+    )
+
+from homeassistant.const import CONF_ADDRESS, CONF_NAME
+
+from qing_ble import config_flow
+from qing_ble.const import CONF_ADDRESSES, DOMAIN
+from qing_ble.parser import UUID_MIBEACON, UUID_QING
+
+ADDRESSES = ["AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02", "AA:BB:CC:DD:EE:03"]
+
+
+def _service_info(address: str, uuid: str, payload: bytes) -> BluetoothServiceInfo:
+    return BluetoothServiceInfo(
+        name="Qing",
+        address=address,
+        rssi=-70,
+        manufacturer_data={},
+        service_data={uuid: payload},
+        service_uuids=[uuid],
+        source="local",
+    )
+
+
+@pytest.fixture
+def flow(monkeypatch: pytest.MonkeyPatch) -> config_flow.RenphoConfigFlow:
+    """Return a user flow that records the results it would show."""
+    flow = config_flow.RenphoConfigFlow()
+    flow.context = {"source": config_entries.SOURCE_USER}
+    flow.started: list[dict[str, Any]] = []
+
+    async def _async_init(domain, context, data):
+        flow.started.append({"domain": domain, "context": context, "data": data})
+
+    flow.hass = SimpleNamespace(
+        async_create_task=_run,
+        config_entries=SimpleNamespace(flow=SimpleNamespace(async_init=_async_init)),
+    )
+
+    async def _async_set_unique_id(unique_id, raise_on_progress=True):
+        flow.context["unique_id"] = unique_id
+
+    monkeypatch.setattr(flow, "async_set_unique_id", _async_set_unique_id)
+    monkeypatch.setattr(flow, "_abort_if_unique_id_configured", lambda: None)
+    monkeypatch.setattr(
+        flow, "async_create_entry", lambda title, data: {"title": title, "data": data}
+    )
+    monkeypatch.setattr(
+        flow,
+        "async_show_form",
+        lambda step_id, errors=None, **kwargs: {"step_id": step_id, "errors": errors},
+    )
+    monkeypatch.setattr(config_flow, "async_last_service_info", lambda *args: None)
+    for index, address in enumerate(ADDRESSES):
+        flow._discovered_devices[address] = config_flow.Discovery(
+            f"Qing {index + 1}",
+            _service_info(address, UUID_QING, bytes.fromhex("012a0c096f105a")),
+        )
+    return flow
+
+
+def _run(coro) -> None:
+    """Run a coroutine that does not suspend, like the recorded flow init."""
+    try:
+        coro.send(None)
+    except StopIteration:
+        pass
+
+
+def test_user_step_adds_every_selected_device(flow) -> None:
+    """Test the first device gets the entry, the others bulk flows."""
+    result = asyncio.run(flow.async_step_user({CONF_ADDRESSES: ADDRESSES}))
+    assert result == {"title": "Qing 1", "data": {"hello": "world"}}
+    assert flow.started == [
+        {
+            "domain": DOMAIN,
+            "context": {"source": config_flow.SOURCE_BULK},
+            "data": {CONF_ADDRESS: address, CONF_NAME: f"Qing {index + 2}"},
+        }
+        for index, address in enumerate(ADDRESSES[1:])
+    ]
+
+
+def test_bulk_step_creates_the_entry(flow) -> None:
+    """Test a bulk flow creates its entry without a form."""
+    flow.context = {"source": config_flow.SOURCE_BULK}
+    result = asyncio.run(
+        flow.async_step_bulk({CONF_ADDRESS: ADDRESSES[1], CONF_NAME: "Qing 2"})
+    )
+    assert result == {"title": "Qing 2", "data": {"hello": "world"}}
+    assert flow.context["unique_id"] == ADDRESSES[1]
+
+
+def test_bulk_step_asks_for_the_bindkey(flow, monkeypatch) -> None:
+    """Test a bulk flow of an encrypting device waits for its bindkey."""
+    encrypted = _service_info(
+        ADDRESSES[2],
+        UUID_MIBEACON,
+        bytes.fromhex("58595b050784535638c1a4eec3777678f36e112233ec6c333b"),
+    )
+    monkeypatch.setattr(config_flow, "async_last_service_info", lambda *args: encrypted)
+    flow.context = {"source": config_flow.SOURCE_BULK}
+    result = asyncio.run(
+        flow.async_step_bulk({CONF_ADDRESS: ADDRESSES[2], CONF_NAME: "Qing 3"})
+    )
+    assert result == {"step_id": "get_encryption_key_4_5", "errors": {}}
@@ -0,0 +1,110 @@
+"""Tests for the MiBeacon decryption."""
+
+from __future__ import annotations
+
+import pytest
+
+from qing_ble import decryption, parser
+
+ADDRESS = "A4:C1:38:56:53:84"
+BINDKEY_4_5 = bytes.fromhex("e9ea895fac7cca6d30532432a516f3c8")
+BINDKEY_LEGACY = bytes.fromhex("b853075158487ca39a5b5ea9")
+# v5 frames with a MAC, counter 7 and 8, counter extension 0x332211:
+# a temperature and humidity object, and a button press only.
+V5_TEMPERATURE_HUMIDITY = bytes.fromhex(
+    "58595b050784535638c1a4eec3777678f36e112233ec6c333b"
+)
+V5_BUTTON = bytes.fromhex("58595b050884535638c1a432e3a31eca3a112233eeac224b")
+# v3 frame with a MAC, counter 9, a temperature and humidity object.
+LEGACY_TEMPERATURE_HUMIDITY = bytes.fromhex(
+    "58305b050984535638c1a4e8a18177ce829400000064"
+)
+
+
+def test_v5() -> None:
+    """Test a v5 frame decrypted with the right key."""
+    decryptor = decryption.MiBeaconDecryptor(BINDKEY_4_5, ADDRESS)
+    assert decryptor.scheme is parser.EncryptionScheme.MIBEACON_4_5
+    assert decryptor.decode(V5_TEMPERATURE_HUMIDITY) == (
+        (parser.TEMPERATURE, 21.0),
+        (parser.HUMIDITY, 44.0),
+    )
+    assert decryptor.payload == bytes.fromhex("0d1004d200b801")
+    assert decryptor.decrypted == 1
+
+
+def test_v5_bad_key() -> None:
+    """Test a v5 frame with the wrong key fails its tag."""
+    decryptor = decryption.MiBeaconDecryptor(bytes(16), ADDRESS)
+    assert decryptor.decode(V5_TEMPERATURE_HUMIDITY) == ()
+    assert decryptor.payload is None
+    assert decryptor.failed == 1
+
+
+def test_v5_replay() -> None:
+    """Test a repeated frame is dropped before any crypto work."""
+    decryptor = decryption.MiBeaconDecryptor(BINDKEY_4_5, ADDRESS)
+    assert decryptor.decode(V5_TEMPERATURE_HUMIDITY)
+    assert decryptor.decode(V5_TEMPERATURE_HUMIDITY) == ()
+    assert decryptor.payload is None
+    assert (decryptor.decrypted, decryptor.replayed) == (1, 1)
+    # A new counter still decrypts.
+    assert decryptor.decode(V5_BUTTON) == ()
+    assert decryptor.payload == bytes.fromhex("011003000000")
+
+
+def test_v5_tampered() -> None:
+    """Test a frame changed in transit fails its tag."""
+    frame = bytearray(V5_TEMPERATURE_HUMIDITY)
+    frame[12] ^= 0x01
+    decryptor = decryption.MiBeaconDecryptor(BINDKEY_4_5, ADDRESS)
+    assert decryptor.decode(bytes(frame)) == ()
+    assert decryptor.failed == 1
+
+
+def test_legacy() -> None:
+    """Test a legacy frame decrypted with the right key."""
+    decryptor = decryption.MiBeaconDecryptor(BINDKEY_LEGACY, ADDRESS)
+    assert decryptor.scheme is parser.EncryptionScheme.MIBEACON_LEGACY
+    assert decryptor.decode(LEGACY_TEMPERATURE_HUMIDITY) == (
+        (parser.TEMPERATURE, 21.0),
+        (parser.HUMIDITY, 44.0),
+    )
+
+
+def test_scheme_mismatch() -> None:
+    """Test a legacy key does not try to decrypt a v5 frame."""
+    decryptor = decryption.MiBeaconDecryptor(BINDKEY_LEGACY, ADDRESS)
+    assert decryptor.decode(V5_TEMPERATURE_HUMIDITY) == ()
+    assert decryptor.failed == 0
+
+
+def test_plaintext() -> None:
+    """Test plaintext frames pass through the decryptor."""
+    decryptor = decryption.MiBeaconDecryptor(BINDKEY_4_5, ADDRESS)
+    frame = bytes.fromhex("5020aa01c5a1b2c3d4e5f60a100150")
+    assert decryptor.decode(frame) == ((parser.BATTERY, 80.0),)
+    assert decryptor.payload is None
+
+
+def test_invalid_bindkey_length() -> None:
+    """Test a bindkey that is neither 12 nor 16 bytes."""
+    assert decryption.bindkey_scheme(bytes(10)) is None
+    with pytest.raises(ValueError):
+        decryption.MiBeaconDecryptor(bytes(10), ADDRESS)
+
+
+@pytest.mark.parametrize(
+    ("bindkey", "frame", "decrypts"),
+    [
+        (BINDKEY_4_5, V5_TEMPERATURE_HUMIDITY, True),
+        # Only an event, no readings: the tag still proves the key.
+        (BINDKEY_4_5, V5_BUTTON, True),
+        (bytes(16), V5_BUTTON, False),
+        (BINDKEY_LEGACY, LEGACY_TEMPERATURE_HUMIDITY, True),
+        (bytes(12), LEGACY_TEMPERATURE_HUMIDITY, False),
+    ],
+)
+def test_bindkey_decrypts(bindkey, frame, decrypts) -> None:
+    """Test the bindkey check of the config flow."""
+    assert decryption.bindkey_decrypts(bindkey, ADDRESS, frame) is decrypts
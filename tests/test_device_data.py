@@ -0,0 +1,44 @@
+"""Tests for the device data."""
+
+from __future__ import annotations
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+
+from qing_ble import parser
+from qing_ble.QingBluetoothDeviceData import NO_CHANGE_UPDATE, QingBluetoothDeviceData
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+QING_V1 = bytes.fromhex("012a0c096f105a")
+
+
+def _service_info(service_data: dict[str, bytes], rssi: int = -70):
+    return BluetoothServiceInfo(
+        name="Qing",
+        address=ADDRESS,
+        rssi=rssi,
+        manufacturer_data={},
+        service_data=service_data,
+        service_uuids=list(service_data),
+        source="local",
+    )
+
+
+def test_repeat_is_skipped() -> None:
+    """Test a repeat of the last advertisement is not decoded again."""
+    data = QingBluetoothDeviceData()
+    update = data.update(_service_info({parser.UUID_QING: QING_V1}))
+    assert update is not NO_CHANGE_UPDATE
+    assert data.update(_service_info({parser.UUID_QING: QING_V1})) is NO_CHANGE_UPDATE
+    # A small RSSI change falls in the same bucket.
+    assert (
+        data.update(_service_info({parser.UUID_QING: QING_V1}, rssi=-71))
+        is NO_CHANGE_UPDATE
+    )
+
+
+def test_same_bytes_other_uuid_is_a_change() -> None:
+    """Test the service data UUID is part of what makes a repeat."""
+    data = QingBluetoothDeviceData()
+    data.update(_service_info({parser.UUID_QING: QING_V1}))
+    update = data.update(_service_info({parser.UUID_WEIGHT_SCALE: QING_V1}))
+    assert update is not NO_CHANGE_UPDATE
@@ -0,0 +1,78 @@
+"""Tests for the discovery matcher."""
+
+from __future__ import annotations
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+import pytest
+
+from qing_ble import discovery
+from qing_ble.parser import UUID_MIBEACON, UUID_QING
+
+# Encrypted MiBeacon 4.5 frame of a LYWSD03MMC, product id 0x055b.
+ENCRYPTED = bytes.fromhex("58595b050784535638c1a4eec3777678f36e112233ec6c333b")
+
+
+def _service_info(
+    address: str, uuid: str, payload: bytes, name: str = ""
+) -> BluetoothServiceInfo:
+    return BluetoothServiceInfo(
+        name=name,
+        address=address,
+        rssi=-70,
+        manufacturer_data={},
+        service_data={uuid: payload},
+        service_uuids=[uuid],
+        source="local",
+    )
+
+
+@pytest.fixture
+def matcher() -> discovery.DiscoveryMatcher:
+    """Return a matcher for the Qing and MiBeacon service data."""
+    return discovery.DiscoveryMatcher([UUID_QING, UUID_MIBEACON])
+
+
+def test_encrypted_frames_of_known_products(matcher) -> None:
+    """Test encrypted frames are only taken from the products decoded."""
+    address = "AA:BB:CC:DD:EE:01"
+    assert matcher.validate(_service_info(address, UUID_MIBEACON, ENCRYPTED)) == (
+        address
+    )
+    unknown = ENCRYPTED[:2] + bytes.fromhex("3412") + ENCRYPTED[4:]
+    assert (
+        matcher.validate(_service_info("AA:BB:CC:DD:EE:02", UUID_MIBEACON, unknown))
+        is None
+    )
+    # The name still confirms a device of any product.
+    assert (
+        matcher.validate(
+            _service_info("AA:BB:CC:DD:EE:03", UUID_MIBEACON, unknown, "Qing")
+        )
+        == "Qing"
+    )
+
+
+def test_payload_and_name_checks(matcher) -> None:
+    """Test candidates are confirmed by their payload or their name."""
+    qing = bytes.fromhex("012a0c096f105a")
+    assert matcher.validate(_service_info("AA:BB:CC:DD:EE:01", UUID_QING, qing))
+    assert (
+        matcher.validate(_service_info("AA:BB:CC:DD:EE:02", UUID_QING, b"\x02")) is None
+    )
+    assert (
+        matcher.validate(_service_info("AA:BB:CC:DD:EE:03", "0000180f", qing)) is None
+    )
+
+
+def test_found_addresses_capped(matcher, monkeypatch) -> None:
+    """Test the least recently validated addresses are forgotten."""
+    monkeypatch.setattr(discovery, "MAX_FOUND", 2)
+    first, second, third = (
+        _service_info(f"AA:BB:CC:DD:EE:0{index}", UUID_QING, b"", f"Qing {index}")
+        for index in (1, 2, 3)
+    )
+    matcher.validate(first)
+    matcher.validate(second)
+    matcher.validate(first)
+    matcher.validate(third)
+    assert list(matcher._found) == [first.address, third.address]
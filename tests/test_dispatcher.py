@@ -0,0 +1,69 @@
+"""Tests for the shared advertisement dispatcher."""
+
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+
+from qing_ble import dispatcher
+from qing_ble.parser import SERVICE_DATA_UUIDS
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+ADVERTISEMENT = dispatcher.BluetoothChange.ADVERTISEMENT
+
+
+@pytest.fixture
+def callbacks(monkeypatch: pytest.MonkeyPatch) -> list[list]:
+    """Return the [callback, registered] pairs given to the manager."""
+    registered: list[list] = []
+
+    def _async_register_callback(hass, callback, matcher, mode):
+        entry = [callback, True]
+        registered.append(entry)
+
+        def _unregister() -> None:
+            entry[1] = False
+
+        return _unregister
+
+    monkeypatch.setattr(dispatcher, "async_register_callback", _async_register_callback)
+    monkeypatch.setattr(
+        dispatcher, "async_last_service_info", lambda hass, address, connectable: None
+    )
+    return registered
+
+
+def test_dispatch_once_per_advertisement(callbacks) -> None:
+    """Test an advertisement matching several UUIDs reaches its device once."""
+    advertisements = dispatcher.AdvertisementDispatcher(None)
+    received = []
+    unregister = advertisements.async_register(
+        ADDRESS, lambda service_info, change: received.append(service_info)
+    )
+    assert len(callbacks) == len(SERVICE_DATA_UUIDS)
+
+    service_info = SimpleNamespace(address=ADDRESS)
+    for callback, _ in callbacks[:2]:
+        callback(service_info, ADVERTISEMENT)
+    callbacks[0][0](SimpleNamespace(address="11:22:33:44:55:66"), ADVERTISEMENT)
+    next_service_info = SimpleNamespace(address=ADDRESS)
+    callbacks[1][0](next_service_info, ADVERTISEMENT)
+
+    assert received == [service_info, next_service_info]
+    assert (advertisements.dispatched, advertisements.repeated) == (2, 1)
+    assert advertisements.unmatched == 1
+
+    unregister()
+    assert len(advertisements) == 0
+    assert not any(registered for _, registered in callbacks)
+
+
+def test_unregister_keeps_a_newer_handler(callbacks) -> None:
+    """Test a stale unregister does not remove the handler replacing it."""
+    advertisements = dispatcher.AdvertisementDispatcher(None)
+    unregister = advertisements.async_register(ADDRESS, lambda *args: None)
+    advertisements.async_register(ADDRESS, lambda *args: None)
+    unregister()
+    assert len(advertisements) == 1
+    assert all(registered for _, registered in callbacks)
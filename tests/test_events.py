@@ -0,0 +1,84 @@
+"""Tests for MiBeacon events and their rate limiting."""
+
+from __future__ import annotations
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+import pytest
+
+from qing_ble import events, parser
+from qing_ble.QingBluetoothDeviceData import QingBluetoothDeviceData
+
+
+def _mibeacon(counter: int, *objects: bytes) -> bytes:
+    """Return a plaintext frame with a MAC and the given frame counter."""
+    header = bytes.fromhex("5020aa01") + bytes([counter])
+    return header + bytes.fromhex("a1b2c3d4e5f6") + b"".join(objects)
+
+
+@pytest.mark.parametrize(
+    ("mibeacon_object", "expected"),
+    [
+        (bytes.fromhex("011003000000"), (("button", "press"),)),
+        (bytes.fromhex("011003000001"), (("button", "double_press"),)),
+        (bytes.fromhex("011003000003"), ()),
+        (bytes.fromhex("03000101"), (("motion", "motion_detected"),)),
+        (bytes.fromhex("0f0003640000"), (("motion", "motion_detected"),)),
+        (bytes.fromhex("0b000111"), (("lock", "locked"),)),
+        (bytes.fromhex("0b000109"), ()),
+        # Shorter than the object needs.
+        (bytes.fromhex("0f00026400"), ()),
+    ],
+)
+def test_decode_events(mibeacon_object, expected) -> None:
+    """Test the event objects of a frame."""
+    data = _mibeacon(1, mibeacon_object)
+    offset = parser.mibeacon_payload_offset(data)
+    assert parser.decode_mibeacon_events(data, offset) == expected
+
+
+def test_events_fired_once_per_frame_counter() -> None:
+    """Test a remote sending the same press several times fires it once."""
+    device_data = QingBluetoothDeviceData()
+
+    def _events(data: bytes, rssi: int) -> list[tuple[str, str]]:
+        update = device_data.update(
+            BluetoothServiceInfo(
+                name="Remote",
+                address="AA:BB:CC:DD:EE:FF",
+                rssi=rssi,
+                manufacturer_data={},
+                service_data={parser.UUID_MIBEACON: data},
+                service_uuids=[],
+                source="local",
+            )
+        )
+        return [
+            (event.device_key.key, event.event_type) for event in update.events.values()
+        ]
+
+    press = bytes.fromhex("011003000000")
+    assert _events(_mibeacon(7, press), -60) == [("button", "press")]
+    # The same frame heard with another RSSI bucket is not a new press.
+    assert _events(_mibeacon(7, press), -80) == []
+    assert _events(_mibeacon(8, press), -80) == [("button", "press")]
+
+
+def test_gate_coalesces_repeats() -> None:
+    """Test the same event within the window is one event."""
+    gate = events.EventGate()
+    assert gate.allow("motion", "motion_detected", 0.0)
+    assert not gate.allow("motion", "motion_detected", events.COALESCE_WINDOW / 2)
+    assert gate.allow("button", "press", events.COALESCE_WINDOW / 2)
+    assert gate.allow("motion", "motion_detected", events.COALESCE_WINDOW)
+    assert (gate.fired, gate.coalesced, gate.dropped) == (3, 1, 0)
+
+
+def test_gate_rate_limits_bursts() -> None:
+    """Test a burst beyond the bucket is dropped until tokens refill."""
+    gate = events.EventGate()
+    now = 100.0
+    allowed = [gate.allow("button", str(index), now) for index in range(15)]
+    assert allowed == [True] * events.EVENT_BURST + [False] * 5
+    assert gate.dropped == 5
+    assert gate.allow("button", "late", now + 1 / events.EVENT_RATE)
+    assert not gate.allow("button", "later", now + 1 / events.EVENT_RATE)
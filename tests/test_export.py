@@ -0,0 +1,90 @@
+"""Tests for the fleet history export."""
+
+from __future__ import annotations
+
+from array import array
+import json
+import math
+
+import pytest
+
+from homeassistant.core import Config
+from homeassistant.exceptions import HomeAssistantError
+
+from qing_ble import export, history, parser
+
+NOW = 1_760_000_000.0
+
+
+def _history(samples: int, battery_per_day: float):
+    ring = history.ReadingHistory()
+    readings = array("d", [math.nan]) * parser.FIELD_COUNT
+    for sample in range(samples):
+        now = NOW + sample * history.HISTORY_INTERVAL
+        readings[parser.TEMPERATURE] = 20 + sample % 5
+        readings[parser.BATTERY] = 100 - battery_per_day * (now - NOW) / 86400
+        ring.record(now, readings)
+    return ring.snapshot()
+
+
+def test_export(tmp_path) -> None:
+    """Test the table round trips and the summary of two devices."""
+    histories = {
+        "AA:BB:CC:DD:EE:02": _history(96, 2.0),
+        "AA:BB:CC:DD:EE:01": _history(1, 0.0),
+    }
+    summary = export.export_history(tmp_path, histories)
+
+    table = export.read_history_table(tmp_path)
+    assert table == export.history_table(histories)
+    assert table.addresses == sorted(histories)
+    # One row per device in every column, the second device follows the first.
+    times, values = histories["AA:BB:CC:DD:EE:02"]
+    row = slice(history.HISTORY_SIZE, 2 * history.HISTORY_SIZE)
+    assert table.times[row] == times
+    width = len(history.HISTORY_FIELDS)
+    for index, field in enumerate(history.HISTORY_FIELDS):
+        assert table.columns[field][row] == values[index::width]
+        assert (tmp_path / export.COLUMN_FILES[field]).stat().st_size == (
+            export.TABLE_HEADER.size + 2 * len(histories) * history.HISTORY_SIZE
+        )
+    assert json.loads((tmp_path / "summary.json").read_text()) == summary
+
+    device = summary["devices"]["AA:BB:CC:DD:EE:02"]
+    assert device["samples"] == 96
+    # Readings are kept in hundredths.
+    assert device["battery_drain_per_day"] == pytest.approx(2.0, abs=0.01)
+    assert device["temperature_percentiles"] == {"p5": 20.0, "p50": 22.0, "p95": 24.0}
+    single = summary["devices"]["AA:BB:CC:DD:EE:01"]
+    assert single["samples"] == 1
+    assert single["battery_drain_per_day"] is None
+    assert single["temperature_percentiles"] == {"p5": 20.0, "p50": 20.0, "p95": 20.0}
+    assert summary["temperature_percentiles"]["p50"] == 22.0
+
+
+def test_percentiles_match_numpy() -> None:
+    """Test the percentiles interpolate linearly between the closest ranks."""
+    # numpy.percentile([1, 2, 3, 4, 10], (5, 50, 95)) -> 1.2, 3.0, 8.8
+    assert export._percentiles([400, 100, 1000, 300, 200]) == {
+        "p5": 1.2,
+        "p50": 3.0,
+        "p95": 8.8,
+    }
+    assert export._percentiles([]) == {"p5": None, "p50": None, "p95": None}
+
+
+def test_export_directory(tmp_path) -> None:
+    """Test the folder is resolved in the configuration directory."""
+    config = Config(None, str(tmp_path / "config"))
+    assert export.export_directory(config, export.EXPORT_DIRECTORY) == (
+        tmp_path / "config" / export.EXPORT_DIRECTORY
+    )
+    with pytest.raises(HomeAssistantError):
+        export.export_directory(config, "../outside")
+    config.allowlist_external_dirs = {str(tmp_path)}
+    assert export.export_directory(config, str(tmp_path / "outside")) == (
+        tmp_path / "outside"
+    )
+    assert export.EXPORT_HISTORY_SCHEMA({}) == {
+        export.ATTR_DIRECTORY: export.EXPORT_DIRECTORY
+    }
@@ -0,0 +1,75 @@
+"""Tests for the GATT handle cache."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from qing_ble import gatt
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+
+
+class _Services:
+    """Discovered services holding the given characteristic handles."""
+
+    def __init__(self, **handles: int) -> None:
+        self._handles = {
+            gatt.BATTERY_LEVEL_UUID: handles.get("battery"),
+            gatt.FIRMWARE_REVISION_UUID: handles.get("firmware_revision"),
+        }
+
+    def get_characteristic(self, uuid: str) -> SimpleNamespace | None:
+        if (handle := self._handles[uuid]) is None:
+            return None
+        return SimpleNamespace(handle=handle)
+
+
+class _Client:
+    """Client answering reads by handle, recording them."""
+
+    def __init__(self, values: dict[int, bytes]) -> None:
+        self.values = values
+        self.reads: list[int] = []
+
+    async def read_gatt_char(self, handle: int) -> bytearray:
+        self.reads.append(handle)
+        return bytearray(self.values[handle])
+
+
+def test_discover_and_invalidate() -> None:
+    """Test handles are resolved once from the services and can be dropped."""
+    cache = gatt.GattHandleCache()
+    assert cache.get(ADDRESS) is None
+    services = _Services(battery=0x1B)
+    handles = cache.discover(ADDRESS, services)
+    assert (handles.battery, handles.firmware_revision) == (0x1B, None)
+    assert handles.services is services
+    assert cache.get(ADDRESS) is handles
+    cache.invalidate(ADDRESS)
+    assert cache.get(ADDRESS) is None
+
+
+def test_restore_keeps_discovered_handles() -> None:
+    """Test stored handles do not replace ones discovered in this run."""
+    cache = gatt.GattHandleCache()
+    discovered = cache.discover(ADDRESS, _Services(battery=0x1B))
+    cache.restore(ADDRESS, gatt.GattHandles(0x20, 0x21))
+    assert cache.get(ADDRESS) is discovered
+    restored = gatt.GattHandles(0x20, 0x21)
+    cache.restore("11:22:33:44:55:66", restored)
+    assert cache.get("11:22:33:44:55:66") is restored
+
+
+def test_read_handles() -> None:
+    """Test battery and firmware are read by handle, NULs stripped."""
+    client = _Client({0x1B: b"\x5a", 0x21: b"1.0.7\x00\x00"})
+    handles = gatt.GattHandles(0x1B, 0x21)
+    assert asyncio.run(gatt.async_read_handles(client, handles)) == (90, "1.0.7")
+    assert client.reads == [0x21, 0x1B]
+    # Missing characteristics are not read.
+    client.reads.clear()
+    assert asyncio.run(
+        gatt.async_read_handles(client, gatt.GattHandles(None, None))
+    ) == (None, None)
+    assert client.reads == []
@@ -0,0 +1,61 @@
+"""Tests for the reading history."""
+
+from __future__ import annotations
+
+from array import array
+import math
+
+from qing_ble import history, parser
+
+NOW = 1_760_000_000.0
+
+
+def _readings(temperature: float, humidity: float, battery: float):
+    readings = array("d", [math.nan]) * parser.FIELD_COUNT
+    readings[parser.TEMPERATURE] = temperature
+    readings[parser.HUMIDITY] = humidity
+    readings[parser.BATTERY] = battery
+    return readings
+
+
+def test_empty() -> None:
+    """Test a history without samples allocates nothing."""
+    ring = history.ReadingHistory()
+    assert ring.snapshot() is None
+    assert ring.times is None and ring.values is None
+
+
+def test_record() -> None:
+    """Test samples are stored in hundredths, at most once per interval."""
+    ring = history.ReadingHistory()
+    ring.record(NOW, _readings(21.37, 44.5, 87))
+    ring.record(NOW + 60, _readings(30.0, 50.0, 80))
+    ring.record(NOW + history.HISTORY_INTERVAL, _readings(-5.5, math.nan, 86))
+    times, values = ring.snapshot()
+    assert times.itemsize == 4 and values.itemsize == 2
+    assert len(times) == history.HISTORY_SIZE
+    assert list(times[-2:]) == [int(NOW), int(NOW + history.HISTORY_INTERVAL)]
+    assert times[0] == history.HISTORY_EMPTY
+    assert list(values[-6:]) == [2137, 4450, 8700, -550, history.HISTORY_MISSING, 8600]
+
+
+def test_wrap() -> None:
+    """Test the oldest samples are overwritten and come first."""
+    ring = history.ReadingHistory()
+    for sample in range(history.HISTORY_SIZE + 2):
+        ring.record(
+            NOW + sample * history.HISTORY_INTERVAL,
+            _readings(sample % 100, 0, 0),
+        )
+    times, values = ring.snapshot()
+    assert times[0] == int(NOW + 2 * history.HISTORY_INTERVAL)
+    assert values[0] == 200
+    assert values[-3] == (history.HISTORY_SIZE + 1) % 100 * 100
+
+
+def test_clamp() -> None:
+    """Test values out of the 16 bit range are clamped, not wrapped."""
+    ring = history.ReadingHistory()
+    ring.record(NOW, _readings(1000.0, -1000.0, 100))
+    _, values = ring.snapshot()
+    assert list(values[-3:]) == [2**15 - 1, -(2**15) + 1, 10000]
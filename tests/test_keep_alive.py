@@ -0,0 +1,154 @@
+"""Tests for keeping GATT connections open between polls."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import bleak_retry_connector
+import pytest
+
+from qing_ble import gatt, poll
+from qing_ble.QingBluetoothDeviceData import QingBluetoothDeviceData
+
+BLE_DEVICE = SimpleNamespace(address="AA:BB:CC:DD:EE:FF")
+
+
+class _Device:
+    """Pool member recording when it is told to disconnect."""
+
+    def __init__(self) -> None:
+        self.disconnects = 0
+
+    def schedule_disconnect(self) -> None:
+        self.disconnects += 1
+
+
+class _Client:
+    """Connected client recording its disconnection."""
+
+    address = BLE_DEVICE.address
+
+    def __init__(self) -> None:
+        self.is_connected = True
+
+    async def disconnect(self) -> None:
+        self.is_connected = False
+
+
+@pytest.fixture
+def connections(monkeypatch: pytest.MonkeyPatch) -> list[_Client]:
+    """Return the clients established, without any Bluetooth."""
+    clients: list[_Client] = []
+
+    async def _establish_connection(*args, **kwargs) -> _Client:
+        clients.append(_Client())
+        return clients[-1]
+
+    monkeypatch.setattr(
+        bleak_retry_connector, "establish_connection", _establish_connection
+    )
+    return clients
+
+
+def test_pool_closes_least_recently_used() -> None:
+    """Test a full pool closes the idle connection used longest ago."""
+    pool = gatt.KeepAlivePool(limit=2)
+    first, second, third = _Device(), _Device(), _Device()
+    assert pool.keep(first, "hci0")
+    assert pool.keep(second, "hci1")
+    assert pool.keep(first, "hci0")
+    assert pool.keep(third, "hci0")
+    assert (first.disconnects, second.disconnects) == (0, 1)
+    assert len(pool) == 2
+    assert pool.idle_on("hci0") == 2
+    assert pool.source(second) is None
+
+
+def test_pool_release_idle_on_source() -> None:
+    """Test releasing an idle connection on a source spares the others."""
+    pool = gatt.KeepAlivePool()
+    first, second = _Device(), _Device()
+    pool.keep(first, "hci0")
+    pool.keep(second, "hci1")
+    pool.release_idle("hci1")
+    assert (first.disconnects, second.disconnects) == (0, 1)
+    assert pool.idle_on("hci1") == 0
+
+
+def test_pool_disabled() -> None:
+    """Test a pool without room keeps nothing."""
+    assert not gatt.KeepAlivePool(limit=0).keep(_Device(), "hci0")
+
+
+def test_arbiter_counts_idle_connections() -> None:
+    """Test idle connections take slots, and are closed to make room."""
+
+    async def _run() -> None:
+        pool = gatt.KeepAlivePool()
+        arbiter = poll.PollArbiter(limit=2)
+        arbiter.idle_connections = pool.idle_on
+        arbiter.on_contention = pool.release_idle
+        idle = [_Device(), _Device()]
+        for device in idle:
+            pool.keep(device, "hci0")
+        assert arbiter.free_slots("hci0") == 0
+        async with arbiter.async_slot("hci0", 0):
+            assert [device.disconnects for device in idle] == [1, 0]
+        # A poll reusing its own idle connection does not close another.
+        async with arbiter.async_slot("hci0", 0, reuses_idle=True):
+            assert [device.disconnects for device in idle] == [1, 0]
+
+    asyncio.run(_run())
+
+
+def test_connection_kept_until_idle_timeout(connections) -> None:
+    """Test a kept connection is reused, then closed once idle too long."""
+
+    async def _run() -> None:
+        pool = gatt.KeepAlivePool()
+        data = QingBluetoothDeviceData(keep_alive=0.05, keep_alive_pool=pool)
+        async with data.async_connection(BLE_DEVICE, source="hci0") as client:
+            pass
+        assert client.is_connected
+        assert data.idle_source() == "hci0"
+        async with data.async_connection(BLE_DEVICE, source="hci0") as reused:
+            assert reused is client
+            assert len(pool) == 0
+        await asyncio.sleep(0.1)
+        assert not client.is_connected
+        assert len(pool) == 0
+        assert data.idle_source() is None
+        assert len(connections) == 1
+
+    asyncio.run(_run())
+
+
+def test_connection_through_other_source_is_not_reused(connections) -> None:
+    """Test a kept connection on another adapter is closed, not reused."""
+
+    async def _run() -> None:
+        data = QingBluetoothDeviceData(
+            keep_alive=60, keep_alive_pool=gatt.KeepAlivePool()
+        )
+        async with data.async_connection(BLE_DEVICE, source="hci0") as first:
+            pass
+        async with data.async_connection(BLE_DEVICE, source="hci1") as second:
+            assert second is not first
+            assert not first.is_connected
+        await data.async_disconnect()
+        assert not second.is_connected
+
+    asyncio.run(_run())
+
+
+def test_connection_without_keep_alive(connections) -> None:
+    """Test the connection is closed after the block by default."""
+
+    async def _run() -> None:
+        data = QingBluetoothDeviceData()
+        async with data.async_connection(BLE_DEVICE) as client:
+            assert client.is_connected
+        assert not client.is_connected
+
+    asyncio.run(_run())
@@ -0,0 +1,183 @@
+"""Tests for the service data parser."""
+
+from __future__ import annotations
+
+import pytest
+
+from qing_ble import parser
+
+QING_V1 = bytes.fromhex("012a0c096f105a")
+# Frame control 0x2050 (objects, MAC), temperature and humidity object.
+MIBEACON_TEMPERATURE_HUMIDITY = bytes.fromhex("5020aa01c5a1b2c3d4e5f60d1004d200b801")
+WEIGHT_SCALE = bytes.fromhex("22d43ae707010a0b0c0d")
+BODY_COMPOSITION = bytes.fromhex("0226e707010a0b0c0df401d43a")
+
+
+def _mibeacon(*objects: bytes, frame_control: bytes = b"\x50\x20") -> bytes:
+    """Return a frame with a MAC, the frame control as it is sent."""
+    header = frame_control + bytes.fromhex("aa01c5")
+    return header + bytes.fromhex("a1b2c3d4e5f6") + b"".join(objects)
+
+
+def test_qing() -> None:
+    """Test a Qing native frame."""
+    assert parser.parse_service_data(parser.UUID_QING, QING_V1) == (
+        (parser.TEMPERATURE, 23.16),
+        (parser.HUMIDITY, 42.07),
+        (parser.BATTERY, 90.0),
+    )
+
+
+def test_qing_unknown_version() -> None:
+    """Test a Qing frame of a version we do not know."""
+    assert parser.parse_service_data(parser.UUID_QING, b"\x02" + QING_V1[1:]) == ()
+
+
+def test_mibeacon_temperature_humidity() -> None:
+    """Test a plaintext MiBeacon temperature and humidity object."""
+    assert parser.parse_service_data(
+        parser.UUID_MIBEACON, MIBEACON_TEMPERATURE_HUMIDITY
+    ) == ((parser.TEMPERATURE, 21.0), (parser.HUMIDITY, 44.0))
+
+
+@pytest.mark.parametrize(
+    ("mibeacon_object", "field", "value"),
+    [
+        (bytes.fromhex("041002ff00"), "TEMPERATURE", 25.5),
+        (bytes.fromhex("041002f6ff"), "TEMPERATURE", -1.0),
+        (bytes.fromhex("061002c201"), "HUMIDITY", 45.0),
+        (bytes.fromhex("0a100163"), "BATTERY", 99.0),
+        (bytes.fromhex("07100310270f"), "ILLUMINANCE", 993040.0),
+    ],
+)
+def test_mibeacon_objects(mibeacon_object, field, value) -> None:
+    """Test the MiBeacon objects with readings."""
+    assert parser.parse_service_data(
+        parser.UUID_MIBEACON, _mibeacon(mibeacon_object)
+    ) == ((getattr(parser, field), value),)
+
+
+def test_mibeacon_several_objects() -> None:
+    """Test a frame with an unknown object between two known ones."""
+    data = _mibeacon(
+        bytes.fromhex("0a100150"),
+        bytes.fromhex("99990201ff"),
+        bytes.fromhex("061002c201"),
+    )
+    assert parser.parse_service_data(parser.UUID_MIBEACON, data) == (
+        (parser.BATTERY, 80.0),
+        (parser.HUMIDITY, 45.0),
+    )
+
+
+def test_mibeacon_truncated_object() -> None:
+    """Test an object whose length runs past the end of the frame."""
+    data = _mibeacon(bytes.fromhex("0a100150"), bytes.fromhex("0d1004d200"))
+    assert parser.parse_service_data(parser.UUID_MIBEACON, data) == (
+        (parser.BATTERY, 80.0),
+    )
+
+
+def test_mibeacon_capability() -> None:
+    """Test the object offset of a frame with a capability byte."""
+    data = _mibeacon(b"\x08", bytes.fromhex("0a100150"), frame_control=b"\x70\x20")
+    assert parser.mibeacon_payload_offset(data) == 12
+    assert parser.parse_service_data(parser.UUID_MIBEACON, data) == (
+        (parser.BATTERY, 80.0),
+    )
+
+
+def test_mibeacon_encrypted_is_not_decoded() -> None:
+    """Test the plaintext decoder skips encrypted frames."""
+    data = _mibeacon(bytes.fromhex("0a100150"), frame_control=b"\x58\x58")
+    assert parser.mibeacon_encryption(data) is parser.EncryptionScheme.MIBEACON_4_5
+    assert parser.parse_service_data(parser.UUID_MIBEACON, data) == ()
+
+
+@pytest.mark.parametrize(
+    ("frame_control", "scheme"),
+    [
+        (b"\x50\x20", "NONE"),
+        (b"\x58\x30", "MIBEACON_LEGACY"),
+        (b"\x58\x40", "MIBEACON_4_5"),
+        (b"\x58\x58", "MIBEACON_4_5"),
+    ],
+)
+def test_mibeacon_encryption(frame_control, scheme) -> None:
+    """Test the encryption scheme is told from the frame version."""
+    data = _mibeacon(frame_control=frame_control)
+    assert parser.mibeacon_encryption(data) is parser.EncryptionScheme[scheme]
+
+
+def test_mibeacon_events() -> None:
+    """Test the events of a frame, readings are not events."""
+    data = _mibeacon(bytes.fromhex("0a100150"), bytes.fromhex("011003000002"))
+    offset = parser.mibeacon_payload_offset(data)
+    assert parser.decode_mibeacon_events(data, offset) == (("button", "long_press"),)
+    assert parser.decode_mibeacon_objects(data, offset) == ((parser.BATTERY, 80.0),)
+
+
+def test_weight_scale() -> None:
+    """Test a stabilized Mi Scale v1 frame."""
+    assert parser.parse_service_data(parser.UUID_WEIGHT_SCALE, WEIGHT_SCALE) == (
+        (parser.MASS_NON_STABILIZED, 75.3),
+        (parser.MASS, 75.3),
+    )
+
+
+def test_weight_scale_pounds() -> None:
+    """Test a Mi Scale v1 frame in pounds that is not stabilized."""
+    readings = parser.parse_service_data(
+        parser.UUID_WEIGHT_SCALE, b"\x03" + WEIGHT_SCALE[1:]
+    )
+    assert readings == (
+        (parser.MASS_NON_STABILIZED, pytest.approx(150.6 * parser.POUND_TO_KILOGRAM)),
+    )
+
+
+def test_body_composition() -> None:
+    """Test a stabilized Mi Scale v2 frame with impedance."""
+    assert parser.parse_service_data(
+        parser.UUID_BODY_COMPOSITION, BODY_COMPOSITION
+    ) == (
+        (parser.MASS_NON_STABILIZED, 75.3),
+        (parser.MASS, 75.3),
+        (parser.IMPEDANCE, 500.0),
+    )
+
+
+@pytest.mark.parametrize(
+    ("control", "fields"),
+    [
+        # Stabilized, with impedance.
+        (0x22, ("MASS_NON_STABILIZED", "MASS", "IMPEDANCE")),
+        # Stabilized, without impedance.
+        (0x20, ("MASS_NON_STABILIZED", "MASS")),
+        # Stabilized with impedance, but the person stepped off.
+        (0xA6, ("MASS_NON_STABILIZED",)),
+        # Not stabilized yet.
+        (0x04, ("MASS_NON_STABILIZED",)),
+    ],
+)
+def test_body_composition_control(control, fields) -> None:
+    """Test the stabilized, impedance and removed bits of the control byte."""
+    data = BODY_COMPOSITION[:1] + bytes([control]) + BODY_COMPOSITION[2:]
+    values = {"MASS_NON_STABILIZED": 75.3, "MASS": 75.3, "IMPEDANCE": 500.0}
+    assert parser.parse_service_data(parser.UUID_BODY_COMPOSITION, data) == tuple(
+        (getattr(parser, field), values[field]) for field in fields
+    )
+
+
+@pytest.mark.parametrize(
+    "uuid", ["UUID_WEIGHT_SCALE", "UUID_BODY_COMPOSITION", "UUID_QING"]
+)
+def test_short_payload(uuid) -> None:
+    """Test payloads too short for their decoder."""
+    assert parser.parse_service_data(getattr(parser, uuid), b"\x01\x02") == ()
+
+
+def test_unknown_uuid() -> None:
+    """Test service data of a UUID without a decoder."""
+    assert (
+        parser.parse_service_data("0000ffff-0000-1000-8000-00805f9b34fb", QING_V1) == ()
+    )
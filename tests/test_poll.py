@@ -0,0 +1,129 @@
+"""Tests for the poll scheduling and the connection slot arbitration."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from qing_ble import poll
+
+INTERVAL = 3600.0
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Return a settable monotonic clock, jitter being its maximum."""
+    now = [1000.0]
+    monkeypatch.setattr(poll, "monotonic", lambda: now[0])
+    monkeypatch.setattr(poll.random, "uniform", lambda low, high: high)
+    return now
+
+
+def test_startup_spread(clock) -> None:
+    """Test the first poll waits for the spread, capped by the interval."""
+    assert poll.PollScheduler(INTERVAL).next_poll == 1000.0 + poll.STARTUP_SPREAD
+    assert poll.PollScheduler(60.0).next_poll == 1060.0
+
+
+def test_poll_needed_reserves(clock) -> None:
+    """Test a due poll is reserved until it reports back or times out."""
+    scheduler = poll.PollScheduler(INTERVAL, start_spread=0)
+    assert scheduler.poll_needed()
+    assert not scheduler.poll_needed()
+    clock[0] += poll.POLL_TIMEOUT
+    assert scheduler.poll_needed()
+
+
+def test_success_schedules_interval_and_jitter(clock) -> None:
+    """Test the next poll after a success is an interval plus jitter away."""
+    scheduler = poll.PollScheduler(INTERVAL, start_spread=0)
+    assert scheduler.poll_needed()
+    scheduler.poll_succeeded()
+    assert scheduler.next_poll == 1000.0 + INTERVAL * (1 + poll.JITTER_FRACTION)
+
+
+def test_failures_back_off(clock) -> None:
+    """Test failed polls double the retry delay up to the interval."""
+    scheduler = poll.PollScheduler(INTERVAL, start_spread=0)
+    jitter = INTERVAL * poll.JITTER_FRACTION
+    delays = []
+    for _ in range(8):
+        scheduler.poll_failed()
+        delays.append(scheduler.next_poll - clock[0] - jitter)
+    assert delays == [60.0, 120.0, 240.0, 480.0, 960.0, 1920.0, INTERVAL, INTERVAL]
+    scheduler.poll_succeeded()
+    assert scheduler.failures == 0
+
+
+def test_delay_only_postpones(clock) -> None:
+    """Test delay never brings the next poll forward."""
+    scheduler = poll.PollScheduler(INTERVAL, start_spread=0)
+    scheduler.delay(30)
+    assert scheduler.next_poll == 1030.0
+    scheduler.delay(10)
+    assert scheduler.next_poll == 1030.0
+
+
+async def _hold(
+    arbiter: poll.PollArbiter,
+    adapter: str,
+    urgency: float,
+    release: asyncio.Event,
+    order: list[float],
+) -> None:
+    async with arbiter.async_slot(adapter, urgency):
+        order.append(urgency)
+        await release.wait()
+
+
+def test_arbiter_limits_slots_per_adapter() -> None:
+    """Test each adapter has its own slots, waiters most urgent first."""
+
+    async def _run() -> None:
+        arbiter = poll.PollArbiter(limit=1)
+        order: list[float] = []
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(_hold(arbiter, "hci0", 0, release, order)),
+            asyncio.create_task(_hold(arbiter, "hci1", 0, release, order)),
+        ]
+        await asyncio.sleep(0)
+        tasks += [
+            asyncio.create_task(_hold(arbiter, "hci0", urgency, release, order))
+            for urgency in (10, 30, 20)
+        ]
+        await asyncio.sleep(0)
+        assert order == [0, 0]
+        assert arbiter.queue_depth("hci0") == 3
+        assert arbiter.free_slots("hci0") == -3
+        assert arbiter.free_slots("hci1") == 0
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order == [0, 0, 30, 20, 10]
+        assert arbiter.free_slots("hci0") == 1
+        assert arbiter.waited == 3
+
+    asyncio.run(_run())
+
+
+def test_arbiter_cancelled_waiter() -> None:
+    """Test a cancelled waiter gives up its place without leaking a slot."""
+
+    async def _run() -> None:
+        arbiter = poll.PollArbiter(limit=1)
+        order: list[float] = []
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(arbiter, "hci0", 0, release, order))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(arbiter, "hci0", 5, release, order))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await holder
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert order == [0]
+        assert arbiter.free_slots("hci0") == 1
+
+    asyncio.run(_run())
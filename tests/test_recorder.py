@@ -0,0 +1,95 @@
+"""Tests for the advertisement recorder."""
+
+from __future__ import annotations
+
+from home_assistant_bluetooth import BluetoothServiceInfo
+
+from qing_ble import recorder
+from qing_ble.parser import UUID_QING, UUID_WEIGHT_SCALE
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+SEGMENT_SIZE = 256
+SEGMENTS = 3
+
+
+def _service_info(payload: bytes, address: str = ADDRESS, rssi: int = -70):
+    return BluetoothServiceInfo(
+        name="Qing",
+        address=address,
+        rssi=rssi,
+        manufacturer_data={},
+        service_data={
+            UUID_QING: payload,
+            # Not a 16 bit UUID, so not recorded.
+            "12345678-1234-5678-1234-567812345678": b"\x00",
+        },
+        service_uuids=[],
+        source="local",
+    )
+
+
+def _recorder(path):
+    advertisements = recorder.AdvertisementRecorder(path, SEGMENT_SIZE, SEGMENTS)
+    advertisements.start()
+    return advertisements
+
+
+def test_round_trip(tmp_path) -> None:
+    """Test recorded service data reads back as it was recorded."""
+    path = tmp_path / "ring.bin"
+    advertisements = _recorder(path)
+    advertisements.record(_service_info(b"\x01\x02"), 1.5)
+    advertisements.record(_service_info(b"\x03", rssi=-200), 2.5)
+    advertisements.record(_service_info(b"\x04", address="not-a-mac"), 3.5)
+    advertisements.stop()
+    assert (advertisements.recorded, advertisements.dropped) == (2, 1)
+    assert list(recorder.iter_records(path, SEGMENT_SIZE)) == [
+        recorder.Record(1.5, ADDRESS, -70, UUID_QING, b"\x01\x02"),
+        recorder.Record(2.5, ADDRESS, -128, UUID_QING, b"\x03"),
+    ]
+
+
+def test_wraps_and_resumes(tmp_path) -> None:
+    """Test the ring keeps the newest records, also across restarts."""
+    path = tmp_path / "ring.bin"
+    advertisements = _recorder(path)
+    for index in range(30):
+        advertisements.record(_service_info(bytes([index])), float(index))
+    advertisements.stop()
+    advertisements = _recorder(path)
+    for index in range(30, 40):
+        advertisements.record(_service_info(bytes([index])), float(index))
+    advertisements.stop()
+
+    records = list(recorder.iter_records(path, SEGMENT_SIZE))
+    timestamps = [record.timestamp for record in records]
+    # Oldest first, without gaps, ending with the last record.
+    assert timestamps == [float(index) for index in range(40 - len(records), 40)]
+    assert 0 < len(records) < 40
+    assert all(record.data == bytes([int(record.timestamp)]) for record in records)
+
+
+def test_geometry_change_starts_over(tmp_path) -> None:
+    """Test a ring recorded with another segment size is not misread."""
+    path = tmp_path / "ring.bin"
+    advertisements = _recorder(path)
+    advertisements.record(_service_info(b"\x01"), 1.0)
+    advertisements.stop()
+    advertisements = recorder.AdvertisementRecorder(path, SEGMENT_SIZE * 2, SEGMENTS)
+    advertisements.start()
+    advertisements.record(
+        BluetoothServiceInfo(
+            name="Scale",
+            address=ADDRESS,
+            rssi=-60,
+            manufacturer_data={},
+            service_data={UUID_WEIGHT_SCALE: b"\x02"},
+            service_uuids=[],
+            source="local",
+        ),
+        2.0,
+    )
+    advertisements.stop()
+    assert list(recorder.iter_records(path, SEGMENT_SIZE * 2)) == [
+        recorder.Record(2.0, ADDRESS, -60, UUID_WEIGHT_SCALE, b"\x02"),
+    ]
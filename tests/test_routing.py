@@ -0,0 +1,72 @@
+"""Tests for routing polls over the sources that hear a device."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from qing_ble import routing
+
+
+def test_rssi_smoothing_and_staleness() -> None:
+    """Test samples are smoothed, and a quiet source stops counting."""
+    signal = routing.SignalHistory()
+    signal.record("hci0", -80, 0)
+    signal.record("hci0", -60, 1)
+    assert signal.rssi("hci0", 1) == -80 + routing.RSSI_SMOOTHING * 20
+    assert signal.rssi("hci0", 1 + routing.SOURCE_STALE + 1) is None
+    assert signal.rssi("proxy", 1) is None
+
+
+def test_rank_free_slots_then_signal() -> None:
+    """Test sources with a free slot go first, then the stronger signal."""
+    signal = routing.SignalHistory()
+    signal.record("hci0", -50, 0)
+    signal.record("hci1", -70, 0)
+    signal.record("proxy", -60, 0)
+    candidates = [("hci1", 1), ("hci0", 0), ("proxy", 2), ("unheard", 3)]
+    free = {"hci0": 0, "hci1": 1, "proxy": 2, "unheard": 1}
+    ranked = signal.rank(candidates, free.__getitem__, 1)
+    assert [source for source, _ in ranked] == ["proxy", "hci1", "unheard", "hci0"]
+
+
+def test_failover_to_the_next_source() -> None:
+    """Test a failed poll is retried through the next source."""
+    tried: list[str] = []
+    failovers: list[str] = []
+
+    async def _poll_through(source: str, device: int) -> str:
+        tried.append(source)
+        if source == "hci0":
+            raise TimeoutError
+        return f"polled {device}"
+
+    result = asyncio.run(
+        routing.async_poll_with_failover(
+            [("hci0", 0), ("hci1", 1), ("proxy", 2)],
+            _poll_through,
+            lambda source, err: failovers.append(source),
+        )
+    )
+    assert result == "polled 1"
+    assert tried == ["hci0", "hci1"]
+    assert failovers == ["hci0"]
+
+
+def test_failover_raises_the_last_error() -> None:
+    """Test the error of the last source is raised when every one fails."""
+    failovers: list[str] = []
+
+    async def _poll_through(source: str, device: int) -> str:
+        raise TimeoutError(source)
+
+    with pytest.raises(TimeoutError, match="hci1"):
+        asyncio.run(
+            routing.async_poll_with_failover(
+                [("hci0", 0), ("hci1", 1)],
+                _poll_through,
+                lambda source, err: failovers.append(source),
+            )
+        )
+    assert failovers == ["hci0"]
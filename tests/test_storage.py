@@ -0,0 +1,107 @@
+"""Tests for the persistent device state."""
+
+from __future__ import annotations
+
+import asyncio
+from time import monotonic
+
+import pytest
+
+from qing_ble import storage
+from qing_ble.gatt import GattHandleCache, GattHandles
+from qing_ble.parser import BATTERY, TEMPERATURE
+from qing_ble.QingBluetoothDeviceData import QingBluetoothDeviceData
+
+ADDRESS = "AA:BB:CC:DD:EE:FF"
+INTERVAL = 3600.0
+
+
+class _Store:
+    """In memory Store, recording the scheduled saves."""
+
+    data: dict | None = None
+
+    def __init__(self, hass, version, key) -> None:
+        self.saves: list = []
+
+    async def async_load(self) -> dict | None:
+        return self.data
+
+    def async_delay_save(self, data_func, delay) -> None:
+        self.saves.append(data_func)
+
+
+@pytest.fixture(autouse=True)
+def _memory_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(storage, "Store", _Store)
+
+
+def _device_data() -> QingBluetoothDeviceData:
+    return QingBluetoothDeviceData(poll_interval=INTERVAL, gatt_cache=GattHandleCache())
+
+
+def test_round_trip() -> None:
+    """Test a saved device is restored with readings, poll times and handles."""
+    device_store = storage.DeviceStore(None)
+    asyncio.run(device_store.async_load())
+    device_data = _device_data()
+    device_data.state.readings[TEMPERATURE] = 21.5
+    device_data.state.readings[BATTERY] = 90.0
+    device_data.state.last_poll = device_data.state.last_poll_success = (
+        monotonic() - 600
+    )
+    handles = GattHandles(0x1B, 0x21)
+    handles.firmware = "1.0.7"
+    device_data.gatt_cache.restore(ADDRESS, handles)
+    device_store.async_register(ADDRESS, device_data)
+    device_store.async_schedule_save()
+    device_store.async_schedule_save()
+    assert len(device_store._store.saves) == 1
+    saved = device_store._store.saves[0]()
+
+    _Store.data = saved
+    try:
+        restored_store = storage.DeviceStore(None)
+        asyncio.run(restored_store.async_load())
+    finally:
+        _Store.data = None
+    restored = _device_data()
+    update = restored_store.async_restore(ADDRESS, restored)
+
+    assert restored.state.reading(TEMPERATURE) == 21.5
+    assert restored.state.reading(BATTERY) == 90.0
+    assert update.entity_values
+    assert restored.state.last_poll_success == pytest.approx(
+        device_data.state.last_poll_success, abs=1
+    )
+    # The next poll waits for the interval since the last success.
+    assert restored.poll_scheduler.next_poll >= monotonic() + INTERVAL - 600 - 1
+    restored_handles = restored.gatt_cache.get(ADDRESS)
+    assert (restored_handles.battery, restored_handles.firmware_revision) == (
+        0x1B,
+        0x21,
+    )
+    assert restored_handles.firmware == "1.0.7"
+    assert restored_handles.services is None
+
+
+def test_unknown_device() -> None:
+    """Test a device that was never saved restores nothing."""
+    device_store = storage.DeviceStore(None)
+    asyncio.run(device_store.async_load())
+    assert device_store.async_restore(ADDRESS, _device_data()) is None
+
+
+def test_unregistered_device_is_kept() -> None:
+    """Test an unloaded device keeps its data, a removed one does not."""
+    device_store = storage.DeviceStore(None)
+    asyncio.run(device_store.async_load())
+    device_data = _device_data()
+    device_data.state.readings[TEMPERATURE] = 19.0
+    unregister = device_store.async_register(ADDRESS, device_data)
+    unregister()
+    saved = device_store._store.saves[-1]()
+    assert saved[ADDRESS]["readings"][TEMPERATURE] == 19.0
+    assert saved[ADDRESS]["handles"] is None
+    device_store.async_remove(ADDRESS)
+    assert device_store._store.saves[-1]() == {}
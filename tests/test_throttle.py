@@ -0,0 +1,72 @@
+"""Tests for the state write throttle."""
+
+from __future__ import annotations
+
+from homeassistant.components.bluetooth.passive_update_processor import (
+    PassiveBluetoothEntityKey,
+)
+
+from qing_ble import throttle
+from qing_ble.const import CONF_MIN_INTERVAL, CONF_TEMPERATURE_DEADBAND
+
+TEMPERATURE = PassiveBluetoothEntityKey("temperature", None)
+MASS = PassiveBluetoothEntityKey("mass", None)
+POLICY = throttle.WritePolicy(deadband=0.5, min_interval=30, max_age=600)
+
+
+def _filter(write_throttle, values, now):
+    entity_data = dict(values)
+    write_throttle.filter(entity_data, now)
+    return entity_data
+
+
+def test_write_policies_from_options() -> None:
+    """Test the options override the defaults, scale readings have none."""
+    policies = throttle.write_policies(
+        {CONF_TEMPERATURE_DEADBAND: 0.3, CONF_MIN_INTERVAL: 10}
+    )
+    assert policies["temperature"] == (0.3, 10, throttle.DEFAULT_MAX_AGE)
+    assert policies["humidity"].deadband == throttle.DEFAULT_DEADBAND["humidity"]
+    assert "mass" not in policies
+
+
+def test_deadband_and_min_interval() -> None:
+    """Test large changes wait for the interval, small ones for the max age."""
+    write_throttle = throttle.WriteThrottle({"temperature": POLICY})
+    assert _filter(write_throttle, {TEMPERATURE: 20.0, MASS: 70.0}, 0) == {
+        TEMPERATURE: 20.0,
+        MASS: 70.0,
+    }
+    # Unthrottled entities and unchanged values always pass.
+    assert _filter(write_throttle, {TEMPERATURE: 20.0, MASS: 71.0}, 1) == {
+        TEMPERATURE: 20.0,
+        MASS: 71.0,
+    }
+    assert _filter(write_throttle, {TEMPERATURE: 21.0}, 10) == {}
+    assert write_throttle.next_due == 30
+    assert _filter(write_throttle, {TEMPERATURE: 21.0}, 30) == {TEMPERATURE: 21.0}
+    assert _filter(write_throttle, {TEMPERATURE: 21.1}, 100) == {}
+    assert write_throttle.next_due == 630
+    assert _filter(write_throttle, {TEMPERATURE: 21.2}, 630) == {TEMPERATURE: 21.2}
+    assert write_throttle.suppressed == 2
+
+
+def test_flush_held_back_values() -> None:
+    """Test held back values are flushed once due, and only once."""
+    write_throttle = throttle.WriteThrottle({"temperature": POLICY})
+    _filter(write_throttle, {TEMPERATURE: 20.0}, 0)
+    assert _filter(write_throttle, {TEMPERATURE: 22.0}, 5) == {}
+    assert write_throttle.flush(29) == {}
+    assert write_throttle.next_due == 30
+    assert write_throttle.flush(30) == {TEMPERATURE: 22.0}
+    assert write_throttle.next_due == float("inf")
+    assert write_throttle.flush(40) == {}
+
+
+def test_value_back_to_written_drops_held() -> None:
+    """Test a held back value is forgotten when the written one comes back."""
+    write_throttle = throttle.WriteThrottle({"temperature": POLICY})
+    _filter(write_throttle, {TEMPERATURE: 20.0}, 0)
+    _filter(write_throttle, {TEMPERATURE: 22.0}, 5)
+    assert _filter(write_throttle, {TEMPERATURE: 20.0}, 6) == {TEMPERATURE: 20.0}
+    assert write_throttle.flush(30) == {}
@@ -0,0 +1,182 @@
+"""State write throttling for noisy Qing BLE sensors."""
+
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import Any, NamedTuple
+
+from homeassistant.components.bluetooth.passive_update_processor import (
+    PassiveBluetoothEntityKey,
+)
+
+from .const import (
+    CONF_HUMIDITY_DEADBAND,
+    CONF_MAX_AGE,
+    CONF_MIN_INTERVAL,
+    CONF_SIGNAL_STRENGTH_DEADBAND,
+    CONF_TEMPERATURE_DEADBAND,
+)
+
+
+class WritePolicy(NamedTuple):
+    """When a new value of a sensor is worth a state write.
+
+    A value is written once it differs from the last written one by at
+    least ``deadband``, but no sooner than ``min_interval`` seconds after
+    the last write. Smaller changes are still written once the last write
+    is ``max_age`` seconds old.
+    """
+
+    deadband: float
+    min_interval: float
+    max_age: float
+
+
+DEFAULT_DEADBAND = {
+    "temperature": 0.1,
+    "humidity": 0.5,
+    "signal_strength": 3.0,
+    "battery": 1.0,
+}
+DEFAULT_MIN_INTERVAL = 30.0
+DEFAULT_MAX_AGE = 15 * 60.0
+
+
+def write_policies(options: Mapping[str, Any]) -> dict[str, WritePolicy]:
+    """Return policies by sensor key from the entry options.
+
+    Sensors without a policy, like the scale readings, are never throttled.
+    """
+    deadband = {
+        **DEFAULT_DEADBAND,
+        "temperature": options.get(
+            CONF_TEMPERATURE_DEADBAND, DEFAULT_DEADBAND["temperature"]
+        ),
+        "humidity": options.get(CONF_HUMIDITY_DEADBAND, DEFAULT_DEADBAND["humidity"]),
+        "signal_strength": options.get(
+            CONF_SIGNAL_STRENGTH_DEADBAND, DEFAULT_DEADBAND["signal_strength"]
+        ),
+    }
+    min_interval = options.get(CONF_MIN_INTERVAL, DEFAULT_MIN_INTERVAL)
+    max_age = options.get(CONF_MAX_AGE, DEFAULT_MAX_AGE)
+    return {
+        key: WritePolicy(value, min_interval, max_age)
+        for key, value in deadband.items()
+    }
+
+
+class _Entity:
+    """Write state of one throttled entity."""
+
+    __slots__ = ("policy", "value", "written", "pending")
+
+    def __init__(self, policy: WritePolicy) -> None:
+        self.policy = policy
+        self.value: float | None = None
+        self.written = 0.0
+        # Deadline of the value held back from the last update, or None.
+        self.pending: float | None = None
+
+
+class WriteThrottle:
+    """Hold back entity values according to their write policies.
+
+    Values held back are remembered, so that a later repeat of the same
+    advertisement, which the device data deduplicates, can still flush
+    them once they are due.
+    """
+
+    __slots__ = ("_policies", "_entities", "_pending", "next_due", "suppressed")
+
+    def __init__(self, policies: Mapping[str, WritePolicy]) -> None:
+        """Initialize the throttle."""
+        self._policies = policies
+        # None for entities without a policy.
+        self._entities: dict[PassiveBluetoothEntityKey, _Entity | None] = {}
+        self._pending: dict[PassiveBluetoothEntityKey, Any] = {}
+        # Monotonic time the earliest held back value becomes due.
+        self.next_due = float("inf")
+        self.suppressed = 0
+
+    def _entity(self, entity_key: PassiveBluetoothEntityKey) -> _Entity | None:
+        if (policy := self._policies.get(entity_key.key)) is None:
+            entity = None
+        else:
+            entity = _Entity(policy)
+        self._entities[entity_key] = entity
+        return entity
+
+    def _due(self, entity: _Entity, value: Any) -> float:
+        """Return when value can be written, the written value being known."""
+        policy = entity.policy
+        if abs(value - entity.value) >= policy.deadband:
+            return entity.written + policy.min_interval
+        return entity.written + max(policy.min_interval, policy.max_age)
+
+    def filter(
+        self, entity_data: dict[PassiveBluetoothEntityKey, Any], now: float
+    ) -> None:
+        """Drop the values that should not be written yet from entity_data."""
+        entities = self._entities
+        held: list[PassiveBluetoothEntityKey] | None = None
+        for entity_key, value in entity_data.items():
+            if (entity := entities.get(entity_key, False)) is False:
+                entity = self._entity(entity_key)
+            if entity is None:
+                continue
+            if (
+                entity.value is None
+                or not isinstance(value, (int, float))
+                or value == entity.value
+            ):
+                # First value, not a number, or nothing new to hold back.
+                self._written(entity_key, entity, value, now)
+                continue
+            due = self._due(entity, value)
+            if due <= now:
+                self._written(entity_key, entity, value, now)
+                continue
+            entity.pending = due
+            self._pending[entity_key] = value
+            if due < self.next_due:
+                self.next_due = due
+            if held is None:
+                held = []
+            held.append(entity_key)
+        if held:
+            self.suppressed += len(held)
+            for entity_key in held:
+                del entity_data[entity_key]
+        elif not self._pending:
+            # The values held back were written or went back to the last one.
+            self.next_due = float("inf")
+
+    def _written(
+        self,
+        entity_key: PassiveBluetoothEntityKey,
+        entity: _Entity,
+        value: Any,
+        now: float,
+    ) -> None:
+        if value != entity.value:
+            entity.written = now
+        entity.value = value
+        if entity.pending is not None:
+            entity.pending = None
+            del self._pending[entity_key]
+
+    def flush(self, now: float) -> dict[PassiveBluetoothEntityKey, Any]:
+        """Return the held back values that are due, forgetting them."""
+        entity_data = {}
+        next_due = float("inf")
+        entities = self._entities
+        for entity_key, value in list(self._pending.items()):
+            entity = entities[entity_key]
+            assert entity is not None and entity.pending is not None
+            if entity.pending <= now:
+                self._written(entity_key, entity, value, now)
+                entity_data[entity_key] = value
+            elif entity.pending < next_due:
+                next_due = entity.pending
+        self.next_due = next_due
+        return entity_data